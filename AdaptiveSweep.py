@@ -0,0 +1,245 @@
+"""
+Adaptive sampling of loops, points are placed where the measured signal changes the most.
+
+The loop is started on a coarse uniform grid between the first and the last setpoint. After that every new point is put
+in the middle of the interval with the largest loss, where the loss of an interval is its length in the (setpoint,
+measured value) plane, both axes scaled to their ranges, increased by the curvature of the signal at its ends. Flat
+regions end up with few points, steps and peaks with many. The number of points (the point budget) is the number of
+steps of the loop, so the data set has the same shape as for a uniform sweep.
+
+For loops with an inner loop (2D), the outer setpoints are chosen adaptively and every one of them is a whole line of
+the inner loop (swept uniformly), lines that differ the most from their neighbours get more lines in between.
+
+Points are kept sorted by setpoint in the data set while the loop is running, so live plots and saved files look like
+a uniform sweep with uneven spacing (rows that are not measured yet stay empty at the end).
+"""
+
+import time
+
+import numpy as np
+
+from Cancellation import sleep
+
+
+# part of the point budget used for the initial uniform grid
+INITIAL_FRACTION = 0.2
+
+# how much curvature of the signal increases the loss of an interval (0 means only the gradient is used)
+CURVATURE_WEIGHT = 1.0
+
+
+class AdaptiveSampler:
+    """
+    Picks setpoints one at a time (ask) and learns the measured values at them (tell)
+    """
+    def __init__(self, lower, upper, budget, initial=None):
+        """
+        Constructor of the AdaptiveSampler class
+
+        :param lower: first setpoint of the sweep
+        :param upper: last setpoint of the sweep
+        :param budget: total number of points that can be measured
+        :param initial: number of points of the initial uniform grid, INITIAL_FRACTION of the budget if not specified
+        """
+        self.lower = float(lower)
+        self.upper = float(upper)
+        self.budget = int(budget)
+        if initial is None:
+            initial = max(3, int(self.budget * INITIAL_FRACTION))
+        initial = max(1, min(self.budget, initial))
+        # setpoints that have to be measured before any refinement is done
+        self.pending = list(np.linspace(self.lower, self.upper, initial))
+        # setpoint : measured value (number for 1D sweeps, array of the line for 2D)
+        self.points = {}
+        # intervals are not split below this width, so that a step in the signal does not use up the whole budget
+        self.min_spacing = abs(self.upper - self.lower) / max(1, self.budget) ** 2
+
+    def done(self):
+        """
+        :return: True if the whole point budget has been used
+        """
+        return len(self.points) >= self.budget
+
+    def ask(self):
+        """
+        :return: setpoint that should be measured next, None if there is nothing left to measure
+        """
+        while self.pending:
+            x = self.pending.pop(0)
+            if x not in self.points:
+                return x
+        if self.done() or len(self.points) < 2:
+            return None
+        xs = np.array(sorted(self.points))
+        losses = self.losses(xs)
+        losses[np.diff(xs) <= self.min_spacing] = -1
+        best = int(np.argmax(losses))
+        if losses[best] < 0:
+            return None
+        return (xs[best] + xs[best + 1]) / 2
+
+    def tell(self, x, value):
+        """
+        :param x: setpoint that was measured
+        :param value: value measured at that setpoint (number, or array of the whole inner line)
+        :return: NoneType
+        """
+        self.points[x] = np.atleast_1d(np.asarray(value, dtype=float))
+
+    def losses(self, xs):
+        """
+        :param xs: sorted array of measured setpoints
+        :return: array with the loss of every interval between neighbouring setpoints
+        """
+        ys = np.array([self.points[x] for x in xs])
+        x_range = abs(self.upper - self.lower) or 1.0
+        finite = ys[np.isfinite(ys)]
+        y_range = (finite.max() - finite.min()) if len(finite) else 0
+        y_range = y_range or 1.0
+
+        dx = np.diff(xs) / x_range
+        # root mean square difference of the neighbouring values (lines for 2D sweeps)
+        dy = np.sqrt(np.nanmean((np.diff(ys, axis=0) / y_range) ** 2, axis=1))
+        dy = np.nan_to_num(dy)
+        losses = np.hypot(dx, dy)
+
+        if len(xs) > 2 and CURVATURE_WEIGHT:
+            curvature = np.zeros(len(xs))
+            second = (ys[2:] - 2 * ys[1:-1] + ys[:-2]) / y_range
+            curvature[1:-1] = np.nan_to_num(np.sqrt(np.nanmean(second ** 2, axis=1)))
+            losses *= 1 + CURVATURE_WEIGHT * np.maximum(curvature[:-1], curvature[1:])
+        return losses
+
+
+def is_adaptive(loop):
+    """
+    :param loop: qcodes ActiveLoop
+    :return: True if the loop was created with adaptive sampling
+    """
+    return getattr(loop, "sweep_mode", "uniform") == "adaptive"
+
+
+def measure_actions(actions, action_indices, data_set):
+    """
+    Measure all actions of a loop at the current setpoint (inner loops are swept uniformly)
+
+    :param actions: actions of the loop
+    :param action_indices: indices of the loop in the loop tree, () for the outer loop
+    :param data_set: data set of the loop
+    :return: tuple (dict of array_id : measured value, value of the first measured parameter, not counting the
+            ones added only for a single run)
+    """
+    from qcodes.actions import Task, BreakIf
+    from qcodes.loops import ActiveLoop
+
+    record = {}
+    response = None
+    for index, action in enumerate(actions):
+        indices = action_indices + (index,)
+        if isinstance(action, Task):
+            action()
+        elif isinstance(action, BreakIf):
+            continue
+        elif isinstance(action, ActiveLoop):
+            line, line_response = measure_line(action, indices, data_set)
+            record.update(line)
+            if response is None:
+                response = line_response
+        elif hasattr(action, "names"):
+            # MultiParameter, every value has its own array
+            for i, value in enumerate(action.get()):
+                record[data_set.action_id_map[indices + (i,)]] = value
+                # values of actions added only for this run (settle times, ...) are stored, but not refined on
+                if response is None and not getattr(action, "job_task", False):
+                    response = value
+        else:
+            value = action.get()
+            record[data_set.action_id_map[indices]] = value
+            if response is None and not getattr(action, "job_task", False):
+                response = value
+    return record, response
+
+
+def measure_line(loop, action_indices, data_set):
+    """
+    Sweep an inner loop uniformly and measure its actions at every point
+
+    :param loop: inner qcodes ActiveLoop
+    :param action_indices: indices of the inner loop in the loop tree
+    :param data_set: data set of the outer loop
+    :return: tuple (dict of array_id : array of values along the line, line of the first measured parameter)
+    """
+    from qcodes.actions import _QcodesBreak
+    from qcodes.loops import ActiveLoop
+
+    if any(isinstance(action, ActiveLoop) for action in loop.actions):
+        raise ValueError("Adaptive sweeps support at most one inner loop")
+    setpoints = list(loop.sweep_values)
+    record = {data_set.action_id_map[action_indices]: setpoints}
+    response = []
+    for value in setpoints:
+        loop.sweep_values.set(value)
+        if loop.delay and not sleep(loop.delay):
+            raise _QcodesBreak
+        point, point_response = measure_actions(loop.actions, action_indices, data_set)
+        for array_id, measured in point.items():
+            record.setdefault(array_id, []).append(measured)
+        response.append(point_response if point_response is not None else np.nan)
+    return record, response
+
+
+def run_adaptive(loop, data_set, should_stop=None):
+    """
+    Run a loop with adaptive sampling of its setpoints. Blocks until the point budget is used up or the loop is
+    stopped.
+
+    :param loop: qcodes ActiveLoop, lower and upper limits and the budget are taken from its sweep values
+    :param data_set: data set created by loop.get_data_set
+    :param should_stop: function returning True if the run should be stopped (checked before every point)
+    :return: NoneType
+    """
+    from qcodes.actions import _QcodesBreak
+    from qcodes.station import Station
+
+    sweep_values = loop.sweep_values
+    sampler = AdaptiveSampler(sweep_values[0], sweep_values[-1], len(sweep_values))
+    set_id = data_set.action_id_map[()]
+    # setpoint : dict of array_id : value, for all measured points
+    measured = {}
+
+    data_set.add_metadata({"loop": loop.snapshot(), "sweep_mode": "adaptive"})
+    if Station.default is not None:
+        data_set.add_metadata({"station": Station.default.snapshot()})
+    data_set.save_metadata()
+
+    bg_task = getattr(loop, "bg_task", None)
+    bg_min_delay = getattr(loop, "bg_min_delay", 1)
+    last_bg_task = time.time()
+    try:
+        while should_stop is None or not should_stop():
+            x = sampler.ask()
+            if x is None:
+                break
+            sweep_values.set(x)
+            if loop.delay and not sleep(loop.delay):
+                break
+            record, response = measure_actions(loop.actions, (), data_set)
+            sampler.tell(x, response if response is not None else np.nan)
+            measured[x] = record
+
+            # keep the points sorted by setpoint, so that the data set looks like a (non uniform) sweep
+            xs = sorted(measured)
+            stored = {set_id: xs}
+            for array_id in record:
+                stored[array_id] = [measured[setpoint][array_id] for setpoint in xs]
+            data_set.store((slice(0, len(xs)),), stored)
+
+            if bg_task is not None and time.time() - last_bg_task > bg_min_delay:
+                bg_task()
+                last_bg_task = time.time()
+    except _QcodesBreak:
+        pass
+    finally:
+        data_set.finalize()
+        if getattr(loop, "bg_final_task", None) is not None:
+            loop.bg_final_task()
@@ -3,26 +3,26 @@ qcodes/instrument/base.py -> line 263
 There u can find a set function for setting paramater defined by "name" to a value defined by "value"
 """
 
-from PyQt5.QtWidgets import QApplication, QWidget, QLineEdit, QPushButton, QLabel, QComboBox, QShortcut, QVBoxLayout
-from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtWidgets import QApplication, QWidget, QLineEdit, QPushButton, QLabel, QComboBox, QShortcut, QVBoxLayout, \
+    QHBoxLayout, QProgressBar
+from PyQt5.QtCore import Qt, pyqtSignal, QThreadPool
 
-import inspect
 import sys
 import importlib
 
-import qcodes as qc
-from qcodes.instrument_drivers.QuTech.IVVI import IVVI
-from qcodes.instrument_drivers.tektronix.AWG5014 import Tektronix_AWG5014
-from instrument_imports import *
 from InstrumentData import *
 from Helpers import *
+from DriverCatalog import DriverCatalog
+from DriverSearch import DriverSearchIndex
+from InstrumentConnector import InstrumentConnection, DEFAULT_CONNECTION_TIMEOUT, prepare_instrument
 
 
 class Widget(QWidget):
 
     submitted = pyqtSignal(object)
 
-    def __init__(self, instruments, parent=None, default="DummyInstrument"):
+    def __init__(self, instruments, parent=None, default="DummyInstrument", catalog=None, connections=None,
+                 thread_pool=None):
         """
         Constructor for AddInstrumentWidget window
 
@@ -30,12 +30,25 @@ class Widget(QWidget):
         dictionary in the MainWindow
         :param parent: specify object that created this widget
         :param default: instrument data (type, name, address) is filled based on what is passed as a default instrument
+        :param catalog: DriverCatalog containing data about all qcodes drivers, if not passed a new one is loaded
+        :param connections: Dictionary shared with parent (MainWindow) containing connections to instruments that are
+        still being created (name : InstrumentConnection), used to prevent two instruments with the same name
+        :param thread_pool: thread pool in which instruments are created, global one is used if not passed
         """
         super(Widget, self).__init__()
         # list of instruments shared with the mainWindow (contains all instruments created so far)
         self.instruments = instruments
+        # instruments that are being connected to at the moment (by this or any other AddInstrumentWidget)
+        self.connections = connections if connections is not None else {}
+        self.thread_pool = thread_pool if thread_pool is not None else QThreadPool.globalInstance()
+        # connection started by this widget, None if nothing is being connected to
+        self.connection = None
 
-        # dictionary containing pointers to all available instrument classes with instrument type as keys
+        # catalog of all drivers found in qcodes (drivers are not imported until an instrument is created)
+        self.catalog = catalog if catalog is not None else DriverCatalog()
+
+        # dictionary containing catalog entries of all available instruments with instrument type as keys (classes get
+        # imported only when instrument is being created, see self.create_object)
         self.premade_instruments = {}
         # call to a function that fills the above dict
         self.populate_premade_instruments()
@@ -58,8 +71,8 @@ class Widget(QWidget):
         """
 
         # define the starting position and dimensions of the widget
-        self.setGeometry(256, 256, 320, 260)
-        self.setMinimumSize(320, 260)
+        self.setGeometry(256, 256, 320, 370)
+        self.setMinimumSize(320, 370)
         # define name and the icon of the widget
         self.setWindowTitle("Add new instrument")
         self.setWindowIcon(QtGui.QIcon("img/osciloscope_icon.png"))
@@ -67,6 +80,13 @@ class Widget(QWidget):
         self.vertical_layout = QVBoxLayout()
         self.setLayout(self.vertical_layout)
 
+        # type-ahead search over the drivers (class, brand, module and docstring keywords), filters the combobox below
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Search drivers (name, brand, keywords) ...")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.textChanged.connect(self.filter_instruments)
+        self.vertical_layout.addWidget(self.search_box)
+
         # combobox filled with all instrument classes that were found in the qcodes directory: "instrument drivers"
         self.cb = QComboBox()
         self.vertical_layout.addWidget(self.cb)
@@ -96,11 +116,33 @@ class Widget(QWidget):
         self.instrument_address = QLineEdit()
         self.vertical_layout.addWidget(self.instrument_address)
 
+        # number of seconds the instrument is given to connect before giving up on it
+        timeout_label = QLabel("Timeout [s]")
+        self.vertical_layout.addWidget(timeout_label)
+        self.connection_timeout = QLineEdit(str(DEFAULT_CONNECTION_TIMEOUT))
+        self.vertical_layout.addWidget(self.connection_timeout)
+
         # It's a button, that says OK, what do u think it does ?
         self.ok_button = QPushButton("OK")
         self.ok_button.clicked.connect(self.add_instrument)
         self.vertical_layout.addWidget(self.ok_button)
 
+        # progress of the connection, shown only while the instrument is being created in the background
+        progress_layout = QHBoxLayout()
+        self.connection_progress = QProgressBar()
+        # busy indicator, there is no way of knowing how far the driver is with connecting
+        self.connection_progress.setRange(0, 0)
+        self.connection_progress.setFormat("")
+        progress_layout.addWidget(self.connection_progress)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_connection)
+        progress_layout.addWidget(self.cancel_button)
+        self.vertical_layout.addLayout(progress_layout)
+        self.connection_status = QLabel("")
+        self.vertical_layout.addWidget(self.connection_status)
+        self.connection_progress.hide()
+        self.cancel_button.hide()
+
         # Define some shortcuts
         add_shortcut = QShortcut(QtGui.QKeySequence(Qt.Key_Return), self)
         add_shortcut.activated.connect(self.add_instrument)
@@ -114,38 +156,92 @@ class Widget(QWidget):
 
     def add_instrument(self):
         """
-        Called upon clicking OK. Adds instrument (based on user input) to the instrument dictionary in the main window.
-        Data structure -> {name : instrument object}
+        Called upon clicking OK. Starts creating the instrument (based on user input) in a worker thread, GUI stays
+        responsive meanwhile. Once the instrument is connected it is added to the instrument dictionary in the main
+        window (see self.on_connected). Data structure -> {name : instrument object}
         """
+        if self.connection is not None and self.connection.is_active():
+            return
 
         # Validate data, if validation returns True then some mistake was found, abort further execution
         if self.validate_instrument_input():
             return
 
-        # fetch the name of the instrument
+        # read everything that is needed from the widgets here, worker thread must not touch them
+        classname = self.instrument_type.text()
         name = self.instrument_name.text()
-        instrument = None
-        try:
-            # Try to create an instance of the instrument class
-            instrument = self.create_object()
-        except Exception as e:
-            show_error_message("Warning", str(e))
-        else:
-            if isinstance(instrument, IVVI):
-                for i in range(instrument._numdacs):
-                    param_name = "dac" + str(i + 1)
-                    parameter = instrument.parameters[param_name]
-                    parameter.step = 100
-                    parameter.inter_delay = 0
-
-        # if some instrument was created, add it to a dict of instruments shared with the main window and update
-        # preview of the instruments in the main window
-        if instrument is not None:
-            self.instruments[name] = instrument
-            self.submitted.emit(instrument)
-            # self.parent.update_station_preview()
-            self.close()
-        
+        address = self.instrument_address.text()
+        timeout = float(self.connection_timeout.text())
+
+        self.connection = InstrumentConnection(name, lambda: self.create_object(classname, name, address),
+                                               self.thread_pool, timeout, parent=self)
+        self.connection.connected.connect(self.on_connected)
+        self.connection.failed.connect(self.on_connection_failed)
+        self.connections[name] = self.connection
+        self.set_connecting(True, "Connecting to {} ...".format(name))
+        self.connection.start()
+
+    def cancel_connection(self):
+        """
+        Stop waiting for the instrument that is currently being connected to
+
+        :return: NoneType
+        """
+        if self.connection is not None:
+            self.connection.cancel()
+
+    def on_connected(self, name, instrument):
+        """
+        Called when the instrument has been successfully created in the worker thread
+
+        :param name: name of the instrument
+        :param instrument: newly created instrument
+        :return: NoneType
+        """
+        self.connections.pop(name, None)
+        self.set_connecting(False, "")
+        prepare_instrument(instrument)
+
+        # add the instrument to a dict of instruments shared with the main window and update preview of the
+        # instruments in the main window
+        self.instruments[name] = instrument
+        self.submitted.emit(instrument)
+        self.close()
+
+    def on_connection_failed(self, name, message):
+        """
+        Called if creating the instrument raised an exception, timed out or was cancelled
+
+        :param name: name of the instrument
+        :param message: message describing what went wrong
+        :return: NoneType
+        """
+        self.connections.pop(name, None)
+        self.set_connecting(False, "")
+        if self.connection is not None and self.connection.state != "cancelled":
+            show_error_message("Critical error", message)
+
+    def set_connecting(self, connecting, status):
+        """
+        Show or hide the progress of the connection and lock the inputs while connecting
+
+        :param connecting: True if the instrument is being connected to
+        :param status: text displayed below the progress bar
+        :return: NoneType
+        """
+        for widget in [self.cb, self.instrument_name, self.instrument_address, self.connection_timeout,
+                       self.ok_button]:
+            widget.setEnabled(not connecting)
+        self.connection_progress.setVisible(connecting)
+        self.cancel_button.setVisible(connecting)
+        self.connection_status.setText(status)
+
+    def is_connecting(self):
+        """
+        :return: True if the instrument started by this widget is still being connected to
+        """
+        return self.connection is not None and self.connection.is_active()
+
     def update_instrument_data(self):
         """
         Upon selecting one of instruments from dropdown, updates input fields with data availible from class
@@ -184,16 +280,25 @@ class Widget(QWidget):
         name = self.instrument_name.text()
         address = self.instrument_address.text()
 
+        # search might have filtered out all instruments
+        if self.instrument_type.text() not in self.premade_instruments:
+            error_message = "Please select an instrument type."
         # if name is shorter then 1 (meaning no name was provided) request user to input a name
-        if len(name) < 1:
+        elif len(name) < 1:
             error_message = "Please specify instrument name."
         # if name already exists in instruments (another instrument has that name) request user to change a name
         elif name in self.instruments:
             error_message = "Another instrument already has name: {}" + name + \
                             ". Please change the name of your isntrument"
+        # instrument with this name is still being connected to (in this or some other window)
+        elif name in self.connections and self.connections[name].is_active():
+            error_message = "Instrument with name " + name + " is already being connected to. Please wait or change " \
+                            "the name of your instrument"
         # If address was not provided, request address
         elif len(address) < 1:
             error_message = "Please specify instrument address"
+        elif not is_numeric(self.connection_timeout.text()) or float(self.connection_timeout.text()) < 0:
+            error_message = "Timeout has to be a positive number of seconds (0 means no timeout)"
         # In all other cases keep your mouth shut u goddamn boring shit program
         else:
             error_message = ""
@@ -207,92 +312,86 @@ class Widget(QWidget):
 
     def populate_premade_instruments(self):
         """
-        Walks through folder structure and fetches instruments and their classes for further use. To be more specific
-        to be able to populate the dropdown for selecting an instrument to create and also holds pointers to classes
-        of all the instruments so that instantiating an instrument from class name is posible by looking into the
-        premade_instruments dictionary and from the key that is a string representing the name of the class it fetches
-        the class stored under that key.
-
-        NOTE: Contains a list of instruments (not_working[]) that specifies instruments that throw errors (possibly they
-        require some extra drivers made by instrument manufacturer, instruments starting with "Infiniium" ending with
-        "Keithley_2600_Channels" were not throwing errors prior to qcodes commit (date cca. 06.04.2018))
+        Fills premade_instruments dictionary with data from the driver catalog, to be able to populate the dropdown for
+        selecting an instrument to create. Catalog is revalidated against qcodes instrument_drivers folder (only the
+        modification times of the files are checked, changed files are parsed, not imported), driver modules are not
+        imported here. Class of the instrument is imported only when the instrument is created (see self.create_object)
 
         :return: NoneType
         """
         self.premade_instruments["DummyInstrument"] = getattr(importlib.import_module("DemoDummy"), "DummyInstrument")
-        not_working = ["Keysight_33500B_channels", "M3201A", "M3300A", "M4i", "AWGFileParser", "Infiniium",
-                       "KeysightAgilent_33XXX", "Model_336", "Base_SPDT", "RC_SP4T", "RC_SPDT", "USB_SPDT", "ZIUHFLI",
-                       "QDac_channels", "RTO1000", "ZNB", "SR860", "SR86x", "AWG5208", "AWG70000A", "AWG70002A",
-                       "Keithley_2600_channels", "Keysight_N5183B", "Keysight_N6705B", "N52xx", "AG_UC8",
-                       "MercuryiPS_VISA", ]
-
-        path = os.path.dirname(inspect.getfile(qc)) + "\\instrument_drivers"
-        brands = get_subfolders(path, True)
-        for brand in brands:
-            models = get_files_in_folder(path + "\\" + brand, True)
-            for model in models:
-                if model[0:-3] not in not_working:
-                    module_name = "qcodes.instrument_drivers." + brand + "." + model[:-3]
-                    module = importlib.import_module(module_name)
-                    if model[:-3] not in correct_names.keys():
-                        try:
-                            my_class = getattr(module, model[:-3])
-                        except Exception as e:
-                            show_error_message("Warning",str(e))
-                        else:
-                            self.premade_instruments[model[:-3]] = my_class
-                    else:
-                        try:
-                            my_class = getattr(module, correct_names[model[:-3]])
-                        except Exception as e:
-                            show_error_message("Warning",str(e))
-                        else:
-                            self.premade_instruments[model[:-3]] = my_class
-
-    def create_object(self):
+
+        try:
+            self.catalog.refresh()
+        except Exception as e:
+            show_error_message("Warning", "Could not scan qcodes instrument drivers.\n" + str(e))
+
+        # catalog lists only the files that define a class inheriting from qcodes Instrument
+        for entry in self.catalog.models():
+            self.premade_instruments[entry["model"]] = entry
+
+        # index for the search box, built from the catalog data only
+        self.search_index = DriverSearchIndex.from_catalog(self.catalog, extra=["DummyInstrument"])
+
+    def filter_instruments(self, text):
         """
-        Creates a new instrument object based on data input by user. Adds newly created instrument to the "instruments"
-        dictionary in the MainWindow
+        Called on every change of the text in the search box. Shows only the instruments matching the text in the
+        combobox, best matches first, and selects the best match. Once the search box is cleared, the instrument that was
+        selected before stays selected.
 
-        Implements most of the error proofing for creating of the instrument object
+        :param text: text from the search box
+        :return: NoneType
+        """
+        selected = self.cb.currentText()
+        results = self.search_index.search(text)
+        self.cb.blockSignals(True)
+        self.cb.clear()
+        self.cb.addItems(results)
+        index = self.cb.findText(selected)
+        self.cb.setCurrentIndex(index if index != -1 and text == "" else 0)
+        self.cb.blockSignals(False)
+        if self.cb.currentText() != selected:
+            self.update_instrument_data()
+
+    def get_instrument_class(self, classname):
+        """
+        Fetch the class of the instrument selected in the combobox, if the instrument is a qcodes driver this is where
+        its module gets imported
+
+        :param classname: instrument type (key of the premade_instruments dictionary)
+        :return: class representing that instrument
+        """
+        instrument_class = self.premade_instruments[classname]
+        if isinstance(instrument_class, dict):
+            instrument_class = self.catalog.load_class(instrument_class)
+            # remember the class so that it doesn't have to be looked up again
+            self.premade_instruments[classname] = instrument_class
+        return instrument_class
+
+    def create_object(self, classname, name, address):
+        """
+        Creates a new instrument object. Runs in a worker thread (see self.add_instrument), so it must not touch any
+        widgets, all data input by user is passed as arguments.
 
         Name of the instrument:
             is taken from current text in the QLineEdit.
         Type of the instrument:
             exctracted after selecting instrument from combobox containing all instruments.
-        Instrument objects are created with help of the dict in instrument_imports.py file.
-        Each key->value pair in that file is a combination of instrument type and the name of the class representing
-        that instrument (as set by qcodes development team)
+        Instrument classes are looked up in the driver catalog, module of the driver is imported only at this point.
 
-        :return: NoneType
+        Exceptions are not handled here, the worker passes them to InstrumentConnection which reports them to the user
+
+        :param classname: instrument type (key of the premade_instruments dictionary)
+        :param name: name of the instrument
+        :param address: address of the instrument
+        :return: newly created instrument
         """
-        classname = self.instrument_type.text()
-        name = self.instrument_name.text()
-        instrument = None
         if classname == "DummyInstrument":
-            try:
-                instrument = self.premade_instruments[classname](name, gates=["g1", "g2"])
-            except Exception as e:
-                if "VI_ERROR_RSRC_NFOUND" in str(e):
-                    show_error_message("Critical error", str(e) +
-                                       "\n\nTranslated to human language: Your address is probably incorrect")
-                else:
-                    show_error_message("Critical error", str(e))
-        else:
-            address = self.instrument_address.text()
-            try:
-                if name == "AWG":
-                    address_string = 'TCPIP0::' + address + '::inst0::INSTR'
-                    instrument = self.premade_instruments[classname](name, address_string)
-                else:
-                    instrument = self.premade_instruments[classname](name, address)
-            except Exception as e:
-                if "VI_ERROR_RSRC_NFOUND" in str(e):
-                    show_error_message("Critical error", str(e) +
-                                       "\n\nTranslated to human language: Your address is probably incorrect")
-                else:
-                    show_error_message("Critical error", str(e))
-        return instrument
+            return self.get_instrument_class(classname)(name, gates=["g1", "g2"])
+        if name == "AWG":
+            address = 'TCPIP0::' + address + '::inst0::INSTR'
+        return self.get_instrument_class(classname)(name, address)
+
     """""""""""""""""""""
     Helper functions
     """""""""""""""""""""
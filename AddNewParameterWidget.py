@@ -143,7 +143,9 @@ class AddNewParameterWidget(QWidget):
                 instrument = self.select_instrument_to_add_from.currentData()
                 instrument_name = instrument.name
                 function_name = instrument_name + "_" + parameter_name
-                self.functions[function_name] = self.instruments[instrument_name].parameters[parameter_name].get
+                # looked up when called, so that get functions wrapped later (see LatencyMonitor) are used
+                self.functions[function_name] = lambda instrument_name=instrument_name, parameter_name=parameter_name: \
+                    self.instruments[instrument_name].parameters[parameter_name].get()
                 self.evaluation_function.setText(current_text + function_name + "()")
             elif text == "sqrt":
                 self.evaluation_function.setText(current_text + "math.sqrt()")
@@ -174,6 +176,8 @@ class AddNewParameterWidget(QWidget):
                 return
             self.instrument.add_parameter(name, label=label, unit=unit, get_cmd=lambda: eval(get_cmd, globals(),
                                                                                              self.functions))
+            # get_cmd can read any instrument, not only the one the parameter was added to (see ConcurrentReadout)
+            self.instrument.parameters[name].reads_any_instrument = True
         except Exception as e:
             show_error_message("Warning", str(e))
         else:
@@ -0,0 +1,229 @@
+"""
+Adapters that add the buffered sweep protocol (see BufferedSweep) to drivers that do not implement it themselves.
+
+Zurich Instruments lock-ins (MFLI, UHFLI) have a sweeper module that steps one of their own nodes (oscillator
+frequency, output offsets, ...) through a list of values and records demodulator samples at every step, on the
+instrument. ZISweeperAdapter uses it to make the lock-in both the list-capable source and the buffered readout of a
+loop: sweeping for example oscillator1_freq of the lock-in while measuring its demod1_R is ran as a single sweep by the
+instrument. Parameters are recognized by the names used by the qcodes ZI drivers (oscillator1_freq, demod1_R, ...).
+
+Adapters are installed on newly connected instruments by install_buffered_adapters (see prepare_instrument).
+"""
+
+import re
+
+import numpy as np
+
+from Helpers import is_instance_of
+from Cancellation import Cancelled, current_token, sleep
+
+
+# drivers of lock-ins with a sweeper module, checked with is_instance_of so that they are not imported here
+ZI_LOCKINS = (("qcodes.instrument_drivers.ZI.MFLI", "MFLI"),
+              ("qcodes.instrument_drivers.ZI.MFLIpoll", "MFLIpoll"),
+              ("qcodes.instrument_drivers.ZI.ZIUHFLI", "ZIUHFLI"))
+
+# parameters that the sweeper can step through a list of values: name pattern -> node (relative to the device)
+SWEEPABLE_NODES = ((re.compile(r"^oscillator(\d+)_freq$"), "oscs/{}/freq"),
+                   (re.compile(r"^signal_output(\d+)_offset$"), "sigouts/{}/offset"),
+                   (re.compile(r"^aux_out(\d+)_offset$"), "auxouts/{}/offset"),
+                   (re.compile(r"^demod(\d+)_phaseshift$"), "demods/{}/phaseshift"))
+
+# parameters recorded by the sweeper: name pattern -> field of the demodulator sample
+DEMOD_SAMPLE = re.compile(r"^demod(\d+)_(x|y|R|phi)$")
+SAMPLE_FIELDS = {"x": "x", "y": "y", "R": "r", "phi": "phase"}
+
+# how often the sweeper is asked if it's done (seconds)
+POLL_INTERVAL = 0.05
+
+
+def node_index(match):
+    """
+    :param match: match of one of the name patterns, its first group is the (1 based) number used in parameter names
+    :return: 0 based index used in the node paths
+    """
+    return int(match.group(1)) - 1
+
+
+class ZISweeperAdapter:
+    """
+    Buffered sweep protocol of a ZI lock-in, implemented with its sweeper module
+    """
+    def __init__(self, instrument):
+        """
+        Constructor of the ZISweeperAdapter class
+
+        :param instrument: qcodes ZI lock-in driver with a connection to the data server (daq) and a device id
+        """
+        self.instrument = instrument
+        self.daq = instrument.daq
+        self.device = str(instrument.device).lower()
+
+        self.sweeper = None
+        # parameters that are going to be read from the running sweep: id of the parameter -> (node path, field)
+        self.armed = {}
+        self.result = None
+
+    """""""""""""""""""""
+    Data manipulation
+    """""""""""""""""""""
+    def can_sweep(self, parameter):
+        """
+        :param parameter: parameter of the instrument
+        :return: True if the sweeper can step the parameter
+        """
+        return self.sweep_node(parameter) is not None
+
+    def can_buffer(self, parameter, swept):
+        """
+        :param parameter: measured parameter of the instrument
+        :param swept: parameter swept by the loop
+        :return: True if the parameter is recorded by the sweeper while it sweeps the swept parameter
+        """
+        return self.sample_node(parameter) is not None and self.can_sweep(swept)
+
+    def arm_buffer(self, parameter, num_points, delay):
+        """
+        Remember to read the parameter from the next sweep (the sweeper records all points of the sweep)
+
+        :param parameter: measured parameter of the instrument
+        :param num_points: number of points of the sweep
+        :param delay: time to wait after each step of the sweep
+        :return: NoneType
+        """
+        if self.sweeper is not None and not self.armed:
+            # leftovers of a sweep that was stopped or failed before all of it was read
+            self.close()
+        path, field = self.sample_node(parameter)
+        self.armed[id(parameter)] = (path, field)
+
+    def upload_sweep(self, parameter, values, delay):
+        """
+        Set the sweeper up to step the parameter through the values
+
+        :param parameter: swept parameter of the instrument
+        :param values: evenly spaced setpoints, in instrument units
+        :param delay: time to wait after each step before the demodulators are sampled
+        :return: NoneType
+        """
+        values = np.asarray(values, dtype=float)
+        if len(values) > 1 and not np.allclose(np.diff(values), values[1] - values[0]):
+            raise ValueError("Sweeper of {} can only sweep evenly spaced values".format(self.instrument.name))
+        self.sweeper = self.daq.sweep()
+        self.sweeper.set("device", self.device)
+        self.sweeper.set("gridnode", self.sweep_node(parameter))
+        self.sweeper.set("start", float(min(values[0], values[-1])))
+        self.sweeper.set("stop", float(max(values[0], values[-1])))
+        self.sweeper.set("samplecount", len(values))
+        # sequential or reverse, the loop decides the direction
+        self.sweeper.set("scan", 0 if values[-1] >= values[0] else 3)
+        self.sweeper.set("xmapping", 0)
+        self.sweeper.set("loopcount", 1)
+        self.sweeper.set("settling/time", float(delay))
+        # keep the filter settings the user has chosen, one sample per point
+        self.sweeper.set("bandwidthcontrol", 0)
+        self.sweeper.set("averaging/sample", 1)
+        self.sweeper.set("averaging/tc", 0)
+
+    def start_sweep(self, parameter):
+        """
+        Start the sweep, it runs on the instrument while the buffers are read
+
+        :param parameter: swept parameter of the instrument
+        :return: NoneType
+        """
+        for path in set(path for path, _ in self.armed.values()):
+            self.sweeper.subscribe(path)
+        self.sweeper.execute()
+
+    def read_buffer(self, parameter):
+        """
+        :param parameter: measured parameter of the instrument
+        :return: values of the parameter at all points of the sweep (waits for the sweep to finish)
+        """
+        path, field = self.armed.pop(id(parameter))
+        if self.result is None:
+            self.result = self.wait_for_result()
+        samples = self.result[path][0][0]
+        values = np.asarray(samples[field], dtype=float)
+        # qcodes ZI drivers return the phase in degrees
+        if field == "phase":
+            values = np.degrees(values)
+        if not self.armed:
+            self.close()
+        return values
+
+    """""""""""""""""""""
+    Helper functions
+    """""""""""""""""""""
+    def sweep_node(self, parameter):
+        """
+        :param parameter: any parameter
+        :return: node that has to be swept to sweep the parameter, None if the sweeper can't sweep it
+        """
+        if getattr(parameter, "_instrument", None) is not self.instrument:
+            return None
+        for pattern, node in SWEEPABLE_NODES:
+            match = pattern.match(parameter.name)
+            if match:
+                return node.format(node_index(match))
+        return None
+
+    def sample_node(self, parameter):
+        """
+        :param parameter: any parameter
+        :return: tuple (path of the demodulator sample node, field of the sample), None if the parameter is not a
+                demodulator value of this instrument
+        """
+        if getattr(parameter, "_instrument", None) is not self.instrument:
+            return None
+        match = DEMOD_SAMPLE.match(parameter.name)
+        if match is None:
+            return None
+        return "/{}/demods/{}/sample".format(self.device, node_index(match)), SAMPLE_FIELDS[match.group(2)]
+
+    def wait_for_result(self):
+        """
+        Wait for the sweeper to finish (or the run to be stopped) and read all of the recorded data
+
+        :return: dictionary returned by the read of the sweeper module
+        """
+        while not self.sweeper.finished():
+            if not sleep(POLL_INTERVAL):
+                self.close()
+                raise Cancelled(current_token().reason)
+        return self.sweeper.read(True)
+
+    def close(self):
+        """
+        Stop and release the sweeper module and forget the data of the last sweep
+
+        :return: NoneType
+        """
+        if self.sweeper is not None:
+            try:
+                self.sweeper.finish()
+                self.sweeper.unsubscribe("*")
+                self.sweeper.clear()
+            except Exception as e:
+                print("Could not release the sweeper of {}: {}".format(self.instrument.name, e))
+        self.sweeper = None
+        self.armed = {}
+        self.result = None
+
+
+def install_buffered_adapters(instrument):
+    """
+    Add the buffered sweep protocol to an instrument whose driver does not have it, if there is an adapter for it
+
+    :param instrument: newly created instrument
+    :return: NoneType
+    """
+    if any(callable(getattr(instrument, method, None)) for method in ("upload_sweep", "arm_buffer")):
+        return
+    if any(is_instance_of(instrument, *driver) for driver in ZI_LOCKINS):
+        if not hasattr(instrument, "daq") or not hasattr(instrument, "device"):
+            return
+        adapter = ZISweeperAdapter(instrument)
+        for method in ("can_sweep", "can_buffer", "arm_buffer", "upload_sweep", "start_sweep", "read_buffer"):
+            setattr(instrument, method, getattr(adapter, method))
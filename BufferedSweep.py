@@ -0,0 +1,162 @@
+"""
+Hardware buffered (list mode) execution of 1D loops.
+
+A loop ran by qcodes sets and gets every point from python, for long sweeps those round trips take most of the time.
+If the instrument being swept can take the whole list of setpoints and step through it on its own (DAC ramp lists,
+sweep lists of sources), and every measured instrument can record into a buffer and return all of it at once (lock-in
+poll/buffer readout), the loop is ran by uploading the setpoints, triggering the sweep once, and reading the traces back
+in bulk. Data ends up in the same data set the loop would have written, so plotting and saving do not change.
+
+Drivers opt in by implementing these methods on the instrument:
+
+    swept instrument:
+        upload_sweep(parameter, values, delay)  store the setpoints (in instrument units) for the parameter
+        start_sweep(parameter)                  trigger the stored sweep
+
+    measured instruments:
+        arm_buffer(parameter, num_points, delay)  prepare the buffer to record num_points values of the parameter
+        read_buffer(parameter)                    wait for the buffer to fill up and return all of its values
+
+    optional, for instruments that can only sweep or record some of their parameters:
+        can_sweep(parameter)                    True if the parameter can be swept from a list
+        can_buffer(parameter, swept)            True if the parameter can be recorded while swept is being swept
+
+Drivers that don't have these methods can get them from an adapter (see BufferedAdapters). Loops that do not qualify (nested loops, drivers without these methods) are ran point by point as usual.
+"""
+
+import numpy as np
+
+from LoopCompiler import raw_setpoints
+from Cancellation import Cancelled
+
+
+SWEEP_METHODS = ("upload_sweep", "start_sweep")
+BUFFER_METHODS = ("arm_buffer", "read_buffer")
+
+
+def get_instrument(parameter):
+    """
+    :param parameter: instrument parameter (not a divider)
+    :return: instrument the parameter belongs to, None if it does not belong to one
+    """
+    return getattr(parameter, "_instrument", None)
+
+
+def has_methods(instrument, methods):
+    """
+    :param instrument: any object
+    :param methods: names of the methods
+    :return: True if the object has all of the methods
+    """
+    return instrument is not None and all(callable(getattr(instrument, method, None)) for method in methods)
+
+
+def optional_check(instrument, method, *args):
+    """
+    :param instrument: instrument that has the methods of the protocol
+    :param method: name of an optional method of the protocol (can_sweep or can_buffer)
+    :param args: arguments of that method
+    :return: result of the method, True if the instrument does not have it
+    """
+    check = getattr(instrument, method, None)
+    return not callable(check) or bool(check(*args))
+
+
+def measured_actions(loop):
+    """
+    :param loop: qcodes ActiveLoop
+    :return: list of (index of the action, action) pairs for all actions that are measured (Tasks are left out)
+    """
+    from qcodes.actions import Task, BreakIf
+
+    return [(index, action) for index, action in enumerate(loop.actions)
+            if not isinstance(action, (Task, BreakIf)) and not getattr(action, "job_task", False)]
+
+
+def supports_buffered(loop):
+    """
+    :param loop: qcodes ActiveLoop
+    :return: tuple (True if the loop can be ran in buffered mode, reason why it can't be otherwise)
+    """
+    from qcodes.loops import ActiveLoop
+
+    parameter, _ = raw_setpoints(loop.sweep_values.parameter, np.zeros(0))
+    instrument = get_instrument(parameter)
+    if not has_methods(instrument, SWEEP_METHODS) or not optional_check(instrument, "can_sweep", parameter):
+        return False, "{} does not support list sweeps".format(parameter)
+    actions = measured_actions(loop)
+    if not actions:
+        return False, "loop does not measure anything"
+    for _, action in actions:
+        if isinstance(action, ActiveLoop):
+            return False, "only loops without inner loops can be buffered"
+        measured, _ = raw_setpoints(action, np.zeros(0))
+        instrument = get_instrument(measured)
+        if not has_methods(instrument, BUFFER_METHODS) or \
+                not optional_check(instrument, "can_buffer", measured, parameter):
+            return False, "{} does not support buffered readout".format(measured)
+    return True, ""
+
+
+def division_of(parameter):
+    """
+    :param parameter: parameter, possibly wrapped in one or more dividers
+    :return: total division applied to the value of the instrument parameter when it is read through this parameter
+    """
+    return float(raw_setpoints(parameter, np.ones(1))[1][0])
+
+
+def run_buffered(loop, data_set, should_stop=None):
+    """
+    Run a 1D loop by uploading all setpoints to the swept instrument and reading measured values from buffers. Blocks
+    until all data is read and saved.
+
+    :param loop: qcodes ActiveLoop, has to be supported (see supports_buffered)
+    :param data_set: data set created by loop.get_data_set
+    :param should_stop: function returning True if the run should be stopped (checked before the sweep is triggered,
+            buffers that wait for the sweep raise Cancelled when the run is stopped)
+    :return: NoneType
+    """
+    from qcodes.station import Station
+
+    values = np.array(list(loop.sweep_values), dtype=float)
+    num_points = len(values)
+    parameter, raw_values = raw_setpoints(loop.sweep_values.parameter, values)
+    actions = measured_actions(loop)
+
+    data_set.add_metadata({"loop": loop.snapshot(), "buffered": True})
+    if Station.default is not None:
+        data_set.add_metadata({"station": Station.default.snapshot()})
+    data_set.save_metadata()
+
+    try:
+        # arm all buffers first, so that no point of the sweep is missed
+        for _, action in actions:
+            measured, _ = raw_setpoints(action, np.zeros(0))
+            get_instrument(measured).arm_buffer(measured, num_points, loop.delay)
+        get_instrument(parameter).upload_sweep(parameter, raw_values, loop.delay)
+        if should_stop is not None and should_stop():
+            return
+        get_instrument(parameter).start_sweep(parameter)
+
+        stored = {data_set.action_id_map[()]: values}
+        for index, action in actions:
+            measured, _ = raw_setpoints(action, np.zeros(0))
+            trace = np.asarray(get_instrument(measured).read_buffer(measured), dtype=float)
+            if len(trace) != num_points:
+                raise ValueError("Buffer of {} returned {} values, expected {}".format(measured, len(trace),
+                                                                                      num_points))
+            stored[data_set.action_id_map[(index,)]] = trace / division_of(action)
+        data_set.store((slice(None),), stored)
+        # the instrument is left at the last setpoint by the sweep, keep the value of the parameter in sync with it
+        if num_points and hasattr(parameter, "_save_val"):
+            parameter._save_val(raw_values[-1])
+        if getattr(loop, "bg_task", None) is not None:
+            loop.bg_task()
+    except Cancelled:
+        # stopped while the instruments were sweeping, the traces were not complete
+        pass
+    finally:
+        data_set.finalize()
+        if getattr(loop, "bg_final_task", None) is not None:
+            loop.bg_final_task()
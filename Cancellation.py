@@ -0,0 +1,241 @@
+"""
+Cancellation of everything that runs in the background: loops ran by the run queue, Worker threads, live updates of
+instruments and dry runs.
+
+Every piece of background work gets a CancellationToken. Cancelling a token sets a threading.Event, so anything waiting
+on the token (loop delays, settling, ramps, sleeps between live updates) wakes up right away instead of finishing its
+sleep. Tokens can have a deadline (they cancel themselves once it passes) and children (cancelled together with their
+parent), so one STOP can reach all work started from the same place.
+
+Code that runs in a thread with a token bound to it (see CancellationToken.bound) does not need to be passed the token,
+sleep() of this module finds it. Loops are made cancellable by prepare_cancellation: delays of the loop (and of all of
+its inner loops) wait on the token, and the token is checked after every point.
+
+The time between cancel() and the moment the cancelled code noticed it is kept as stop_latency of the token. Sleeps and
+delays are interrupted immediately, so the latency is bound by the longest single get or set of an instrument (those
+can't be interrupted).
+"""
+
+import time
+import weakref
+import threading
+from contextlib import contextmanager
+
+
+class Cancelled(Exception):
+    """
+    Raised by CancellationToken.check if the token has been cancelled
+    """
+    pass
+
+
+class CancellationToken:
+    """
+    Thread safe cancellation flag with an optional deadline and child tokens
+    """
+    def __init__(self, parent=None, timeout=None, name=""):
+        """
+        Constructor of the CancellationToken class
+
+        :param parent: token whose cancellation cancels this token as well
+        :param timeout: seconds after which the token cancels itself, None for no deadline
+        :param name: name of the work the token belongs to (used in messages)
+        """
+        self.name = name
+        self.reason = None
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        if parent is not None and parent.deadline is not None:
+            self.deadline = parent.deadline if self.deadline is None else min(self.deadline, parent.deadline)
+
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._children = weakref.WeakSet()
+        # perf_counter times of the cancel request and of the first time the cancelled code noticed it
+        self.cancelled_at = None
+        self.acknowledged_at = None
+
+        if parent is not None:
+            parent._add_child(self)
+
+    def _add_child(self, child):
+        """
+        :param child: token cancelled together with this one (right away if this one is already cancelled)
+        :return: NoneType
+        """
+        with self._lock:
+            self._children.add(child)
+        if self.is_cancelled():
+            child.cancel(self.reason)
+
+    def child(self, timeout=None, name=""):
+        """
+        :param timeout: seconds after which the child cancels itself, None for no deadline (deadline of this token
+                still applies)
+        :param name: name of the work the child belongs to
+        :return: new token that is cancelled when this one is
+        """
+        return CancellationToken(parent=self, timeout=timeout, name=name)
+
+    def cancel(self, reason="cancelled"):
+        """
+        Cancel this token and all of its children, wakes up everybody waiting on them. Can be called from any thread.
+
+        :param reason: why the work was cancelled
+        :return: NoneType
+        """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self.cancelled_at = time.perf_counter()
+            self._event.set()
+            children = list(self._children)
+        for child in children:
+            child.cancel(reason)
+
+    def is_cancelled(self):
+        """
+        :return: True if the token has been cancelled or its deadline has passed
+        """
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+            return True
+        return False
+
+    def poll(self):
+        """
+        Same as is_cancelled, but meant to be called by the work that is being cancelled, the first poll that finds
+        the token cancelled marks the cancellation as noticed (see stop_latency)
+
+        :return: True if the work should stop
+        """
+        if not self.is_cancelled():
+            return False
+        with self._lock:
+            if self.acknowledged_at is None:
+                self.acknowledged_at = time.perf_counter()
+        return True
+
+    def check(self):
+        """
+        Raise Cancelled if the token has been cancelled
+
+        :return: NoneType
+        """
+        if self.poll():
+            raise Cancelled(self.reason)
+
+    def remaining(self):
+        """
+        :return: seconds left until the deadline, None if the token has no deadline
+        """
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def sleep(self, seconds):
+        """
+        Sleep for the given time, wake up as soon as the token is cancelled
+
+        :param seconds: time to sleep
+        :return: True if the whole time has been slept, False if the token was cancelled
+        """
+        if self.poll():
+            return False
+        remaining = self.remaining()
+        if remaining is not None and remaining < seconds:
+            self._event.wait(remaining)
+            self.is_cancelled()
+        else:
+            self._event.wait(max(0.0, seconds))
+        return not self.poll()
+
+    @property
+    def stop_latency(self):
+        """
+        :return: seconds between the cancel request and the moment the cancelled work noticed it, None if that did not
+                happen (yet)
+        """
+        if self.cancelled_at is None or self.acknowledged_at is None:
+            return None
+        return max(0.0, self.acknowledged_at - self.cancelled_at)
+
+    @contextmanager
+    def bound(self):
+        """
+        Make this the token of the calling thread while the with block runs (see current_token)
+        """
+        previous = getattr(_local, "token", None)
+        _local.token = self
+        try:
+            yield self
+        finally:
+            _local.token = previous
+
+
+# token bound to each thread, see CancellationToken.bound
+_local = threading.local()
+
+
+def current_token():
+    """
+    :return: token bound to the calling thread, None if there is none
+    """
+    return getattr(_local, "token", None)
+
+
+def sleep(seconds):
+    """
+    Sleep that is interrupted when the token of the calling thread is cancelled (plain sleep if there is no token)
+
+    :param seconds: time to sleep
+    :return: True if the whole time has been slept, False if the work was cancelled
+    """
+    token = current_token()
+    if token is None:
+        time.sleep(seconds)
+        return True
+    return token.sleep(seconds)
+
+
+def prepare_cancellation(loop, token):
+    """
+    Make the next run of the loop stop as soon as the token is cancelled: delays of the loop and all of its inner loops
+    wait on the token, and the token is checked after every point of every loop.
+
+    :param loop: qcodes ActiveLoop
+    :param token: CancellationToken of the run
+    :return: function that restores the loop to the way it was
+    """
+    from qcodes.actions import Task, _QcodesBreak
+    from qcodes.loops import ActiveLoop
+
+    def wait(delay):
+        if (delay and not token.sleep(delay)) or token.poll():
+            raise _QcodesBreak
+
+    def check():
+        if token.poll():
+            raise _QcodesBreak
+
+    patched = []
+    loops = [loop]
+    while loops:
+        current = loops.pop()
+        loops.extend(action for action in current.actions if isinstance(action, ActiveLoop))
+        # instance attribute hides the _wait method of the class (plain time.sleep) for this loop only
+        current._wait = wait
+        task = Task(check)
+        task.job_task = True
+        current.actions.append(task)
+        patched.append((current, task))
+
+    def restore():
+        for current, task in patched:
+            current.__dict__.pop("_wait", None)
+            if task in current.actions:
+                current.actions.remove(task)
+
+    return restore
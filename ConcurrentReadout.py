@@ -0,0 +1,161 @@
+"""
+Concurrent readout of the parameters measured at every point of a loop.
+
+A loop reads its actions one after another, so a point takes as long as all of the reads together. With concurrent
+readout enabled (loop.concurrent), parameters measured one after another by a loop are read at the same time from a
+thread pool, one thread per instrument, so a point takes only as long as the slowest instrument. Parameters of the same
+instrument (channels included) are still read one after another from a single thread, instruments are not expected to
+handle several requests at once over the same connection. Parameters that do not belong to an instrument are read
+together in one thread as well.
+
+Parameters created in the GUI or in a station config (marked with reads_any_instrument) belong to the instrument they
+were added to, but their get_cmd can read any other instrument. They are never read concurrently, they stay in the loop
+as they are and split the parameters around them into separate concurrent reads.
+
+Only plain parameters that follow each other are read together, tasks, inner loops and array/multi parameters keep
+their place in the loop. Values are stored in the same arrays of the data set as without concurrent readout. Concurrent
+readout is added to a run of a loop by prepare_concurrent_readout and removed by the function it returns.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from qcodes.instrument.parameter import MultiParameter
+
+from LoopEstimator import raw_parameter
+
+
+def instrument_of(parameter):
+    """
+    :param parameter: parameter or a divider
+    :return: instrument that is talked to when the parameter is read (channels are counted to their instrument), None
+            if the parameter does not belong to an instrument
+    """
+    instrument = getattr(raw_parameter(parameter), "_instrument", None)
+    while getattr(instrument, "_parent", None) is not None:
+        instrument = instrument._parent
+    return instrument
+
+
+def readout_groups(parameters):
+    """
+    :param parameters: list of parameters read at the same point
+    :return: list of lists of parameters that have to be read one after another (one list per instrument), in the
+            order in which the instruments first appear
+    """
+    groups = {}
+    for parameter in parameters:
+        groups.setdefault(id(instrument_of(parameter)), []).append(parameter)
+    return list(groups.values())
+
+
+def can_read_concurrently(action):
+    """
+    :param action: action of a loop
+    :return: True if the action is a plain parameter (single value) that can be read together with other parameters
+    """
+    from qcodes.actions import Task, BreakIf
+    from qcodes.loops import ActiveLoop
+
+    if isinstance(action, (Task, BreakIf, ActiveLoop)) or getattr(action, "job_task", False):
+        return False
+    # multi and array parameters have their own arrays in the data set, they are read as usual
+    if hasattr(action, "names") or hasattr(action, "shape"):
+        return False
+    # derived parameters can talk to any instrument, reading them together with others could use a connection twice
+    if getattr(raw_parameter(action), "reads_any_instrument", False):
+        return False
+    return callable(getattr(action, "get", None))
+
+
+class ConcurrentReadout(MultiParameter):
+    """
+    Reads a list of parameters with one thread per instrument, its values are stored under the names of the parameters
+    """
+    def __init__(self, parameters, executor):
+        """
+        Constructor of the ConcurrentReadout class
+
+        :param parameters: list of parameters that are read at the same point, one after another
+        :param executor: ThreadPoolExecutor with at least as many threads as there are instruments in the parameters
+        """
+        self.parameters = list(parameters)
+        self.groups = readout_groups(self.parameters)
+        self.executor = executor
+        # position of every parameter in the values returned by the get
+        self.positions = {id(parameter): index for index, parameter in enumerate(self.parameters)}
+
+        names = tuple(getattr(parameter, "full_name", parameter.name) for parameter in self.parameters)
+        super(ConcurrentReadout, self).__init__(name="concurrent_readout",
+                                                names=names,
+                                                shapes=tuple(() for _ in names),
+                                                labels=tuple(getattr(p, "label", p.name) for p in self.parameters),
+                                                units=tuple(getattr(p, "unit", "") for p in self.parameters))
+
+    @staticmethod
+    def read_group(group):
+        """
+        :param group: list of parameters of the same instrument
+        :return: list of their values, read one after another
+        """
+        return [parameter.get() for parameter in group]
+
+    def get_raw(self):
+        futures = [self.executor.submit(self.read_group, group) for group in self.groups]
+        # all reads have to be done before the point is stored (and before the next set), also if one of them failed
+        wait(futures)
+        values = [None] * len(self.parameters)
+        for group, future in zip(self.groups, futures):
+            for parameter, value in zip(group, future.result()):
+                values[self.positions[id(parameter)]] = value
+        return tuple(values)
+
+
+def prepare_concurrent_readout(loop):
+    """
+    Replace runs of parameters that follow each other in every loop (in the loop tree) with concurrent readout enabled
+    by a ConcurrentReadout, if they belong to more than one instrument. Has to be called before the data set of the loop
+    is created, and after the settling and timing have been added (they keep reading right after the set).
+
+    :param loop: qcodes ActiveLoop
+    :return: function that restores the loops to the way they were and shuts the thread pool down
+    """
+    from qcodes.loops import ActiveLoop
+
+    runs = []
+    added = []
+    loops = [loop]
+    while loops:
+        current = loops.pop()
+        loops.extend(action for action in current.actions if isinstance(action, ActiveLoop))
+        if not getattr(current, "concurrent", False):
+            continue
+        run = []
+        for index, action in enumerate(current.actions + [None]):
+            if action is not None and can_read_concurrently(action):
+                run.append(index)
+                continue
+            if len(readout_groups([current.actions[i] for i in run])) > 1:
+                runs.append((current, run))
+            run = []
+
+    if not runs:
+        return lambda: None
+
+    threads = max(len(readout_groups([current.actions[i] for i in run])) for current, run in runs)
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="readout")
+    # later runs first, so that the indices of the earlier runs stay valid
+    for current, run in reversed(runs):
+        # not a job task: stripping it from a loop that was not restored would lose the parameters it reads
+        readout = ConcurrentReadout([current.actions[i] for i in run], executor)
+        current.actions[run[0]:run[-1] + 1] = [readout]
+        added.append((current, readout))
+
+    def restore():
+        for current, readout in added:
+            for index, action in enumerate(current.actions):
+                if action is readout:
+                    current.actions[index:index + 1] = readout.parameters
+                    break
+        executor.shutdown(wait=True)
+
+    return restore
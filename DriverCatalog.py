@@ -0,0 +1,392 @@
+"""
+On-disk catalog of the instrument drivers that ship with qcodes.
+
+Walking qcodes/instrument_drivers and importing every module to find its class takes many seconds and pulls all of
+the vendor libraries into the GUI process. The catalog only looks at the files (path, modification time), finds the
+class that represents each model by parsing the sources (see DriverScanner.py), and the module is imported only once
+somebody actually wants to create that instrument.
+"""
+
+import os
+import re
+import sys
+import json
+import threading
+import importlib
+import importlib.util
+
+from Helpers import get_subfolders, get_files_in_folder
+from StartupProfiler import profiler
+from DriverScanner import scan_driver_sources, find_instrument_classes, pick_instrument_class, list_python_files, \
+    INSTRUMENT_BASE_CLASSES
+
+
+# bump this if the layout of the catalog file changes, old catalogs are then simply rebuilt
+CATALOG_FORMAT = 3
+
+# folder (next to the GUI sources) where all cached data of the GUI is kept
+CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+CATALOG_FILE = os.path.join(CACHE_FOLDER, "driver_catalog.json")
+
+
+def get_drivers_path():
+    """
+    Find the location of qcodes/instrument_drivers without importing qcodes (importing qcodes takes a while)
+
+    :return: path to the instrument_drivers folder of the installed qcodes package
+    """
+    spec = importlib.util.find_spec("qcodes")
+    if spec is None or not spec.submodule_search_locations:
+        raise ImportError("qcodes is not installed")
+    return os.path.join(list(spec.submodule_search_locations)[0], "instrument_drivers")
+
+
+def get_qcodes_version():
+    """
+    Fetch the version of installed qcodes, if possible from package metadata so that qcodes does not get imported
+
+    :return: string representing qcodes version
+    """
+    try:
+        from importlib.metadata import version
+        return version("qcodes")
+    except Exception:
+        import qcodes
+        return str(getattr(qcodes, "__version__", "unknown"))
+
+
+def module_name_from_path(drivers_path, file_path):
+    """
+    :param drivers_path: path to the qcodes instrument_drivers folder
+    :param file_path: path to a python file somewhere within that folder
+    :return: full module path of that file (qcodes.instrument_drivers.brand.model)
+    """
+    parts = os.path.relpath(file_path, drivers_path)[:-3].split(os.sep)
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(["qcodes", "instrument_drivers"] + parts)
+
+
+class DriverCatalog:
+    """
+    Keeps track of all driver modules of qcodes. For each driver file it keeps the brand, model, module path, the name
+    of the class that represents that instrument and the modification time of the file at the moment it was cataloged.
+
+    Data is saved to CATALOG_FILE and reused the next time the GUI is started. Entries are revalidated by comparing
+    modification times of the files, and the whole catalog is dropped if qcodes version changes.
+    """
+    def __init__(self, cache_file=CATALOG_FILE):
+        """
+        Constructor for the DriverCatalog class
+
+        :param cache_file: location of the file used to store catalog between sessions of the GUI
+        """
+        self.cache_file = cache_file
+
+        # drivers is a dict where key is the full module path (qcodes.instrument_drivers.brand.model) and value is a
+        # dict with the data about that driver (see self.describe_driver)
+        self.drivers = {}
+
+        # results of parsing every python file in the instrument_drivers folder (including private folders that are
+        # not listed as drivers, but contain base classes of the drivers). Key is the module path, value is a dict with
+        # path, mtime, classes (list of [class_name, [base_names]]), docstring of that module and class_docstrings
+        # (docstrings of the classes defined in it)
+        self.sources = {}
+        self.qcodes_version = None
+
+        # set to True if something in the catalog changed and it needs to be written to the disk
+        self.dirty = False
+
+        # base classes that are not defined in any driver file (qcodes and python classes), not looked for again
+        self.undefined_bases = set()
+
+        # brands are refreshed in worker threads when their menus are opened (see qcodesMainWindow), one refresh at a
+        # time, readers work on copies of self.drivers
+        self.lock = threading.RLock()
+
+        self.load()
+
+    """""""""""""""""""""
+    Data manipulation
+    """""""""""""""""""""
+    def load(self):
+        """
+        Load previously saved catalog from the disk. If the file does not exist or is broken, start with empty catalog
+
+        :return: NoneType
+        """
+        try:
+            with open(self.cache_file, "r") as cache:
+                data = json.load(cache)
+        except (OSError, ValueError):
+            return
+
+        if data.get("format") == CATALOG_FORMAT:
+            self.qcodes_version = data.get("qcodes_version")
+            self.drivers = data.get("drivers", {})
+            self.sources = data.get("sources", {})
+
+    def save(self):
+        """
+        Write the catalog to the disk (only if something has changed since it was loaded)
+
+        :return: NoneType
+        """
+        if not self.dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            # write to a temporary file first so that a crash in the middle of writing does not leave broken catalog
+            temp_file = self.cache_file + ".tmp"
+            with open(temp_file, "w") as cache:
+                json.dump({"format": CATALOG_FORMAT,
+                           "qcodes_version": self.qcodes_version,
+                           "drivers": self.drivers,
+                           "sources": self.sources}, cache, indent=1, sort_keys=True)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            print("Could not save driver catalog:", e)
+        else:
+            self.dirty = False
+
+    def refresh(self, brands=None):
+        """
+        Revalidate the catalog against the files that are currently in the qcodes instrument_drivers folder. Only stats
+        the files, nothing gets imported. Files that were added or modified get parsed again, files that were removed
+        get removed from the catalog.
+
+        Drivers inherit from classes defined in other brands and in private folders. Base classes that are not defined
+        in any parsed source are looked up in the rest of the instrument_drivers folder (see self.resolve_bases), only
+        the files defining them get parsed, not the whole folder.
+
+        :param brands: if specified, only revalidate drivers of these brands (used when populating a single menu)
+        :return: NoneType
+        """
+        with self.lock, profiler.measure("driver catalog refresh" + ("" if brands is None else " " + ", ".join(brands)),
+                                         category="drivers"):
+            self.revalidate(brands)
+
+    def revalidate(self, brands=None):
+        """
+        Does the actual work of self.refresh (see above)
+
+        :param brands: list of brands to revalidate, None meaning all of them
+        :return: NoneType
+        """
+        version = get_qcodes_version()
+        if version != self.qcodes_version:
+            # different qcodes, class names and file layout might be completely different, start from scratch
+            self.drivers = {}
+            self.sources = {}
+            self.undefined_bases = set()
+            self.qcodes_version = version
+            self.dirty = True
+
+        path = get_drivers_path()
+        full_scan = brands is None
+        if full_scan:
+            brands = get_subfolders(path, True)
+        else:
+            brands = [brand for brand in brands if os.path.isdir(os.path.join(path, brand))]
+
+        # stat all python files of the brands and collect the ones that have to be parsed (again)
+        found = set()
+        stale = {}
+        for brand in brands:
+            for file_path in list_python_files(os.path.join(path, brand)):
+                module_name = module_name_from_path(path, file_path)
+                try:
+                    mtime = os.path.getmtime(file_path)
+                except OSError:
+                    continue
+                found.add(module_name)
+                source = self.sources.get(module_name)
+                if source is None or source["mtime"] != mtime:
+                    stale[file_path] = (module_name, mtime)
+        self.parse_sources(stale)
+
+        for module_name, source in list(self.sources.items()):
+            brand = module_name.split(".")[2]
+            # sources parsed to resolve base classes (private folders) are dropped only if their file is gone
+            if (full_scan or brand in brands) and module_name not in found and not os.path.isfile(source["path"]):
+                del self.sources[module_name]
+                self.drivers.pop(module_name, None)
+                self.dirty = True
+
+        if stale or self.dirty:
+            self.resolve_bases(path, brands)
+            self.update_drivers(path, brands)
+
+        self.save()
+
+    def parse_sources(self, files):
+        """
+        Parse files and store the results in self.sources
+
+        :param files: dict of file location : (module path, modification time)
+        :return: NoneType
+        """
+        for file_path, result in scan_driver_sources(files).items():
+            module_name, mtime = files[file_path]
+            self.sources[module_name] = {"path": file_path,
+                                         "mtime": mtime,
+                                         "classes": result["classes"],
+                                         "docstring": result["docstring"],
+                                         "class_docstrings": result["class_docstrings"]}
+            self.dirty = True
+
+    def missing_bases(self, brands):
+        """
+        :param brands: list of brands
+        :return: set of names of base classes (direct or trough other classes) of the classes of the brands that are not
+                defined in any parsed source
+        """
+        bases_by_class = {}
+        for source in self.sources.values():
+            for class_name, bases in source["classes"]:
+                bases_by_class.setdefault(class_name, set()).update(bases)
+
+        missing = set()
+        visited = set()
+        pending = [class_name for module_name, source in self.sources.items() if module_name.split(".")[2] in brands
+                   for class_name, bases in source["classes"]]
+        while pending:
+            class_name = pending.pop()
+            if class_name in visited or class_name in INSTRUMENT_BASE_CLASSES:
+                continue
+            visited.add(class_name)
+            if class_name not in bases_by_class:
+                missing.add(class_name)
+                continue
+            pending.extend(bases_by_class[class_name])
+        return missing
+
+    def resolve_bases(self, path, brands):
+        """
+        Parse the files (anywhere in the instrument_drivers folder) that define base classes of the classes of the
+        brands, if those are not parsed yet. Files are searched for the class definitions as text, only the files that
+        define one of the missing classes get parsed. Repeated until the bases of the newly parsed classes are found.
+
+        :param path: path to the qcodes instrument_drivers folder
+        :param brands: list of brands whose classes need their bases
+        :return: NoneType
+        """
+        searched = set(self.undefined_bases)
+        while True:
+            missing = self.missing_bases(brands) - searched
+            if not missing:
+                return
+            searched.update(missing)
+            definition = re.compile(r"^class\s+(?:{})\b".format("|".join(re.escape(name) for name in missing)),
+                                    re.MULTILINE)
+            files = {}
+            for file_path in list_python_files(path):
+                module_name = module_name_from_path(path, file_path)
+                if module_name in self.sources or module_name == "qcodes.instrument_drivers":
+                    continue
+                try:
+                    with open(file_path, "r", encoding="utf-8", errors="ignore") as source_file:
+                        if definition.search(source_file.read()):
+                            files[file_path] = (module_name, os.path.getmtime(file_path))
+                except OSError:
+                    continue
+            self.parse_sources(files)
+            # classes of qcodes itself (and of python) are not defined in any driver, they are not looked for again
+            self.undefined_bases.update(missing & self.missing_bases(brands))
+
+    def update_drivers(self, path, brands):
+        """
+        Recreate driver entries of the brands from the parsed sources. Instrument classes are resolved across all parsed
+        sources because drivers often inherit from classes defined in other (private) modules.
+
+        :param path: path to the qcodes instrument_drivers folder
+        :param brands: list of brands whose driver entries should be updated
+        :return: NoneType
+        """
+        instruments = find_instrument_classes(self.sources)
+        for brand in brands:
+            for model in get_files_in_folder(os.path.join(path, brand), True):
+                if not model.endswith(".py"):
+                    continue
+                module_name = "qcodes.instrument_drivers." + brand + "." + model[:-3]
+                source = self.sources.get(module_name)
+                if source is None:
+                    continue
+                entry = self.describe_driver(brand, model[:-3], module_name, source, instruments)
+                if self.drivers.get(module_name) != entry:
+                    self.drivers[module_name] = entry
+                    self.dirty = True
+
+    @staticmethod
+    def describe_driver(brand, model, module_name, source, instruments):
+        """
+        Create catalog entry for a single driver file
+
+        :param brand: name of the folder the driver is in (manufacturer)
+        :param model: name of the driver file without extension
+        :param module_name: full module path that is used to import the driver
+        :param source: parsed data of the driver file (see self.sources)
+        :param instruments: set of names of all classes that are instruments
+        :return: dict with data about the driver
+        """
+        return {"brand": brand,
+                "model": model,
+                "module": module_name,
+                "path": source["path"],
+                "mtime": source["mtime"],
+                # name of the class that represents the instrument, None if the file does not define an instrument
+                "class": pick_instrument_class(model, source["classes"], instruments),
+                "classes": [name for name, bases in source["classes"] if name in instruments]}
+
+    """""""""""""""""""""
+    Helper functions
+    """""""""""""""""""""
+    def find(self, model):
+        """
+        Find catalog entry of a model (name of the driver file)
+
+        :param model: name of the driver file without extension
+        :return: dict with data about the driver, or None if there is no such model
+        """
+        for entry in list(self.drivers.values()):
+            if entry["model"] == model:
+                return entry
+        return None
+
+    def models(self, brand=None):
+        """
+        Get entries for all cataloged models that define an instrument class, sorted by brand and model name
+
+        :param brand: if specified, return only models of this brand
+        :return: list of catalog entries
+        """
+        entries = [entry for entry in list(self.drivers.values())
+                   if entry["class"] is not None and (brand is None or entry["brand"] == brand)]
+        return sorted(entries, key=lambda entry: (entry["brand"].lower(), entry["model"].lower()))
+
+    def brands(self):
+        """
+        :return: sorted list of all brands that have at least one driver in the catalog
+        """
+        return sorted(set(entry["brand"] for entry in list(self.drivers.values()) if entry["class"] is not None),
+                      key=str.lower)
+
+    def is_empty(self):
+        """
+        :return: True if nothing has been cataloged yet (GUI is started for the first time or qcodes was updated)
+        """
+        return not self.drivers
+
+    @staticmethod
+    def load_class(entry):
+        """
+        Import the module of the driver and fetch the class that represents the instrument. This is the only place
+        where the driver actually gets imported.
+
+        :param entry: catalog entry of the driver
+        :return: class of the instrument
+        """
+        module = sys.modules.get(entry["module"])
+        if module is None:
+            module = importlib.import_module(entry["module"])
+        return getattr(module, entry["class"])
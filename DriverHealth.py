@@ -0,0 +1,150 @@
+"""
+Background check of which qcodes drivers can actually be imported on this machine.
+
+Each driver is test-imported in its own python process running at low priority, so a driver that crashes the
+interpreter (broken vendor DLL) or hangs can not take down the GUI. Results are cached per qcodes version and used to
+enable or disable entries of the "Add instrument" menu.
+"""
+
+import os
+import sys
+import json
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from StartupProfiler import profiler
+from DriverCatalog import CACHE_FOLDER, get_qcodes_version
+
+
+HEALTH_FILE = os.path.join(CACHE_FOLDER, "driver_health.json")
+
+# how long a single driver is allowed to take to import before it's declared broken
+IMPORT_TIMEOUT = 120
+
+# code executed by the child process, imports the module and checks that the class of the instrument exists
+CHECK_SCRIPT = "import importlib, sys; getattr(importlib.import_module(sys.argv[1]), sys.argv[2])"
+
+
+def low_priority(command):
+    """
+    Make a command run with lower priority than the GUI. On POSIX the command is started trough nice instead of using
+    preexec_fn, which is not safe to use in a process with threads (checks are started from a thread pool).
+
+    :param command: list of arguments of the command
+    :return: tuple (list of arguments, kwargs for subprocess.run)
+    """
+    if sys.platform == "win32":
+        return command, {"creationflags": subprocess.BELOW_NORMAL_PRIORITY_CLASS | subprocess.CREATE_NO_WINDOW}
+    nice = shutil.which("nice")
+    if nice is None:
+        return command, {}
+    return [nice, "-n", "10"] + command, {}
+
+
+def check_driver(entry):
+    """
+    Test import of a single driver in a separate process
+
+    :param entry: catalog entry of the driver
+    :return: tuple (ok, error) where ok is True if the driver was imported without problems and error is the last line
+            of the error output otherwise
+    """
+    command, options = low_priority([sys.executable, "-c", CHECK_SCRIPT, entry["module"], entry["class"]])
+    try:
+        process = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=IMPORT_TIMEOUT,
+                                 **options)
+    except subprocess.TimeoutExpired:
+        return False, "Import did not finish within {} seconds".format(IMPORT_TIMEOUT)
+    except OSError as e:
+        return False, str(e)
+
+    if process.returncode == 0:
+        return True, ""
+    lines = process.stderr.decode(errors="replace").strip().splitlines()
+    return False, lines[-1] if lines else "Process exited with code {}".format(process.returncode)
+
+
+class DriverHealth:
+    """
+    Keeps results of driver import checks. Results are saved in HEALTH_FILE, separately for every qcodes version, and
+    are invalidated if the driver file is modified.
+    """
+    def __init__(self, health_file=HEALTH_FILE):
+        """
+        Constructor of the DriverHealth class
+
+        :param health_file: location of the file where results are stored between the sessions
+        """
+        self.health_file = health_file
+        # dict with qcodes versions as keys, values are dicts with module path as key and dict containing "ok",
+        # "error" and "mtime" (mtime of the driver file at the time it was checked) as value
+        self.results = {}
+        self.qcodes_version = get_qcodes_version()
+        self.load()
+
+    def load(self):
+        """
+        Load results of previous checks from the disk
+
+        :return: NoneType
+        """
+        try:
+            with open(self.health_file, "r") as health:
+                self.results = json.load(health)
+        except (OSError, ValueError):
+            self.results = {}
+
+    def save(self):
+        """
+        Save results of the checks to the disk
+
+        :return: NoneType
+        """
+        try:
+            os.makedirs(os.path.dirname(self.health_file), exist_ok=True)
+            temp_file = self.health_file + ".tmp"
+            with open(temp_file, "w") as health:
+                json.dump(self.results, health, indent=1, sort_keys=True)
+            os.replace(temp_file, self.health_file)
+        except OSError as e:
+            print("Could not save driver health results:", e)
+
+    def status(self, entry):
+        """
+        Get the result of the last check of a driver
+
+        :param entry: catalog entry of the driver
+        :return: dict with "ok" and "error" keys, or None if the driver has not been checked (since it was modified)
+        """
+        result = self.results.get(self.qcodes_version, {}).get(entry["module"])
+        if result is None or result["mtime"] != entry["mtime"]:
+            return None
+        return result
+
+    def check_all(self, entries, max_workers=None):
+        """
+        Check all drivers that have no valid result yet. Meant to be ran in a worker thread, every import is done in a
+        separate process. Blocks until all checks are done.
+
+        :param entries: list of catalog entries to check, taken from the catalog in the GUI thread (the catalog itself
+                is neither refreshed nor saved from here, only the GUI thread writes its cache)
+        :param max_workers: number of drivers checked at the same time, defaults to half of the processors
+        :return: dict with module paths of newly checked drivers as keys and their results as values
+        """
+        pending = [entry for entry in entries if self.status(entry) is None]
+        if not pending:
+            return {}
+
+        if max_workers is None:
+            max_workers = max(1, (os.cpu_count() or 2) // 2)
+
+        checked = {}
+        with profiler.measure("driver health check ({} drivers)".format(len(pending)), category="drivers"):
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for entry, (ok, error) in zip(pending, executor.map(check_driver, pending)):
+                    checked[entry["module"]] = {"ok": ok, "error": error, "mtime": entry["mtime"]}
+
+        self.results.setdefault(self.qcodes_version, {}).update(checked)
+        self.save()
+        return checked
@@ -0,0 +1,168 @@
+"""
+Static discovery of instrument classes in qcodes driver sources.
+
+Driver files are parsed with the ast module instead of being imported, so finding the class that represents an
+instrument does not execute any driver code (and does not need vendor libraries to be installed). Only the standard
+library is used here so that the module can be loaded cheaply by the worker processes that scan files in parallel.
+"""
+
+import os
+import ast
+from concurrent.futures import ProcessPoolExecutor
+
+
+# names of the qcodes base classes, any class that (directly or trough other classes) inherits from one of these is
+# considered to be an instrument
+INSTRUMENT_BASE_CLASSES = {"Instrument", "VisaInstrument", "IPInstrument"}
+
+# scanning in separate processes pays off only if there is a lot of files to scan (starting processes takes time)
+PARALLEL_SCAN_THRESHOLD = 40
+
+
+def base_name(node):
+    """
+    Get the name of a base class from the ast node representing it, "qcodes.VisaInstrument" and "VisaInstrument" both
+    return "VisaInstrument"
+
+    :param node: ast node from the bases list of a class definition
+    :return: name of the base class or None if it can't be determined statically
+    """
+    if isinstance(node, ast.Name):
+        return node.id
+    elif isinstance(node, ast.Attribute):
+        return node.attr
+    elif isinstance(node, ast.Subscript):
+        # Generic[...] style bases
+        return base_name(node.value)
+    return None
+
+
+def scan_driver_source(path):
+    """
+    Parse a single python file and collect all top level class definitions from it together with the names of their
+    base classes. File is never imported.
+
+    :param path: location of the python file
+    :return: dict with "classes" (list of [class_name, [base_names]]), "docstring" (docstring of the module) and
+            "class_docstrings" (dict with class names as keys and their docstrings as values)
+    """
+    try:
+        with open(path, "rb") as source_file:
+            tree = ast.parse(source_file.read(), filename=path)
+    except (OSError, SyntaxError, ValueError) as e:
+        return {"classes": [], "docstring": "", "class_docstrings": {}, "error": str(e)}
+
+    classes = []
+    class_docstrings = {}
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef):
+            bases = [base_name(base) for base in node.bases]
+            classes.append([node.name, [base for base in bases if base is not None]])
+            class_docstrings[node.name] = ast.get_docstring(node) or ""
+    return {"classes": classes, "docstring": ast.get_docstring(tree) or "", "class_docstrings": class_docstrings}
+
+
+def scan_driver_sources(paths):
+    """
+    Scan multiple files, uses a pool of processes if there are many files to scan (parsing is CPU bound so threads
+    would not help here).
+
+    :param paths: list of file locations
+    :return: dict where keys are file locations and values are results of scan_driver_source for that file
+    """
+    paths = list(paths)
+    if len(paths) >= PARALLEL_SCAN_THRESHOLD:
+        try:
+            with ProcessPoolExecutor() as executor:
+                return dict(zip(paths, executor.map(scan_driver_source, paths, chunksize=8)))
+        except Exception as e:
+            # process pool can't be started in some environments (frozen apps, restricted systems), do it here then
+            print("Parallel driver scan failed, scanning sequentially:", e)
+    return {path: scan_driver_source(path) for path in paths}
+
+
+def find_instrument_classes(sources):
+    """
+    Figure out which of the classes found in the sources are instruments. A class is an instrument if one of its bases
+    is one of INSTRUMENT_BASE_CLASSES or a class that is an instrument itself. Bases are matched by name across all of
+    the scanned sources, so driver classes that inherit from classes in other files (private folders) are also found.
+
+    :param sources: dict of scan results (see scan_driver_source) of all scanned files
+    :return: set of names of classes that are instruments
+    """
+    bases_by_class = {}
+    for source in sources.values():
+        for class_name, bases in source["classes"]:
+            bases_by_class.setdefault(class_name, set()).update(bases)
+
+    instruments = set()
+    resolving = set()
+
+    def is_instrument(class_name):
+        if class_name in INSTRUMENT_BASE_CLASSES or class_name in instruments:
+            return True
+        # protect against classes with the same name in different files inheriting from each other
+        if class_name in resolving or class_name not in bases_by_class:
+            return False
+        resolving.add(class_name)
+        result = any(is_instrument(base) for base in bases_by_class[class_name])
+        resolving.discard(class_name)
+        if result:
+            instruments.add(class_name)
+        return result
+
+    for class_name in bases_by_class:
+        is_instrument(class_name)
+    return instruments
+
+
+def pick_instrument_class(model, classes, instruments):
+    """
+    From all instrument classes defined in a driver file pick the one that represents the instrument
+
+    Preference: class that has the same name as the file, then the one whose name shares the most with the name of
+    the file, then classes that are not base classes of other classes in the same file (most derived ones).
+
+    :param model: name of the driver file without extension
+    :param classes: list of [class_name, [base_names]] defined in that file
+    :param instruments: names of all classes that are instruments (see find_instrument_classes)
+    :return: name of the class, or None if the file does not define any instrument
+    """
+    candidates = [name for name, bases in classes if name in instruments and not name.startswith("_")]
+    if not candidates:
+        return None
+    if model in candidates:
+        return model
+
+    used_as_base = set()
+    for name, bases in classes:
+        used_as_base.update(bases)
+
+    def similarity(name):
+        # length of the longest common substring of the class name and the file name (case insensitive)
+        a, b = name.lower(), model.lower()
+        best = 0
+        for i in range(len(a)):
+            for j in range(i + best + 1, len(a) + 1):
+                if a[i:j] in b:
+                    best = j - i
+                else:
+                    break
+        return best
+
+    # max returns the first of the equally good ones, meaning the one defined first in the file
+    return max(candidates, key=lambda name: (similarity(name), name not in used_as_base))
+
+
+def list_python_files(folder):
+    """
+    Find all python files in a folder and its subfolders (private folders of the brands contain base classes)
+
+    :param folder: path to the folder
+    :return: list of file locations
+    """
+    found = []
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = [directory for directory in dirs if directory != "__pycache__"]
+        found.extend(os.path.join(root, name) for name in files if name.endswith(".py"))
+    return found
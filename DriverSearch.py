@@ -0,0 +1,169 @@
+"""
+Type-ahead search over the instrument drivers.
+
+Index is built from the driver catalog (class name, model, brand, module path and keywords from the docstrings of the
+driver module and class), no driver gets imported. Every word typed has to match one of the indexed fields, either as
+a whole word, as the start of a word, somewhere inside a word, or (for class and model names) as a subsequence of
+letters, so "sr8" finds SR830 and "kt2600" finds Keithley_2600. Results of the previous query are reused while the user
+keeps typing, so every keystroke only has to look at the drivers that still match.
+"""
+
+import re
+import time
+
+
+# how much a match in each of the fields is worth
+FIELD_WEIGHTS = {"name": 4, "brand": 3, "module": 2, "keyword": 1}
+
+# how much each kind of match is worth (multiplied by the weight of the field)
+EXACT, PREFIX, SUBSTRING, SUBSEQUENCE = 8, 4, 2, 1
+
+# number of words taken from docstrings (start of the docstring describes the instrument, the rest is usually details)
+MAX_KEYWORDS = 40
+
+# words that are in almost every docstring and would match everything
+STOP_WORDS = {"the", "and", "for", "this", "that", "with", "driver", "instrument", "qcodes", "class", "from", "are",
+              "can", "not", "will", "use", "used", "args", "kwargs", "name", "address", "see", "also", "which", "has",
+              "have", "should", "all", "only", "must", "its", "into", "other", "when", "there", "more", "some"}
+
+WORD = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """
+    :param text: any text
+    :return: list of lowercase words (letters and digits) in the text, CamelCase and snake_case are split too
+    """
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    return WORD.findall(text.lower())
+
+
+def subsequence_pattern(query):
+    """
+    :param query: single word of the query
+    :return: compiled regex that matches any text containing all characters of the query in the same order
+    """
+    return re.compile(".*?".join(re.escape(character) for character in query))
+
+
+class DriverSearchIndex:
+    """
+    In-memory search index over the drivers
+    """
+    def __init__(self):
+        # key (name shown to the user, model of the driver) : list of (word, field) pairs of that driver
+        self.words = {}
+        # key : name of the driver without separators, lowercase (used for subsequence matching)
+        self.compact_names = {}
+        # key : all words of the driver joined in a single string, used to quickly skip drivers that can't match
+        self.haystacks = {}
+        # query and results of the last search, reused if the next query extends this one
+        self.last_query = None
+        self.last_results = []
+        # duration (seconds) of the last search
+        self.last_duration = 0
+
+    def add(self, key, class_name="", brand="", module="", docstring=""):
+        """
+        Add a driver to the index
+
+        :param key: name under which the driver is shown to the user (model of the driver)
+        :param class_name: name of the class that represents the instrument
+        :param brand: brand (folder) of the driver
+        :param module: full module path of the driver
+        :param docstring: docstrings of the module and of the class, source of keywords
+        :return: NoneType
+        """
+        words = {}
+        for word in tokenize(key) + tokenize(class_name):
+            words[word] = "name"
+        for word in tokenize(brand):
+            words.setdefault(word, "brand")
+        for word in tokenize(module):
+            words.setdefault(word, "module")
+        keywords = [word for word in tokenize(docstring) if len(word) > 2 and word not in STOP_WORDS]
+        for word in keywords[:MAX_KEYWORDS]:
+            words.setdefault(word, "keyword")
+        self.words[key] = list(words.items())
+        self.haystacks[key] = " ".join(words)
+        self.compact_names[key] = "".join(tokenize(key)) + " " + "".join(tokenize(class_name))
+        self.last_query = None
+
+    @classmethod
+    def from_catalog(cls, catalog, extra=()):
+        """
+        Build an index containing all drivers from the catalog
+
+        :param catalog: DriverCatalog
+        :param extra: names of additional instruments (not from qcodes) that should be searchable too
+        :return: DriverSearchIndex
+        """
+        index = cls()
+        for name in extra:
+            index.add(name, name)
+        for entry in catalog.models():
+            source = catalog.sources.get(entry["module"], {})
+            docstring = source.get("docstring", "") + " " + \
+                source.get("class_docstrings", {}).get(entry["class"], "")
+            index.add(entry["model"], entry["class"], entry["brand"], entry["module"], docstring)
+        return index
+
+    def score_term(self, key, term, pattern):
+        """
+        :param key: driver that is being scored
+        :param term: single word of the query
+        :param pattern: subsequence pattern of the word (see subsequence_pattern)
+        :return: how good the driver matches the word, 0 if it doesn't match at all
+        """
+        if term not in self.haystacks[key]:
+            # no word contains the term, only a subsequence of the name can still match
+            return SUBSEQUENCE * FIELD_WEIGHTS["name"] if pattern.search(self.compact_names[key]) else 0
+        best = 0
+        for word, field in self.words[key]:
+            if word == term:
+                kind = EXACT
+            elif word.startswith(term):
+                kind = PREFIX
+            elif term in word:
+                kind = SUBSTRING
+            else:
+                continue
+            best = max(best, kind * FIELD_WEIGHTS[field])
+        return best
+
+    def search(self, query):
+        """
+        Find all drivers matching the query
+
+        :param query: text typed by the user
+        :return: list of keys of the matching drivers, best matches first. All drivers (sorted) if the query is empty
+        """
+        start = time.perf_counter()
+        # query is not split on CamelCase, user types in lowercase anyway
+        terms = WORD.findall(query.lower())
+        if not terms:
+            results = sorted(self.words, key=str.lower)
+        else:
+            # every driver matching the new query also matched the previous one if the user only typed more letters,
+            # so only previous results need to be checked
+            if self.last_query and " ".join(terms).startswith(self.last_query):
+                candidates = self.last_results
+            else:
+                candidates = self.words
+            patterns = [subsequence_pattern(term) for term in terms]
+            scored = []
+            for key in candidates:
+                total = 0
+                for term, pattern in zip(terms, patterns):
+                    score = self.score_term(key, term, pattern)
+                    if score == 0:
+                        break
+                    total += score
+                else:
+                    scored.append((-total, key.lower(), key))
+            scored.sort()
+            results = [key for _, _, key in scored]
+        self.last_query = " ".join(terms)
+        self.last_results = results
+        self.last_duration = time.perf_counter() - start
+        return results
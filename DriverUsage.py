@@ -0,0 +1,87 @@
+"""
+List of the most recently used instrument drivers, kept between sessions of the GUI.
+
+After the main window is shown, drivers from the top of this list are imported in the background, so that the
+instruments people connect every day are ready to be created by the time the AddInstrumentWidget is opened.
+"""
+
+import os
+import json
+import time
+
+from DriverCatalog import CACHE_FOLDER
+
+
+USAGE_FILE = os.path.join(CACHE_FOLDER, "driver_usage.json")
+
+# number of drivers imported in the background after the GUI starts
+PREFETCH_COUNT = 5
+
+# number of drivers remembered
+MAX_REMEMBERED = 50
+
+
+class DriverUsage:
+    """
+    Keeps track of when each driver was last used to create an instrument and how many times it was used
+    """
+    def __init__(self, usage_file=USAGE_FILE):
+        """
+        Constructor of the DriverUsage class
+
+        :param usage_file: location of the file where the usage is stored between the sessions
+        """
+        self.usage_file = usage_file
+        # dict with module path of the driver as key and dict with "last_used" (unix time) and "count" as value
+        self.drivers = {}
+        self.load()
+
+    def load(self):
+        """
+        Load usage from the previous sessions
+
+        :return: NoneType
+        """
+        try:
+            with open(self.usage_file, "r") as usage:
+                self.drivers = json.load(usage)
+        except (OSError, ValueError):
+            self.drivers = {}
+
+    def save(self):
+        """
+        Write usage to the disk
+
+        :return: NoneType
+        """
+        try:
+            os.makedirs(os.path.dirname(self.usage_file), exist_ok=True)
+            temp_file = self.usage_file + ".tmp"
+            with open(temp_file, "w") as usage:
+                json.dump(self.drivers, usage, indent=1, sort_keys=True)
+            os.replace(temp_file, self.usage_file)
+        except OSError as e:
+            print("Could not save driver usage:", e)
+
+    def record(self, module_name):
+        """
+        Remember that a driver was just used to create an instrument
+
+        :param module_name: full module path of the driver
+        :return: NoneType
+        """
+        usage = self.drivers.setdefault(module_name, {"last_used": 0, "count": 0})
+        usage["last_used"] = time.time()
+        usage["count"] += 1
+        # forget the drivers that were not used for the longest time
+        for module in self.most_recent()[MAX_REMEMBERED:]:
+            del self.drivers[module]
+        self.save()
+
+    def most_recent(self, count=None):
+        """
+        :param count: number of drivers to return, all of them if not specified
+        :return: list of module paths of the drivers, most recently used first
+        """
+        modules = sorted(self.drivers, key=lambda module: self.drivers[module]["last_used"], reverse=True)
+        return modules if count is None else modules[:count]
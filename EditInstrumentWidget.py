@@ -4,7 +4,7 @@ There u can find a set function for setting paramater defined by "name" to a val
 """
 
 from PyQt5.QtWidgets import QApplication, QWidget, QLineEdit, QPushButton, QLabel, QShortcut, QDesktopWidget, \
-    QRadioButton, QButtonGroup, QGroupBox, QHBoxLayout, QGridLayout, QVBoxLayout, QSizePolicy
+    QRadioButton, QButtonGroup, QGroupBox, QHBoxLayout, QGridLayout, QVBoxLayout, QSizePolicy, QInputDialog
 from PyQt5.QtCore import Qt, pyqtSlot
 
 import sys
@@ -12,11 +12,15 @@ import sys
 from Helpers import *
 from AddNewParameterWidget import AddNewParameterWidget
 from ThreadWorker import Worker, progress_func, print_output, thread_complete
+from Cancellation import current_token
 from EditInstrumentParametersWidget import EditInstrumentParameterWidget
-from qcodes.instrument_drivers.QuTech.IVVI import IVVI
-from qcodes.instrument_drivers.IST_devices.DAC20bit import IST_20
-# from qcodes.instrument_drivers.ZI.MFLI import MFLI
-# from qcodes.instrument_drivers.ZI.MFLIpoll import MFLIpoll
+
+# drivers that need special treatment in this window, they are not imported here (importing drivers takes time), instead
+# instances are checked with is_instance_of which only looks at the drivers that were already imported
+IVVI = ("qcodes.instrument_drivers.QuTech.IVVI", "IVVI")
+IST_20 = ("qcodes.instrument_drivers.IST_devices.DAC20bit", "IST_20")
+MFLI = ("qcodes.instrument_drivers.ZI.MFLI", "MFLI")
+MFLIpoll = ("qcodes.instrument_drivers.ZI.MFLIpoll", "MFLIpoll")
 
 
 class EditInstrumentWidget(QWidget):
@@ -65,6 +69,9 @@ class EditInstrumentWidget(QWidget):
         # references to buttons for editing inner parameters of each instrument parameter
         self.inner_parameter_btns = {}
 
+        # window showing latencies of this instrument (kept to not get garbage collected)
+        self.latency_window = None
+
         self.init_ui()
         self.show()
 
@@ -108,7 +115,7 @@ class EditInstrumentWidget(QWidget):
         label = QLabel("Applied", self)
         self.layout().addWidget(label, 2, 3, 1, 1)
 
-        if isinstance(self.instrument, IVVI):
+        if is_instance_of(self.instrument, *IVVI):
             params_to_show = {}
             params_to_show["timeout"] = getattr(self.instrument, "timeout")
             for i in range(self.instrument._numdacs):
@@ -165,7 +172,7 @@ class EditInstrumentWidget(QWidget):
 
         # setting the polarity of the dacs (specific for IVVI instrument)
         # i should make this a base class and extend for every "special needs" instrument
-        if isinstance(self.instrument, IVVI):
+        if is_instance_of(self.instrument, *IVVI):
             neg_label = QLabel("Neg", self)
             self.layout().addWidget(neg_label, row, 3, 1, 1)
             bip_label = QLabel("Bip", self)
@@ -215,7 +222,7 @@ class EditInstrumentWidget(QWidget):
                     start_y += 35
                     row += 1
 
-        if isinstance(self.instrument, IST_20):
+        if is_instance_of(self.instrument, *IST_20):
             reinit_dac_btn = QPushButton("Re init dacs")
             reinit_dac_btn.clicked.connect(self.reinit_dacs)
             self.layout().addWidget(reinit_dac_btn, row, 4, 1, 1)
@@ -243,6 +250,18 @@ class EditInstrumentWidget(QWidget):
 
         get_all_btn.clicked.connect(self.call_worker(self.update_parameters_data))
 
+        # maximum ramp rates of the parameters, used when moving them (see MovePlanner.py)
+        ramp_rate_btn = QPushButton("Ramp rates", self)
+        ramp_rate_btn.setToolTip("Set the maximum rate at which a parameter is ramped to new values")
+        self.layout().addWidget(ramp_rate_btn, row+1, 4, 1, 1)
+        ramp_rate_btn.clicked.connect(self.edit_ramp_rate)
+
+        # timings of gets and sets of the parameters of this instrument (see LatencyMonitor.py)
+        latency_btn = QPushButton("Latency", self)
+        latency_btn.setToolTip("Show how long gets and sets of the parameters of this instrument take")
+        self.layout().addWidget(latency_btn, row+1, 3, 1, 1)
+        latency_btn.clicked.connect(self.show_latencies)
+
         # if u click this button u get a house and a car on Bahamas, also your partner suddenly becomes the most
         # attractive person in the world, in addition to this you get a Nobel prize for whatever u want ... Easy life
         ok_btn = QPushButton("Close", self)
@@ -358,7 +377,7 @@ class EditInstrumentWidget(QWidget):
             if full_name in self.dividers:
                 self.textboxes[name].setText(str(round(self.instrument.parameters[name].get_latest() / self.dividers[full_name].division_value, 3)))
             else:
-                if isinstance(self.instrument, MFLI) or isinstance(self.instrument, MFLIpoll):
+                if is_instance_of(self.instrument, *MFLI) or is_instance_of(self.instrument, *MFLIpoll):
                     self.textboxes[name].setText(str(round(self.instrument.parameters[name].get(), 9)))
                 else:
                     if is_numeric(self.instrument.parameters[name].get_latest()):
@@ -408,9 +427,18 @@ class EditInstrumentWidget(QWidget):
 
         :return: NoneType
         """
+        # parameters with ramp rates are ramped to zero (all at the same time) instead of jumping there
+        planner = self.get_move_planner()
+        moves = [(parameter, 0) for name, parameter in self.instrument.parameters.items()
+                 if hasattr(parameter, "set") and name != "timeout" and is_numeric(parameter.get_latest())]
+        if hasattr(self.instrument, "set_dacs_zero"):
+            # instrument zeroes only its dacs, other settings (dac_set_sleep, ...) must not be touched by the ramp either
+            moves = [(parameter, value) for parameter, value in moves if is_dac(parameter.name)]
+        if planner is not None and any(planner.ramp_rate(parameter)[1] for parameter, _ in moves):
+            planner.move(moves, should_stop=self.stop_check())
         # some instruments already have this method implemented, so why bother, on the other hand, some instruments
         # dont have it so i have to implement it anyway, wow, im so smart
-        if hasattr(self.instrument, "set_dacs_zero"):
+        elif hasattr(self.instrument, "set_dacs_zero"):
             self.instrument.set_dacs_zero()
         else:
             for name, parameter in self.instrument.parameters.items():
@@ -429,6 +457,8 @@ class EditInstrumentWidget(QWidget):
 
         :return: NoneType
         """
+        # numeric values are set together at the end, ramped if the parameters have ramp rates
+        moves = []
         for name, parameter in self.instrument.parameters.items():
             if hasattr(self.instrument.parameters[name], "set"):
                 if name in self.textboxes:
@@ -461,7 +491,10 @@ class EditInstrumentWidget(QWidget):
 
                         if is_valid:
                             if hasattr(parameter, "set"):
-                                self.instrument.set(parameter.name, set_value)
+                                if is_numeric(set_value) and not isinstance(set_value, str):
+                                    moves.append((parameter, set_value))
+                                else:
+                                    self.instrument.set(parameter.name, set_value)
                             else:
                                 show_error_message("Warning", "Parameter {} does not have a set function".format(full_name))
                         else:
@@ -470,7 +503,66 @@ class EditInstrumentWidget(QWidget):
                                                format(value, full_name))
                     except Exception as e:
                         show_error_message("Warning", str(e))
-        self.update_parameters_data()
+        planner = self.get_move_planner()
+        if planner is None or not moves:
+            try:
+                for parameter, set_value in moves:
+                    self.instrument.set(parameter.name, set_value)
+            except Exception as e:
+                show_error_message("Warning", str(e))
+            self.update_parameters_data()
+            return
+
+        # ramps can take long, they are done in a worker thread (stopped by STOP)
+        def move():
+            planner.move(moves, should_stop=self.stop_check())
+            self.update_parameters_data()
+
+        worker = self.make_worker(move)
+        worker.signals.error.connect(lambda error: show_error_message("Warning", str(error[1])))
+        self.thread_pool.start(worker)
+
+    def edit_ramp_rate(self):
+        """
+        Ask for a parameter of this instrument and the maximum rate it can be ramped with (0 removes the limit)
+
+        :return: NoneType
+        """
+        if self.parent is None or not hasattr(self.parent, "ramp_rates"):
+            return
+        names = [name for name, parameter in self.instrument.parameters.items()
+                 if hasattr(parameter, "set") and name in self.textboxes and is_numeric(self.textboxes[name].text())]
+        if not names:
+            show_error_message("Warning", "This instrument has no numeric parameters that can be set")
+            return
+        name, ok = QInputDialog.getItem(self, "Ramp rate", "Parameter:", names, 0, False)
+        if not ok:
+            return
+        full_name = str(self.instrument.parameters[name])
+        rate, ok = QInputDialog.getDouble(self, "Ramp rate",
+                                          "Max ramp rate of {} [units/s], 0 for no limit:".format(full_name),
+                                          self.parent.ramp_rates.get(full_name, 0), 0, 1e12, 6)
+        if not ok:
+            return
+        if rate > 0:
+            self.parent.ramp_rates[full_name] = rate
+        else:
+            self.parent.ramp_rates.pop(full_name, None)
+
+    def show_latencies(self):
+        """
+        Open a window with latency histograms of the gets and sets of this instrument and its parameters
+
+        :return: NoneType
+        """
+        from LatencyWidget import LatencyWidget
+
+        if self.parent is None or not hasattr(self.parent, "latency_monitor"):
+            show_error_message("Warning", "Latencies are only recorded for instruments added to the main window")
+            return
+        # parameters added after the instrument was created are not timed yet
+        self.parent.latency_monitor.instrument(self.instrument)
+        self.latency_window = LatencyWidget(self.parent.latency_monitor, self.instrument_name, self)
 
     """""""""""""""""""""
     Helper functions
@@ -484,7 +576,7 @@ class EditInstrumentWidget(QWidget):
         """
         def instantiate_worker():
             # creata a new worker, False meaning that it is not a looping worker, it only does its thing once
-            worker = Worker(func, False)
+            worker = self.make_worker(func)
             worker.signals.result.connect(print_output)
             worker.signals.finished.connect(thread_complete)
             worker.signals.progress.connect(progress_func)
@@ -493,6 +585,32 @@ class EditInstrumentWidget(QWidget):
 
         return instantiate_worker
 
+    def make_worker(self, func):
+        """
+        :param func: function to be ran once in a separate thread
+        :return: Worker whose token is cancelled by the STOP button of the main window (if opened from it)
+        """
+        worker = Worker(func, False)
+        if self.parent is not None and hasattr(self.parent, "stop_token"):
+            worker.token = self.parent.stop_token.child(name=getattr(func, "__name__", "") + " " + self.instrument_name)
+        return worker
+
+    @staticmethod
+    def stop_check():
+        """
+        :return: function returning True once the worker running the caller has been stopped, None outside of workers
+        """
+        token = current_token()
+        return token.poll if token is not None else None
+
+    def get_move_planner(self):
+        """
+        :return: MovePlanner of the main window, None if this window was not opened from the main window
+        """
+        if self.parent is None or not hasattr(self.parent, "get_move_planner"):
+            return None
+        return self.parent.get_move_planner()
+
     def closeEvent(self, a0: QtGui.QCloseEvent):
         # overriding close method to remove self from list of active windows, obviously if one is closed, one is no
         # longer active, is that obvious only to me ? It should be to everyone right ? Right ?
@@ -501,7 +619,7 @@ class EditInstrumentWidget(QWidget):
     def toggle_live(self):
         # if the widget is currently in live mode, turn of the live mode and kill all+delete all workers.
         if self.live:
-            self.worker.stop_requested = True
+            self.worker.stop()
             self.go_live_btn.setText("Go live")
             self.worker = None
             for tb in self.textboxes:
@@ -515,6 +633,9 @@ class EditInstrumentWidget(QWidget):
             for tb in self.textboxes:
                 self.textboxes[tb].setDisabled(True)
             self.worker = Worker(self.update_parameters_data, True)
+            # STOP on the main window stops all live updates at once
+            if hasattr(self.parent, "live_updates_token"):
+                self.worker.token = self.parent.live_updates_token.child(name="live " + self.instrument.name)
             self.thread_pool.start(self.worker)
             self.live = True
 
@@ -2,8 +2,8 @@ from PyQt5.QtWidgets import QMessageBox, QTreeWidget, QTreeWidgetItem
 from PyQt5 import QtGui
 
 import os
+import sys
 import importlib
-from qcodes.loops import ActiveLoop
 
 
 def show_error_message(title, message):
@@ -58,14 +58,90 @@ def get_plot_parameter(loop):
     :param loop: instance of a loop class
     :return: full name of loops action parameter
     """
-    action = loop.actions[0]
+    from qcodes.loops import ActiveLoop
+    from ConcurrentReadout import ConcurrentReadout
+
+    # actions added only for a single run (settle times, ...) are not plotted
+    action = [action for action in loop.actions if not getattr(action, "job_task", False)][0]
 
     if isinstance(action, ActiveLoop):
         return get_plot_parameter(action)
+    # parameters read concurrently keep their own arrays in the data set (see ConcurrentReadout)
+    elif isinstance(action, ConcurrentReadout):
+        return action.parameters[0]
     else:
         return action
 
 
+def parameter_instruments(parameter):
+    """
+    Find the instruments a parameter talks to when it is set or read. Dividers are followed to the parameter they are
+    attached to, combined parameters to all of the parameters they combine.
+
+    :param parameter: qcodes parameter (or a divider)
+    :return: set of names of the instruments, contains "*" if the owner of the parameter can't be determined
+    """
+    # VoltageDivider and similar wrappers keep the wrapped parameter in v1
+    if hasattr(parameter, "v1"):
+        return parameter_instruments(parameter.v1)
+    # CombinedParameter keeps the parameters it combines in a list
+    if hasattr(parameter, "parameters") and isinstance(parameter.parameters, (list, tuple)):
+        instruments = set()
+        for inner_parameter in parameter.parameters:
+            instruments.update(parameter_instruments(inner_parameter))
+        return instruments
+    instrument = getattr(parameter, "_instrument", None)
+    if instrument is None:
+        return {"*"}
+    # channels of an instrument share the connection of the instrument itself
+    while getattr(instrument, "_parent", None) is not None:
+        instrument = instrument._parent
+    return {instrument.name}
+
+
+def get_loop_instruments(loop):
+    """
+    Recursive function that collects all instruments a loop talks to: instrument of the sweep parameter, instruments
+    of all action parameters and of all loops inside of this loop. Tasks are not looked into (they are GUI helpers).
+
+    :param loop: instance of a loop class
+    :return: set of names of the instruments, contains "*" if some of the instruments can't be determined
+    """
+    from qcodes.loops import ActiveLoop
+    from qcodes.actions import Task, BreakIf
+
+    # combined parameters are used as sweep values directly, sweep values of other parameters wrap the parameter
+    sweep_values = loop.sweep_values
+    if not hasattr(sweep_values, "parameters"):
+        sweep_values = sweep_values.parameter
+    instruments = parameter_instruments(sweep_values)
+    for action in loop.actions:
+        if isinstance(action, ActiveLoop):
+            instruments.update(get_loop_instruments(action))
+        elif isinstance(action, (Task, BreakIf)) or getattr(action, "job_task", False):
+            continue
+        else:
+            instruments.update(parameter_instruments(action))
+    return instruments
+
+
+def is_instance_of(instance, module_name, class_name):
+    """
+    Check if instance is an instance of a class without importing the module that defines that class. If the module
+    has not been imported by anyone, no instance of that class can exist, so there is no need to import it (drivers
+    take a lot of time to import).
+
+    :param instance: object to check
+    :param module_name: full name of the module that defines the class (qcodes.instrument_drivers.QuTech.IVVI)
+    :param class_name: name of the class within that module
+    :return: True if instance is an instance of that class
+    """
+    module = sys.modules.get(module_name)
+    if module is None or not hasattr(module, class_name):
+        return False
+    return isinstance(instance, getattr(module, class_name))
+
+
 def is_numeric(value):
     """
     Function that quickly checks if some variable can be casted to float
@@ -80,6 +156,14 @@ def is_numeric(value):
         return False
 
 
+def is_dac(name):
+    """
+    :param name: name of an instrument parameter
+    :return: True if the parameter is one of the dacs of an instrument (dac1, dac2, ... as named by IVVI like drivers)
+    """
+    return name.startswith("dac") and name[3:].isdigit()
+
+
 class ViewTree(QTreeWidget):
     """
     Widget that displays content of a dictionary (including sub dicts, lists, etc.)
@@ -0,0 +1,175 @@
+"""
+Connecting to instruments without freezing the GUI.
+
+Creating an instrument object opens the VISA resource, asks the instrument for its IDN and reads initial values of
+parameters, which can take seconds (or forever if the address is wrong). InstrumentConnection runs that in a worker
+thread, enforces a timeout and allows the user to cancel the connection.
+"""
+
+from PyQt5.QtCore import QObject, QTimer, QThreadPool, pyqtSignal
+
+from ThreadWorker import Worker
+from Helpers import is_instance_of
+from BufferedAdapters import install_buffered_adapters
+
+
+# default number of seconds an instrument is allowed to take to connect
+DEFAULT_CONNECTION_TIMEOUT = 30
+
+
+def describe_connection_error(message):
+    """
+    Translate some of the common VISA errors to something a human can understand
+
+    :param message: error message raised while creating the instrument
+    :return: message to be displayed to the user
+    """
+    if "VI_ERROR_RSRC_NFOUND" in message:
+        return message + "\n\nTranslated to human language: Your address is probably incorrect"
+    if "VI_ERROR_TMO" in message:
+        return message + "\n\nTranslated to human language: Instrument did not respond in time"
+    return message
+
+
+def prepare_instrument(instrument):
+    """
+    Settings applied to every newly connected instrument before it's handed to the rest of the GUI
+
+    :param instrument: newly created instrument
+    :return: NoneType
+    """
+    if is_instance_of(instrument, "qcodes.instrument_drivers.QuTech.IVVI", "IVVI"):
+        for i in range(instrument._numdacs):
+            param_name = "dac" + str(i + 1)
+            parameter = instrument.parameters[param_name]
+            parameter.step = 100
+            parameter.inter_delay = 0
+    # lock-ins that can run loops as buffered sweeps with an adapter (see BufferedSweep)
+    install_buffered_adapters(instrument)
+
+
+def close_instrument(instrument):
+    """
+    Close an instrument that was created after its connection had been cancelled or had timed out (nobody wants it
+    anymore and it would block its name and address otherwise)
+
+    :param instrument: instance of the instrument
+    :return: NoneType
+    """
+    try:
+        instrument.close()
+    except Exception as e:
+        print("Could not close abandoned instrument:", e)
+
+
+class InstrumentConnection(QObject):
+    """
+    Creates a single instrument in a worker thread. Many of these can run at the same time.
+
+    Signals:
+        connected(name, instrument) emitted if the instrument was created in time
+        failed(name, message) emitted if creating failed, timed out or was cancelled
+    """
+    connected = pyqtSignal(str, object)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, name, factory, thread_pool=None, timeout=DEFAULT_CONNECTION_TIMEOUT, parent=None):
+        """
+        Constructor of the InstrumentConnection class
+
+        :param name: name of the instrument that is being created
+        :param factory: function without arguments that creates and returns the instrument (runs in a worker thread)
+        :param thread_pool: thread pool used to run the worker, global one is used if not passed
+        :param timeout: number of seconds to wait for the instrument, 0 or None means wait forever
+        :param parent: parent QObject
+        """
+        super(InstrumentConnection, self).__init__(parent)
+        self.name = name
+        self.factory = factory
+        self.thread_pool = thread_pool if thread_pool is not None else QThreadPool.globalInstance()
+        self.timeout = timeout
+
+        # one of: "waiting", "connecting", "connected", "failed", "cancelled", "timed out"
+        self.state = "waiting"
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(lambda: self.abandon("timed out",
+                                                        "Connecting to {} did not finish within {} seconds".format(
+                                                            self.name, self.timeout)))
+
+    def start(self):
+        """
+        Start creating the instrument in a worker thread and start the timeout timer
+
+        :return: NoneType
+        """
+        self.state = "connecting"
+        worker = Worker(self.factory, False)
+        worker.signals.result.connect(self.on_result)
+        worker.signals.error.connect(self.on_error)
+        self.thread_pool.start(worker)
+        if self.timeout:
+            self.timer.start(int(self.timeout * 1000))
+
+    def cancel(self):
+        """
+        Stop waiting for the instrument. The worker thread can not be killed, so if the instrument gets created after
+        this, it is closed immediately.
+
+        :return: NoneType
+        """
+        self.abandon("cancelled", "Connecting to {} was cancelled".format(self.name))
+
+    def abandon(self, state, message):
+        """
+        Give up on this connection and report failure
+
+        :param state: new state of the connection ("cancelled" or "timed out")
+        :param message: message explaining what happened
+        :return: NoneType
+        """
+        if self.state != "connecting":
+            return
+        self.state = state
+        self.timer.stop()
+        self.failed.emit(self.name, message)
+
+    def on_result(self, instrument):
+        """
+        Called (in the GUI thread) when the worker finishes creating the instrument
+
+        :param instrument: newly created instrument
+        :return: NoneType
+        """
+        if self.state != "connecting":
+            # connection was cancelled or has timed out meanwhile, nobody is waiting for this instrument anymore
+            if instrument is not None:
+                self.thread_pool.start(Worker(lambda: close_instrument(instrument), False))
+            return
+        self.timer.stop()
+        if instrument is None:
+            self.state = "failed"
+            self.failed.emit(self.name, "Instrument {} was not created".format(self.name))
+        else:
+            self.state = "connected"
+            self.connected.emit(self.name, instrument)
+
+    def on_error(self, error):
+        """
+        Called (in the GUI thread) if creating the instrument raised an exception
+
+        :param error: tuple (exctype, value, traceback) emitted by the worker
+        :return: NoneType
+        """
+        if self.state != "connecting":
+            return
+        self.timer.stop()
+        self.state = "failed"
+        self.failed.emit(self.name, describe_connection_error(str(error[1])))
+
+    def is_active(self):
+        """
+        :return: True if the instrument is still being created
+        """
+        return self.state in ("waiting", "connecting")
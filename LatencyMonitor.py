@@ -0,0 +1,300 @@
+"""
+Timing of every get and set of instrument parameters, with latency histograms per parameter and per instrument.
+
+Parameters of every instrument added to the main window are instrumented: their get and set are replaced by wrappers
+that time the original call (time.perf_counter) and record it. Everything that talks to the instrument trough its
+parameters is timed that way: EditInstrumentWidget buttons, SET ALL, live updates, loops (including dividers, which
+get and set the parameter they are attached to).
+
+Latencies are kept in histograms with logarithmic bins (BINS_PER_DECADE bins per decade between MIN_LATENCY and
+MAX_LATENCY, faster and slower calls go to the first and the last bin), together with exact count, mean, min and max.
+Histograms can be exported to CSV or JSON, and mean latencies are used to estimate durations of loops (see
+LoopEstimator.py).
+"""
+
+import csv
+import json
+import math
+import time
+import threading
+
+
+# range and resolution of the histograms (seconds)
+MIN_LATENCY = 1e-6
+MAX_LATENCY = 100.0
+BINS_PER_DECADE = 5
+
+
+def bin_edges():
+    """
+    :return: list of edges of the histogram bins (one more than there are bins)
+    """
+    decades = int(round(math.log10(MAX_LATENCY / MIN_LATENCY)))
+    return [MIN_LATENCY * 10 ** (i / BINS_PER_DECADE) for i in range(decades * BINS_PER_DECADE + 1)]
+
+
+class LatencyHistogram:
+    """
+    Histogram of latencies of one kind of call (get or set) of a parameter or of an instrument
+    """
+    def __init__(self):
+        self.edges = bin_edges()
+        self.counts = [0] * (len(self.edges) - 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, seconds):
+        """
+        :param seconds: latency of a single call
+        :return: NoneType
+        """
+        if seconds <= MIN_LATENCY:
+            index = 0
+        else:
+            index = int(math.log10(seconds / MIN_LATENCY) * BINS_PER_DECADE)
+            index = min(index, len(self.counts) - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    @property
+    def mean(self):
+        """
+        :return: mean latency, None if nothing has been recorded
+        """
+        return self.total / self.count if self.count else None
+
+    def percentile(self, fraction):
+        """
+        :param fraction: 0.5 for median, 0.95 for 95th percentile, ...
+        :return: upper edge of the bin in which the percentile falls (accurate to the bin width), None if empty
+        """
+        if not self.count:
+            return None
+        threshold = fraction * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= threshold:
+                return min(self.edges[index + 1], self.max)
+        return self.max
+
+    def to_dict(self):
+        """
+        :return: dict with statistics and the non empty bins of the histogram (used for exporting)
+        """
+        return {"count": self.count, "mean": self.mean, "min": self.min, "max": self.max,
+                "median": self.percentile(0.5), "p95": self.percentile(0.95),
+                "bins": [{"from": self.edges[i], "to": self.edges[i + 1], "count": count}
+                         for i, count in enumerate(self.counts) if count]}
+
+
+def instrument_name(parameter):
+    """
+    :param parameter: qcodes parameter
+    :return: name of the instrument the parameter belongs to (channels are counted to their instrument), "-" if none
+    """
+    instrument = getattr(parameter, "_instrument", None)
+    if instrument is None:
+        return "-"
+    while getattr(instrument, "_parent", None) is not None:
+        instrument = instrument._parent
+    return instrument.name
+
+
+class LatencyMonitor:
+    """
+    Records latencies of gets and sets of instrumented parameters. Thread safe (loops record from worker threads).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (full name of the parameter, "get" or "set") : LatencyHistogram
+        self.parameters = {}
+        # (name of the instrument, "get" or "set") : LatencyHistogram
+        self.instruments = {}
+        # full name of the parameter : name of its instrument
+        self.owners = {}
+        # parameters that have been instrumented, id of the parameter : (parameter, {"get": (original function, True if
+        # it was an instance attribute), "set": ...})
+        self.originals = {}
+
+    """""""""""""""""""""
+    Recording
+    """""""""""""""""""""
+    def record(self, parameter_name, instrument, kind, seconds):
+        """
+        :param parameter_name: full name of the parameter
+        :param instrument: name of the instrument of the parameter
+        :param kind: "get" or "set"
+        :param seconds: latency of the call
+        :return: NoneType
+        """
+        with self.lock:
+            self.owners[parameter_name] = instrument
+            for histograms, key in ((self.parameters, (parameter_name, kind)), (self.instruments, (instrument, kind))):
+                if key not in histograms:
+                    histograms[key] = LatencyHistogram()
+                histograms[key].add(seconds)
+
+    def timed(self, parameter, kind, function):
+        """
+        :param parameter: qcodes parameter
+        :param kind: "get" or "set"
+        :param function: original get or set of the parameter
+        :return: function that calls the original one and records how long it took (also if it failed)
+        """
+        name = str(parameter)
+        instrument = instrument_name(parameter)
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(name, instrument, kind, time.perf_counter() - start)
+
+        call.__name__ = getattr(function, "__name__", kind)
+        call.__doc__ = getattr(function, "__doc__", None)
+        return call
+
+    def instrument_parameter(self, parameter):
+        """
+        Replace get and set of the parameter with timed versions (nothing happens if it is already instrumented)
+
+        :param parameter: qcodes parameter
+        :return: NoneType
+        """
+        if id(parameter) in self.originals:
+            return
+        originals = {}
+        for kind in ("get", "set"):
+            function = getattr(parameter, kind, None)
+            if not callable(function):
+                continue
+            originals[kind] = (function, kind in parameter.__dict__)
+            setattr(parameter, kind, self.timed(parameter, kind, function))
+        self.originals[id(parameter)] = (parameter, originals)
+
+    def instrument(self, instrument):
+        """
+        Instrument all parameters of an instrument (and of its channels)
+
+        :param instrument: qcodes instrument
+        :return: NoneType
+        """
+        for name, parameter in instrument.parameters.items():
+            if name != "IDN":
+                self.instrument_parameter(parameter)
+        for submodule in getattr(instrument, "submodules", {}).values():
+            if hasattr(submodule, "parameters"):
+                self.instrument(submodule)
+
+    def release(self, parameter):
+        """
+        Restore the original get and set of a parameter
+
+        :param parameter: qcodes parameter
+        :return: NoneType
+        """
+        _, originals = self.originals.pop(id(parameter), (parameter, {}))
+        for kind, (function, instance_attribute) in originals.items():
+            if instance_attribute:
+                setattr(parameter, kind, function)
+            else:
+                parameter.__dict__.pop(kind, None)
+
+    def reset(self, instrument=None):
+        """
+        Forget recorded latencies
+
+        :param instrument: name of the instrument whose latencies are forgotten, all of them if None
+        :return: NoneType
+        """
+        with self.lock:
+            if instrument is None:
+                self.parameters.clear()
+                self.instruments.clear()
+                return
+            for key in [key for key in self.parameters if self.owners.get(key[0]) == instrument]:
+                del self.parameters[key]
+            for key in [key for key in self.instruments if key[0] == instrument]:
+                del self.instruments[key]
+
+    """""""""""""""""""""
+    Results
+    """""""""""""""""""""
+    def rows(self, instrument=None):
+        """
+        :param instrument: name of the instrument, all instruments if None
+        :return: list of (name, kind, histogram) for the instrument(s) first, then for their parameters, sorted by name
+        """
+        with self.lock:
+            instruments = [(name, kind, histogram) for (name, kind), histogram in self.instruments.items()
+                           if instrument is None or name == instrument]
+            parameters = [(name, kind, histogram) for (name, kind), histogram in self.parameters.items()
+                          if instrument is None or self.owners.get(name) == instrument]
+        return sorted(instruments) + sorted(parameters, key=lambda row: row[:2])
+
+    def latencies(self):
+        """
+        :return: dict of full name of the parameter : {"get": mean seconds, "set": mean seconds} (as used by
+                LoopEstimator), only kinds of calls that have been recorded are in it
+        """
+        with self.lock:
+            latencies = {}
+            for (name, kind), histogram in self.parameters.items():
+                latencies.setdefault(name, {})[kind] = histogram.mean
+        return latencies
+
+    def export_json(self, path, instrument=None):
+        """
+        :param path: path of the file to write
+        :param instrument: name of the instrument to export, all instruments if None
+        :return: NoneType
+        """
+        data = {"instruments": {}, "parameters": {}}
+        with self.lock:
+            for (name, kind), histogram in self.instruments.items():
+                if instrument is None or name == instrument:
+                    data["instruments"].setdefault(name, {})[kind] = histogram.to_dict()
+            for (name, kind), histogram in self.parameters.items():
+                if instrument is None or self.owners.get(name) == instrument:
+                    data["parameters"].setdefault(name, {})[kind] = histogram.to_dict()
+        with open(path, "w") as file:
+            json.dump(data, file, indent=2)
+
+    def export_csv(self, path, instrument=None):
+        """
+        One row per instrument/parameter and kind of call, with statistics and counts of all bins of the histogram
+
+        :param path: path of the file to write
+        :param instrument: name of the instrument to export, all instruments if None
+        :return: NoneType
+        """
+        edges = bin_edges()
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["name", "kind", "count", "mean", "min", "max", "median", "p95"] +
+                            ["<{:.3g}s".format(edge) for edge in edges[1:]])
+            for name, kind, histogram in self.rows(instrument):
+                statistics = histogram.to_dict()
+                writer.writerow([name, kind] + [statistics[key] for key in ("count", "mean", "min", "max",
+                                                                             "median", "p95")] + histogram.counts)
+
+
+def format_latency(seconds):
+    """
+    :param seconds: latency
+    :return: human readable string (e.g. "120 us", "3.5 ms", "1.2 s"), "-" if None
+    """
+    if seconds is None:
+        return "-"
+    if seconds < 1e-3:
+        return "{:.3g} us".format(seconds * 1e6)
+    if seconds < 1:
+        return "{:.3g} ms".format(seconds * 1e3)
+    return "{:.3g} s".format(seconds)
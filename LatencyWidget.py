@@ -0,0 +1,153 @@
+from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QLabel, QShortcut, QVBoxLayout, QHBoxLayout, \
+    QTableWidget, QTableWidgetItem, QHeaderView, QFileDialog
+from PyQt5.QtCore import Qt, QTimer
+
+import sys
+
+from Helpers import *
+from LatencyMonitor import format_latency
+
+
+# how often the table is refreshed while the window is open (milliseconds)
+REFRESH_INTERVAL = 2000
+
+# characters used to draw the histograms, from the lowest to the highest bar
+BARS = " ▁▂▃▄▅▆▇█"
+
+
+def histogram_bars(histogram):
+    """
+    :param histogram: LatencyHistogram
+    :return: text drawing of the histogram, from its first to its last non empty bin, and the range it covers
+    """
+    used = [index for index, count in enumerate(histogram.counts) if count]
+    if not used:
+        return ""
+    counts = histogram.counts[used[0]:used[-1] + 1]
+    highest = max(counts)
+    bars = "".join(BARS[int(round(count / highest * (len(BARS) - 1)))] if count else BARS[0] for count in counts)
+    return "{} .. {} {}".format(format_latency(histogram.edges[used[0]]), format_latency(histogram.edges[used[-1] + 1]),
+                                bars)
+
+
+class LatencyWidget(QWidget):
+    def __init__(self, monitor, instrument=None, parent=None):
+        """
+        Constructor for the LatencyWidget window, shows latencies of gets and sets of an instrument and its parameters
+
+        :param monitor: LatencyMonitor shared with the main window
+        :param instrument: name of the instrument to show, all instruments if None
+        :param parent: window that opened this one
+        """
+        super(LatencyWidget, self).__init__()
+        self.monitor = monitor
+        self.instrument = instrument
+        self.parent = parent
+
+        self.init_ui()
+        self.update_table()
+
+        # values keep changing while loops or live updates are running
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.update_table)
+        self.timer.start(REFRESH_INTERVAL)
+        self.show()
+
+    """""""""""""""""""""
+    User interface
+    """""""""""""""""""""
+    def init_ui(self):
+        self.setGeometry(300, 300, 760, 400)
+        self.setMinimumSize(560, 240)
+        title = "Latencies" if self.instrument is None else "Latencies of " + self.instrument
+        self.setWindowTitle(title)
+        self.setWindowIcon(QtGui.QIcon("img/osciloscope_icon.png"))
+
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+
+        layout.addWidget(QLabel("Instrument rows include all calls to any of its parameters"))
+        self.table = QTableWidget(0, 8)
+        self.table.setHorizontalHeaderLabels(("Name", "Call", "Count", "Mean", "Median", "95 %", "Max", "Histogram"))
+        header = self.table.horizontalHeader()
+        header.setSectionResizeMode(0, QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(7, QHeaderView.Stretch)
+        layout.addWidget(self.table)
+
+        buttons_layout = QHBoxLayout()
+        refresh_btn = QPushButton("Refresh")
+        refresh_btn.clicked.connect(self.update_table)
+        buttons_layout.addWidget(refresh_btn)
+        reset_btn = QPushButton("Reset")
+        reset_btn.setToolTip("Forget all latencies recorded so far")
+        reset_btn.clicked.connect(self.reset)
+        buttons_layout.addWidget(reset_btn)
+        export_btn = QPushButton("Export")
+        export_btn.setToolTip("Save statistics and histograms to a CSV or JSON file")
+        export_btn.clicked.connect(self.export)
+        buttons_layout.addWidget(export_btn)
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(self.close)
+        buttons_layout.addWidget(close_btn)
+        layout.addLayout(buttons_layout)
+
+        close_shortcut = QShortcut(QtGui.QKeySequence(Qt.Key_Escape), self)
+        close_shortcut.activated.connect(self.close)
+
+    def update_table(self):
+        """
+        Show the current statistics of all instrument and parameter histograms
+
+        :return: NoneType
+        """
+        rows = self.monitor.rows(self.instrument)
+        self.table.setRowCount(len(rows))
+        for row, (name, kind, histogram) in enumerate(rows):
+            values = (name, kind, str(histogram.count), format_latency(histogram.mean),
+                      format_latency(histogram.percentile(0.5)), format_latency(histogram.percentile(0.95)),
+                      format_latency(histogram.max), histogram_bars(histogram))
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsEnabled)
+                self.table.setItem(row, column, item)
+
+    """""""""""""""""""""
+    Data manipulation
+    """""""""""""""""""""
+    def reset(self):
+        """
+        Forget the recorded latencies (of the shown instrument only)
+
+        :return: NoneType
+        """
+        self.monitor.reset(self.instrument)
+        self.update_table()
+
+    def export(self):
+        """
+        Ask for a file and save the latencies to it, as JSON if the name ends with .json, otherwise as CSV
+
+        :return: NoneType
+        """
+        path, _ = QFileDialog.getSaveFileName(self, "Export latencies", "latencies.csv",
+                                              "CSV (*.csv);;JSON (*.json)")
+        if not path:
+            return
+        try:
+            if path.lower().endswith(".json"):
+                self.monitor.export_json(path, self.instrument)
+            else:
+                self.monitor.export_csv(path, self.instrument)
+        except Exception as e:
+            show_error_message("Warning", "Could not export the latencies. \n" + str(e))
+
+    def closeEvent(self, a0: QtGui.QCloseEvent):
+        self.timer.stop()
+
+
+if __name__ == '__main__':
+    from LatencyMonitor import LatencyMonitor
+
+    app = QApplication(sys.argv)
+    ex = LatencyWidget(LatencyMonitor())
+    sys.exit(app.exec_())
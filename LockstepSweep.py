@@ -0,0 +1,118 @@
+"""
+Sweeping several parameters at the same time (in lockstep), used by the multi sweep measurement.
+
+Setpoints of every parameter are computed up front with numpy (see LoopCompiler) and validated in the units of the
+instrument, the loop then only steps through the index of the point. All parameters of a point that belong to the same
+instrument are set in a single call if the driver supports it, by implementing:
+
+    set_parameters(values)  set all parameters in the dict of parameter name : value (in instrument units) at once
+
+otherwise they are set one after another. Every swept parameter gets its own setpoint array in the data set (qcodes
+does this for combined parameters).
+"""
+
+from collections import OrderedDict
+from copy import copy
+
+import numpy as np
+
+from qcodes.instrument.parameter import CombinedParameter
+
+from LoopCompiler import LoopCompileError, compile_setpoints, raw_setpoints, validate_setpoints
+
+
+class LockstepParameter(CombinedParameter):
+    """
+    Combined parameter that sets all of its parameters to the values of one point of precomputed arrays
+    """
+    def __init__(self, parameters, name, label=None, unit=None):
+        """
+        Constructor of the LockstepParameter class
+
+        :param parameters: list of parameters (or dividers) swept together
+        :param name: name of the sweep, used as the name of the index array in the data set
+        :param label: label of the sweep
+        :param unit: unit of the sweep
+        """
+        super(LockstepParameter, self).__init__(parameters, name, label=label, unit=unit)
+        self.name = name
+        # one row per point, one column per parameter (in the units of the swept parameter, dividers included)
+        self.setpoints = []
+
+    def sweep(self, *arrays):
+        """
+        :param arrays: one array of setpoints for each parameter, all of the same length
+        :return: copy of this parameter that can be passed to qc.Loop as sweep values
+        """
+        if len(arrays) != len(self.parameters):
+            raise LoopCompileError("Expected {} setpoint arrays, got {}".format(len(self.parameters), len(arrays)))
+        if len(set(len(array) for array in arrays)) > 1:
+            raise LoopCompileError("All parameters have to be swept with the same number of steps")
+        new = copy(self)
+        new.setpoints = np.array(arrays, dtype=float).T.tolist()
+        return new
+
+    def __len__(self):
+        return len(self.setpoints)
+
+    def __iter__(self):
+        return iter(range(len(self.setpoints)))
+
+    def __getitem__(self, index):
+        return range(len(self.setpoints))[index]
+
+    def set(self, index):
+        """
+        Set all parameters to their values at one point of the sweep
+
+        :param index: index of the point
+        :return: list of values that were set (used by the loop to fill the setpoint arrays of the parameters)
+        """
+        values = self.setpoints[index]
+        # instrument : list of (instrument parameter, value in instrument units), in the order of the parameters
+        batches = OrderedDict()
+        for parameter, value in zip(self.parameters, values):
+            instrument_parameter, raw_value = raw_setpoints(parameter, value)
+            instrument = getattr(instrument_parameter, "_instrument", None)
+            batches.setdefault(instrument, []).append((instrument_parameter, raw_value))
+
+        for instrument, batch in batches.items():
+            if len(batch) > 1 and callable(getattr(instrument, "set_parameters", None)):
+                instrument.set_parameters(OrderedDict((parameter.name, value) for parameter, value in batch))
+                for parameter, value in batch:
+                    if hasattr(parameter, "_save_val"):
+                        parameter._save_val(value)
+            else:
+                for parameter, value in batch:
+                    parameter.set(value)
+        return values
+
+
+def compile_lockstep_sweep(parameters, starts, ends, num, name="multi_sweep"):
+    """
+    Compute and validate setpoints of all parameters of a lockstep sweep
+
+    :param parameters: list of swept parameters (instrument parameters or dividers)
+    :param starts: first setpoint of each parameter
+    :param ends: last setpoint of each parameter
+    :param num: number of points (same for all parameters)
+    :param name: name of the sweep
+    :return: LockstepParameter with setpoints, can be passed to qc.Loop as sweep values
+    """
+    if not parameters:
+        raise LoopCompileError("At least one parameter has to be swept")
+    arrays = []
+    for parameter, start, end in zip(parameters, starts, ends):
+        values = compile_setpoints(start, end, num)
+        instrument_parameter, raw_values = raw_setpoints(parameter, values)
+        validate_setpoints(instrument_parameter, raw_values, name=str(parameter))
+        arrays.append(values)
+    return LockstepParameter(list(parameters), name).sweep(*arrays)
+
+
+def is_lockstep(loop):
+    """
+    :param loop: qcodes ActiveLoop
+    :return: True if the loop sweeps several parameters in lockstep (created by the multi sweep measurement)
+    """
+    return isinstance(loop.sweep_values, LockstepParameter)
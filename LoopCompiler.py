@@ -0,0 +1,117 @@
+"""
+Compiling sweeps of loops before they are ran.
+
+Instead of handing qcodes a lazy sweep(lower, upper, num) and finding out that a point is out of range somewhere in the
+middle of a measurement, the whole setpoint array is computed with numpy up front, scaled by the divider (if the swept
+parameter has one) to the values that will actually be sent to the instrument, and checked against the validator of
+the instrument parameter in a single vectorized pass. Loops with bad setpoints are rejected before any hardware is
+touched.
+"""
+
+import numpy as np
+
+from qcodes.instrument.sweep_values import SweepFixedValues
+
+
+class LoopCompileError(ValueError):
+    """
+    Raised if a loop can not be created because its setpoints are not valid
+    """
+    pass
+
+
+def compile_setpoints(lower, upper, num):
+    """
+    :param lower: first setpoint
+    :param upper: last setpoint
+    :param num: number of setpoints (has to be a whole number)
+    :return: numpy array of evenly spaced setpoints
+    """
+    if num != int(num) or num < 1:
+        raise LoopCompileError("Number of steps has to be a positive whole number, got {}".format(num))
+    values = np.linspace(float(lower), float(upper), int(num))
+    if not np.all(np.isfinite(values)):
+        raise LoopCompileError("Sweep limits have to be finite numbers")
+    return values
+
+
+def raw_setpoints(parameter, values):
+    """
+    Follow dividers down to the instrument parameter and scale the setpoints the same way the divider would
+
+    :param parameter: swept parameter (instrument parameter or a VoltageDivider)
+    :param values: setpoints in the units of the swept parameter
+    :return: tuple (instrument parameter, setpoints that will be sent to that parameter)
+    """
+    while hasattr(parameter, "v1") and hasattr(parameter, "division_value"):
+        values = values * parameter.division_value
+        parameter = parameter.v1
+    return parameter, values
+
+
+def validator_limits(validator):
+    """
+    :param validator: qcodes validator
+    :return: tuple (min_value, max_value), None for the limits the validator does not have
+    """
+    def limit(name):
+        value = getattr(validator, name, getattr(validator, "_" + name, None))
+        return None if value is None or not np.isfinite(value) else value
+    return limit("min_value"), limit("max_value")
+
+
+def validate_setpoints(parameter, values, name=None):
+    """
+    Check all setpoints against the validator of the parameter. Range (Numbers, Ints) and Enum validators are checked
+    vectorized, anything else falls back to calling the validator for every point (still before the loop is ran).
+
+    :param parameter: instrument parameter that is going to be set
+    :param values: numpy array of values that are going to be sent to the parameter
+    :param name: name used in the error message (name of the swept parameter, defaults to the name of this one)
+    :return: NoneType, raises LoopCompileError if any of the setpoints is not valid
+    """
+    name = name if name is not None else str(parameter)
+    validator = getattr(parameter, "vals", None)
+    if validator is None:
+        return
+
+    def reject(mask, reason):
+        bad = np.flatnonzero(mask)
+        if len(bad):
+            raise LoopCompileError("{} of {} setpoints of {} are {} (first one: {} at index {})".format(
+                len(bad), len(values), name, reason, values[bad[0]], bad[0]))
+
+    class_name = type(validator).__name__
+    if class_name in ("Numbers", "Ints"):
+        min_value, max_value = validator_limits(validator)
+        if min_value is not None:
+            reject(values < min_value, "below the minimum of {}".format(min_value))
+        if max_value is not None:
+            reject(values > max_value, "above the maximum of {}".format(max_value))
+        if class_name == "Ints":
+            reject(values != np.round(values), "not whole numbers")
+    elif class_name == "Enum" and all(isinstance(value, (int, float)) for value in getattr(validator, "_values", [])):
+        reject(~np.isin(values, list(validator._values)), "not allowed values")
+    else:
+        for index, value in enumerate(values):
+            try:
+                validator.validate(value)
+            except (ValueError, TypeError) as e:
+                raise LoopCompileError("Setpoint {} (index {}) of {} is not valid: {}".format(value, index, name, e))
+
+
+def compile_sweep(parameter, lower, upper, num):
+    """
+    Compile the sweep of a loop: compute all setpoints, validate them in the units of the instrument and return sweep
+    values that can be passed to qc.Loop
+
+    :param parameter: swept parameter (instrument parameter or a VoltageDivider)
+    :param lower: first setpoint
+    :param upper: last setpoint
+    :param num: number of setpoints
+    :return: SweepFixedValues of the parameter containing all of the setpoints
+    """
+    values = compile_setpoints(lower, upper, num)
+    instrument_parameter, raw_values = raw_setpoints(parameter, values)
+    validate_setpoints(instrument_parameter, raw_values, name=str(parameter))
+    return SweepFixedValues(parameter, values.tolist())
@@ -0,0 +1,404 @@
+"""
+Estimates of how long a loop is going to run and how much data it produces, and dry runs of loops.
+
+Duration is computed from the loop tree: every point of a loop takes the delay of the loop, the time to set the sweep
+parameter and the time to do all actions of the loop (read the action parameters, run the inner loops). Latencies of
+the parameters (seconds per get or set) are kept in a dict shared with the main window, with the full name of the
+instrument parameter as key and a dict {"get": seconds, "set": seconds} as value. Get latencies are measured by
+measure_latencies (one get of every parameter of the loop), nothing is ever set there, set latencies come from the sets
+timed by the LatencyMonitor (see qcodesMainWindow.get_latencies).
+Parameters whose latencies have not been measured count as instant, the estimate lists them as unmeasured. Loops with
+concurrent readout only wait for the slowest of the instruments they read (see ConcurrentReadout).
+
+Data size is the size of the arrays of the data set in memory (8 bytes per value), files written to disk are bigger.
+
+Dry run executes a copy of the loop in which every parameter is replaced by a simulated one (returns its cached value,
+waits its measured latency), and writes the data to a temporary folder, so timing and storage can be checked without
+touching the hardware. Adaptive, buffered and snake modes are not simulated, the dry run sweeps the loop point by point.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+
+import numpy as np
+
+from Cancellation import sleep
+
+
+# bytes per value of a data set array (float64)
+VALUE_SIZE = 8
+
+
+def raw_parameter(parameter):
+    """
+    :param parameter: parameter or a divider
+    :return: instrument parameter behind all dividers attached to the parameter
+    """
+    while hasattr(parameter, "v1"):
+        parameter = parameter.v1
+    return parameter
+
+
+def latency(parameter, kind, latencies, unmeasured=None):
+    """
+    :param parameter: parameter, divider or a combined parameter
+    :param kind: "get" or "set"
+    :param latencies: dict of full name of the instrument parameter : {"get": seconds, "set": seconds}
+    :param unmeasured: set to which the names of the parameters with unknown latency are added
+    :return: time (seconds) it takes to get or set the parameter, 0 if it is not known
+    """
+    # combined parameters set all of their parameters, one after another
+    if hasattr(parameter, "parameters") and isinstance(parameter.parameters, (list, tuple)):
+        return sum(latency(inner, kind, latencies, unmeasured) for inner in parameter.parameters)
+    name = str(raw_parameter(parameter))
+    seconds = latencies.get(name, {}).get(kind)
+    if seconds is None:
+        if unmeasured is not None:
+            unmeasured.add(name)
+        return 0
+    return seconds
+
+
+def sweep_parameter(loop):
+    """
+    :param loop: qcodes ActiveLoop
+    :return: parameter set by the loop (combined parameters are used as sweep values directly)
+    """
+    sweep_values = loop.sweep_values
+    if hasattr(sweep_values, "parameters"):
+        return sweep_values
+    return sweep_values.parameter
+
+
+def measured_parameters(loop):
+    """
+    :param loop: qcodes ActiveLoop
+    :return: list of parameters read by the loop (not in inner loops), tasks and actions added for a single run are
+            left out
+    """
+    from qcodes.actions import Task, BreakIf
+    from qcodes.loops import ActiveLoop
+
+    return [action for action in loop.actions
+            if not isinstance(action, (Task, BreakIf, ActiveLoop)) and not getattr(action, "job_task", False)]
+
+
+def estimate_duration(loop, latencies, unmeasured=None):
+    """
+    :param loop: qcodes ActiveLoop
+    :param latencies: dict of measured latencies (see latency)
+    :param unmeasured: set to which the names of the parameters with unknown latency are added
+    :return: estimated duration of the loop in seconds
+    """
+    from qcodes.loops import ActiveLoop
+
+    point = loop.delay + latency(sweep_parameter(loop), "set", latencies, unmeasured)
+    measured = measured_parameters(loop)
+    for action in loop.actions:
+        if isinstance(action, ActiveLoop):
+            point += estimate_duration(action, latencies, unmeasured)
+    if getattr(loop, "concurrent", False):
+        from ConcurrentReadout import can_read_concurrently, readout_groups
+
+        # instruments are read at the same time, a point waits for the slowest one (see ConcurrentReadout)
+        concurrent = [action for action in measured if can_read_concurrently(action)]
+        reads = [sum(latency(action, "get", latencies, unmeasured) for action in group)
+                 for group in readout_groups(concurrent)]
+        point += max(reads, default=0)
+        measured_sequentially = [action for action in measured if not can_read_concurrently(action)]
+    else:
+        measured_sequentially = measured
+    for action in measured_sequentially:
+        point += latency(action, "get", latencies, unmeasured)
+    # settling reads the first measured parameter at least once more (see Settling)
+    settle = getattr(loop, "settle", None)
+    if settle and measured and not isinstance(loop.actions[0], ActiveLoop):
+        from Settling import POLL_INTERVAL
+
+        point += POLL_INTERVAL + 2 * latency(measured[0], "get", latencies)
+    return len(loop.sweep_values) * point
+
+
+def count_points(loop):
+    """
+    :param loop: qcodes ActiveLoop
+    :return: number of points measured by the innermost loop (product of the number of steps of all nested loops)
+    """
+    from qcodes.loops import ActiveLoop
+
+    inner = 1
+    for action in loop.actions:
+        if isinstance(action, ActiveLoop):
+            inner = max(inner, count_points(action))
+    return len(loop.sweep_values) * inner
+
+
+def count_values(loop, outer=1):
+    """
+    :param loop: qcodes ActiveLoop
+    :param outer: number of times this loop is ran (product of the number of steps of the outer loops)
+    :return: number of values stored in the data set of the loop (setpoint and measured arrays)
+    """
+    from qcodes.loops import ActiveLoop
+
+    size = outer * len(loop.sweep_values)
+    # setpoint array, combined parameters have an array for every parameter as well
+    values = size * (1 + len(getattr(loop.sweep_values, "parameters", [])))
+    for action in loop.actions:
+        if isinstance(action, ActiveLoop):
+            values += count_values(action, size)
+    for action in measured_parameters(loop):
+        shapes = getattr(action, "shapes", None) or [()] * len(getattr(action, "names", [None]))
+        for shape in shapes:
+            array_size = size
+            for dimension in shape:
+                array_size *= dimension
+            values += array_size
+    # settle times are stored as an extra array, timestamps and actual delays as two more (see PointTiming)
+    if getattr(loop, "settle", None) and not isinstance(loop.actions[0], ActiveLoop):
+        values += size
+    if getattr(loop, "timing", None) and not isinstance(loop.actions[0], ActiveLoop):
+        values += 2 * size
+    return values
+
+
+def estimate_loop(loop, latencies):
+    """
+    :param loop: qcodes ActiveLoop
+    :param latencies: dict of measured latencies (see latency)
+    :return: dict with estimated "duration" (seconds), number of "points", data "size" (bytes) and the set of
+            "unmeasured" parameters (their latencies were counted as 0)
+    """
+    unmeasured = set()
+    return {"duration": estimate_duration(loop, latencies, unmeasured),
+            "points": count_points(loop),
+            "size": count_values(loop) * VALUE_SIZE,
+            "unmeasured": unmeasured}
+
+
+def format_duration(seconds):
+    """
+    :param seconds: duration in seconds
+    :return: human readable string (e.g. "2 h 05 min", "3 min 20 s", "1.5 s")
+    """
+    if seconds < 60:
+        return "{:.3g} s".format(seconds)
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    if minutes < 60:
+        return "{} min {:02d} s".format(minutes, seconds)
+    hours, minutes = divmod(minutes, 60)
+    if hours < 24:
+        return "{} h {:02d} min".format(hours, minutes)
+    days, hours = divmod(hours, 24)
+    return "{} d {:02d} h".format(days, hours)
+
+
+def format_size(size):
+    """
+    :param size: size in bytes
+    :return: human readable string (e.g. "12.3 MB")
+    """
+    for unit in ("B", "kB", "MB", "GB"):
+        if size < 1000:
+            return "{:.3g} {}".format(size, unit)
+        size /= 1000
+    return "{:.3g} TB".format(size)
+
+
+def describe_estimate(estimate):
+    """
+    :param estimate: dict returned by estimate_loop
+    :return: short text for displaying the estimate in the GUI
+    """
+    text = "~{}, {} points, {}".format(format_duration(estimate["duration"]), estimate["points"],
+                                       format_size(estimate["size"]))
+    if estimate["unmeasured"]:
+        text += " ({} parameters not measured)".format(len(estimate["unmeasured"]))
+    return text
+
+
+def loop_parameters(loop):
+    """
+    :param loop: qcodes ActiveLoop
+    :return: tuple (list of swept parameters, list of measured parameters) of the loop and all of its inner loops
+    """
+    from qcodes.loops import ActiveLoop
+
+    swept = [sweep_parameter(loop)]
+    measured = list(measured_parameters(loop))
+    for action in loop.actions:
+        if isinstance(action, ActiveLoop):
+            inner_swept, inner_measured = loop_parameters(action)
+            swept.extend(inner_swept)
+            measured.extend(inner_measured)
+    return swept, measured
+
+
+def timed(function, *args):
+    """
+    :param function: function to call
+    :return: tuple (value returned by the function, time it took in seconds)
+    """
+    start = time.perf_counter()
+    value = function(*args)
+    return value, time.perf_counter() - start
+
+
+def measure_latencies(loop, latencies):
+    """
+    Measure get latencies of all parameters of the loop (swept ones included). Nothing is set, writing a value back to
+    an instrument could overwrite the setpoint of a loop that is running on it, set latencies are taken from the
+    LatencyMonitor instead.
+
+    :param loop: qcodes ActiveLoop
+    :param latencies: dict of measured latencies (see latency), updated with the new measurements
+    :return: NoneType
+    """
+    swept, measured = loop_parameters(loop)
+    for parameter in swept:
+        inner_parameters = parameter.parameters if hasattr(parameter, "parameters") else [parameter]
+        for inner_parameter in inner_parameters:
+            inner_parameter = raw_parameter(inner_parameter)
+            _, latencies.setdefault(str(inner_parameter), {})["get"] = timed(inner_parameter.get)
+    for parameter in measured:
+        parameter = raw_parameter(parameter)
+        _, latencies.setdefault(str(parameter), {})["get"] = timed(parameter.get)
+
+
+def cached_value(parameter):
+    """
+    :param parameter: qcodes parameter
+    :return: last known value of the parameter (hardware is not touched), 0 if there is none
+    """
+    try:
+        value = parameter.get_latest()
+    except Exception:
+        value = None
+    return 0 if value is None else value
+
+
+def simulate_parameter(parameter, latencies):
+    """
+    :param parameter: parameter or a divider
+    :param latencies: dict of measured latencies (see latency)
+    :return: parameter with the same name that returns the cached value of the parameter after waiting its get latency
+            and accepts any value after waiting its set latency
+    """
+    from qcodes.instrument.parameter import Parameter, MultiParameter
+
+    get_latency = latency(parameter, "get", latencies)
+    set_latency = latency(parameter, "set", latencies)
+    name = str(parameter).replace(".", "_")
+
+    value = cached_value(parameter)
+
+    if hasattr(parameter, "names"):
+        shapes = getattr(parameter, "shapes", None) or [()] * len(parameter.names)
+        if not isinstance(value, (tuple, list)) or len(value) != len(parameter.names):
+            value = tuple(np.zeros(shape) if shape else 0 for shape in shapes)
+
+        class SimulatedMultiParameter(MultiParameter):
+            def get_raw(self):
+                sleep(get_latency)
+                return value
+
+        return SimulatedMultiParameter(name, names=parameter.names, shapes=shapes,
+                                       labels=getattr(parameter, "labels", None), units=getattr(parameter, "units", None))
+
+    def get():
+        sleep(get_latency)
+        return value
+
+    def set(_):
+        sleep(set_latency)
+
+    return Parameter(name, label=getattr(parameter, "label", name), unit=getattr(parameter, "unit", ""),
+                     get_cmd=get, set_cmd=set)
+
+
+def simulate_loop(loop, latencies):
+    """
+    :param loop: qcodes ActiveLoop
+    :param latencies: dict of measured latencies (see latency)
+    :return: copy of the loop (and its inner loops) in which all parameters are simulated
+    """
+    import qcodes as qc
+    from qcodes.actions import Task, BreakIf
+    from qcodes.loops import ActiveLoop
+
+    sweep_values = loop.sweep_values
+    if hasattr(sweep_values, "parameters"):
+        # combined parameters are simulated by a single parameter swept over the indices of the setpoints
+        sweep = simulate_parameter(sweep_values, latencies)[list(range(len(sweep_values)))]
+    else:
+        sweep = simulate_parameter(sweep_values.parameter, latencies)[list(sweep_values)]
+
+    actions = []
+    for action in loop.actions:
+        if getattr(action, "job_task", False) or isinstance(action, (Task, BreakIf)):
+            continue
+        elif isinstance(action, ActiveLoop):
+            actions.append(simulate_loop(action, latencies))
+        else:
+            actions.append(simulate_parameter(action, latencies))
+    return qc.Loop(sweep, loop.delay).each(*actions)
+
+
+def folder_size(path):
+    """
+    :param path: path to a folder
+    :return: size of all files in the folder (and its subfolders) in bytes
+    """
+    size = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            size += os.path.getsize(os.path.join(root, file))
+    return size
+
+
+def dry_run(loop, latencies, token=None):
+    """
+    Run a simulated copy of the loop (see simulate_loop), write its data to a temporary folder that is deleted after
+
+    :param loop: qcodes ActiveLoop
+    :param latencies: dict of measured latencies (see latency)
+    :param token: CancellationToken that stops the dry run (delays and simulated latencies are interrupted right away
+            if it is bound to the calling thread as well)
+    :return: dict with the estimate of the loop (see estimate_loop), "elapsed" time of the dry run (seconds) and size
+            of the "files" written (bytes)
+    """
+    from qcodes.actions import _QcodesBreak
+    from qcodes.data.io import DiskIO
+    from Cancellation import prepare_cancellation
+
+    estimate = estimate_loop(loop, latencies)
+    simulated = simulate_loop(loop, latencies)
+    if token is not None:
+        prepare_cancellation(simulated, token)
+    folder = tempfile.mkdtemp(prefix="dry_run_")
+    try:
+        simulated.get_data_set(io=DiskIO(folder), location="dry_run", name="dry_run")
+        start = time.perf_counter()
+        try:
+            simulated.run(quiet=True, set_active=False)
+        except _QcodesBreak:
+            pass
+        estimate["elapsed"] = time.perf_counter() - start
+        estimate["stopped"] = token is not None and token.is_cancelled()
+        estimate["files"] = folder_size(folder)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return estimate
+
+
+def describe_dry_run(result):
+    """
+    :param result: dict returned by dry_run
+    :return: text summarizing the dry run for displaying in the GUI
+    """
+    text = "Dry run was stopped. " if result.get("stopped") else ""
+    return text + "Dry run took {} (estimated {}).\n{} points, {} in memory, {} written to disk.".format(
+        format_duration(result["elapsed"]), format_duration(result["duration"]), result["points"],
+        format_size(result["size"]), format_size(result["files"]))
@@ -0,0 +1,180 @@
+"""
+Ramping parameters to new values without exceeding their maximum ramp rates.
+
+Every parameter can have a maximum ramp rate (instrument units per second), kept in a dict shared with the main window
+with the full name of the instrument parameter as key, or set on a divider as ramp_rate (in units of the divider, it is
+scaled by the division). Parameters without a ramp rate are set directly.
+
+All parameters of a move are ramped at the same time: the move takes as long as the slowest parameter needs, and all
+parameters arrive at their targets together, so moving many gates is not slower than moving the slowest one.
+
+Moves are used at the start of a loop (every swept parameter is ramped to the first setpoint), after every line of an
+inner loop (inner sweep parameter is ramped back to the start of the line) and by "All zeroes" and "SET ALL" in the
+EditInstrumentWidget.
+"""
+
+import math
+import time
+
+from LoopCompiler import raw_setpoints
+from Cancellation import sleep
+
+
+# time between two steps of a ramp (seconds)
+STEP_INTERVAL = 0.02
+
+
+class MovePlanner:
+    """
+    Plans and executes concurrent ramps of parameters
+    """
+    def __init__(self, ramp_rates=None, step_interval=STEP_INTERVAL):
+        """
+        Constructor of the MovePlanner class
+
+        :param ramp_rates: dict of full name of the instrument parameter : maximum ramp rate (units per second)
+        :param step_interval: time between two steps of a ramp
+        """
+        self.ramp_rates = ramp_rates if ramp_rates is not None else {}
+        self.step_interval = step_interval
+
+    def ramp_rate(self, parameter):
+        """
+        :param parameter: parameter or a divider
+        :return: tuple (instrument parameter, maximum ramp rate of it in instrument units, None if there is no limit)
+        """
+        instrument_parameter, scale = raw_setpoints(parameter, 1.0)
+        rate = self.ramp_rates.get(str(instrument_parameter))
+        # rate set on a divider is in units of the divider
+        while hasattr(parameter, "v1") and hasattr(parameter, "division_value"):
+            if getattr(parameter, "ramp_rate", None):
+                rate = parameter.ramp_rate * abs(raw_setpoints(parameter, 1.0)[1])
+                break
+            parameter = parameter.v1
+        return instrument_parameter, rate if rate else None
+
+    def plan(self, moves, limited_only=False):
+        """
+        Split a move into steps that respect the ramp rates of all parameters
+
+        :param moves: list of (parameter, target value in units of that parameter) pairs
+        :param limited_only: if True, parameters without a ramp rate are left out of the move (someone else sets them)
+        :return: list of steps, every step is a list of (instrument parameter, value in instrument units) pairs
+        """
+        ramps = []
+        jumps = []
+        duration = 0
+        for parameter, target in moves:
+            instrument_parameter, raw_target = raw_setpoints(parameter, target)
+            instrument_parameter, rate = self.ramp_rate(parameter)
+            current = current_value(instrument_parameter) if rate is not None else None
+            if current is None:
+                if not limited_only:
+                    jumps.append((instrument_parameter, raw_target))
+                continue
+            if current == raw_target:
+                continue
+            ramps.append((instrument_parameter, current, raw_target))
+            duration = max(duration, abs(raw_target - current) / rate)
+
+        # parameters without a limit are set in the first step
+        num_steps = max(1, int(math.ceil(duration / self.step_interval)))
+        steps = [[] for _ in range(num_steps)]
+        steps[0].extend(jumps)
+        for instrument_parameter, current, target in ramps:
+            for index in range(num_steps):
+                fraction = (index + 1) / num_steps
+                steps[index].append((instrument_parameter, current + (target - current) * fraction))
+        return [step for step in steps if step]
+
+    def move(self, moves, should_stop=None, limited_only=False):
+        """
+        Ramp all parameters to their targets at the same time. Blocks until the move is done.
+
+        :param moves: list of (parameter, target value in units of that parameter) pairs
+        :param should_stop: function returning True if the move should be stopped (checked before every step)
+        :param limited_only: if True, only parameters with a ramp rate are moved
+        :return: True if the move was finished, False if it was stopped
+        """
+        start = time.perf_counter()
+        for index, step in enumerate(self.plan(moves, limited_only)):
+            if should_stop is not None and should_stop():
+                return False
+            for instrument_parameter, value in step:
+                instrument_parameter.set(value)
+            wait = start + (index + 1) * self.step_interval - time.perf_counter()
+            if wait > 0 and not sleep(wait):
+                return False
+        return True
+
+
+def current_value(parameter):
+    """
+    :param parameter: instrument parameter
+    :return: current value of the parameter as a float, None if it is not known or not a number
+    """
+    try:
+        value = parameter.get_latest()
+        if value is None:
+            value = parameter.get()
+        return float(value)
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def loop_start_moves(loop):
+    """
+    :param loop: qcodes ActiveLoop
+    :return: list of (parameter, first setpoint) pairs for the sweep parameters of the loop and all of its inner loops
+    """
+    from qcodes.loops import ActiveLoop
+
+    moves = []
+    sweep_values = loop.sweep_values
+    if len(sweep_values):
+        if hasattr(sweep_values, "parameters"):
+            # combined parameters, every parameter has its own setpoints
+            moves.extend(zip(sweep_values.parameters, sweep_values.setpoints[0]))
+        else:
+            moves.append((sweep_values.parameter, next(iter(sweep_values))))
+    for action in loop.actions:
+        if isinstance(action, ActiveLoop):
+            moves.extend(loop_start_moves(action))
+    return moves
+
+
+def prepare_line_returns(loop, planner, should_stop=None):
+    """
+    After every line of the inner loop, ramp the inner sweep parameters to the start of the next line (instead of
+    letting the next line jump there). Nothing is added if none of the inner sweep parameters has a ramp rate.
+
+    The task is appended after all other actions, so that the indices of the actions (used by the data set to store
+    the values) do not change, and it can be added after the data set has been created. Has to be called after snake
+    ordering is prepared, so that the direction of the line changes before the start of the next line is looked up.
+
+    :param loop: qcodes ActiveLoop
+    :param planner: MovePlanner
+    :param should_stop: function returning True if the run is being stopped
+    :return: function that removes the added task again
+    """
+    from qcodes.actions import Task
+    from qcodes.loops import ActiveLoop
+
+    if not loop.actions or not isinstance(loop.actions[0], ActiveLoop):
+        return lambda: None
+    inner = loop.actions[0]
+    if all(planner.ramp_rate(parameter)[1] is None for parameter, _ in loop_start_moves(inner)):
+        return lambda: None
+
+    def return_to_start():
+        planner.move(loop_start_moves(inner), should_stop, limited_only=True)
+
+    task = Task(return_to_start)
+    task.job_task = True
+    loop.actions.append(task)
+
+    def restore():
+        if task in loop.actions:
+            loop.actions.remove(task)
+
+    return restore
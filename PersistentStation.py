@@ -0,0 +1,138 @@
+"""
+Long lived qcodes Station shared by all runs of the GUI.
+
+Instead of building a new Station (and snapshotting every parameter of every instrument) on every click of Run, the
+main window keeps a single PersistentStation. Instruments are added and removed as they appear and disappear from the
+instruments dict of the main window, and snapshots are cached per instrument: between runs only the parameters that
+were set or read since the last snapshot (their timestamp changed) get snapshotted again.
+"""
+
+import threading
+
+from qcodes.station import Station
+from qcodes.instrument.base import Instrument
+from qcodes.instrument.parameter import Parameter
+
+
+def parameter_timestamp(parameter):
+    """
+    :param parameter: qcodes parameter
+    :return: time of the last set/get of the parameter (None if it was never set or read)
+    """
+    latest = getattr(parameter, "_latest", None)
+    if isinstance(latest, dict):
+        return latest.get("ts")
+    # older versions of qcodes keep it in a separate attribute
+    return getattr(parameter, "_latest_ts", None)
+
+
+def instrument_state(instrument):
+    """
+    Timestamps of all parameters of an instrument (and its submodules), used to figure out what changed since the last
+    snapshot
+
+    :param instrument: qcodes instrument (or a submodule/channel of one)
+    :return: dict with parameter names as keys and their timestamps as values, submodules have their own dict
+    """
+    state = {name: parameter_timestamp(parameter) for name, parameter in instrument.parameters.items()}
+    for name, submodule in getattr(instrument, "submodules", {}).items():
+        if hasattr(submodule, "parameters"):
+            state["/" + name] = instrument_state(submodule)
+    return state
+
+
+class PersistentStation(Station):
+    """
+    Station that lives as long as the GUI does and caches snapshots of its instruments.
+    """
+    def __init__(self, *components, **kwargs):
+        super(PersistentStation, self).__init__(*components, **kwargs)
+        # instrument name : (state of the parameters at the time of the snapshot, snapshot of the instrument)
+        self.snapshot_cache = {}
+        # components are added from the GUI thread while loops snapshot the station from the worker threads
+        self.lock = threading.RLock()
+
+    def sync(self, instruments):
+        """
+        Make components of the station match the instruments of the GUI. Only the differences are applied.
+
+        :param instruments: dict of instruments (name : instrument) from the main window
+        :return: NoneType
+        """
+        with self.lock:
+            for name, component in list(self.components.items()):
+                if isinstance(component, Instrument) and instruments.get(name) is not component:
+                    self.remove_instrument(name)
+            for name, instrument in instruments.items():
+                if name not in self.components:
+                    self.add_component(instrument, name)
+
+    def remove_instrument(self, name):
+        """
+        Remove an instrument from the station and forget its snapshot
+
+        :param name: name of the component
+        :return: NoneType
+        """
+        with self.lock:
+            if hasattr(Station, "remove_component"):
+                self.remove_component(name)
+            else:
+                del self.components[name]
+            self.snapshot_cache.pop(name, None)
+
+    def snapshot_instrument(self, name, instrument, update=False):
+        """
+        Snapshot of a single instrument, reusing as much of the previous snapshot as possible
+
+        :param name: name of the instrument in the station
+        :param instrument: the instrument
+        :param update: if True, values are read from the instrument and the cache is not used
+        :return: snapshot of the instrument (dict)
+        """
+        state = instrument_state(instrument)
+        cached = self.snapshot_cache.get(name)
+        if not update and cached is not None:
+            cached_state, snapshot = cached
+            if cached_state == state:
+                return snapshot
+            changed = [key for key, ts in state.items() if cached_state.get(key, ts) != ts]
+            # reuse the old snapshot only if no parameter was added/removed and no submodule changed, otherwise it's
+            # simpler (and rare enough) to snapshot the whole instrument again
+            if set(cached_state) == set(state) and not any(key.startswith("/") for key in changed) and \
+                    all(key in snapshot.get("parameters", {}) for key in changed):
+                snapshot = dict(snapshot)
+                snapshot["parameters"] = dict(snapshot["parameters"])
+                for key in changed:
+                    snapshot["parameters"][key] = instrument.parameters[key].snapshot(update=False)
+                self.snapshot_cache[name] = (state, snapshot)
+                return snapshot
+
+        snapshot = instrument.snapshot(update=update)
+        # state after the snapshot, update=True reads the parameters which changes their timestamps
+        self.snapshot_cache[name] = (instrument_state(instrument) if update else state, snapshot)
+        return snapshot
+
+    def snapshot_base(self, update=False, params_to_skip_update=None):
+        """
+        Same layout as the snapshot of qcodes Station, but snapshots of instruments come from the cache when possible
+        """
+        snap = {"instruments": {}, "parameters": {}, "components": {}}
+        default_measurement = getattr(self, "default_measurement", None)
+        if default_measurement is not None:
+            try:
+                from qcodes.actions import _actions_snapshot
+                snap["default_measurement"] = _actions_snapshot(default_measurement, update)
+            except ImportError:
+                pass
+        # lock is held for the whole snapshot (cache is shared by all loops), without update nothing is read from the
+        # instruments so this does not take long
+        with self.lock:
+            for name, component in self.components.items():
+                if isinstance(component, Instrument):
+                    snap["instruments"][name] = self.snapshot_instrument(name, component, update)
+                elif isinstance(component, Parameter):
+                    snap["parameters"][name] = component.snapshot(update=update)
+                else:
+                    snap["components"][name] = component.snapshot(update=update)
+        return snap
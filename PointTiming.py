@@ -0,0 +1,163 @@
+"""
+High resolution timing of the points of a loop, with the time of every point recorded in the data set.
+
+A plain loop waits its delay with time.sleep after every set, so the real delay is longer by the sleep granularity of
+the operating system (up to 15.6 ms on Windows) and nothing records how long it actually was. A loop with timing enabled
+waits on time.perf_counter instead: it sleeps until shortly before the target time and spins for the rest. Two modes:
+
+    "delay": every point is measured exactly delay seconds after its set (as a plain loop, only precise)
+    "interval": points are measured on a fixed grid, delay seconds apart, counted from the first point of the line.
+        Time spent on the set, measuring, storing and plotting is taken out of the wait, so it does not add up over
+        the line (drift). A point that is late by more than a whole interval restarts the grid, instead of measuring
+        the next points without any wait to catch up.
+
+Timestamp of every point (seconds since the first point of the run) and the actual delay (from the end of the set to
+the measurement) are stored as two extra arrays of the data set. Timing is added to a run of a loop by prepare_timing
+and removed by the function it returns.
+"""
+
+import time
+
+from qcodes.instrument.parameter import MultiParameter
+
+from Cancellation import sleep, current_token
+
+
+# waits shorter than this are spun instead of slept (longer than the sleep granularity of Windows)
+SPIN_TIME = 0.02
+
+# timing modes of a loop (value of loop.timing)
+TIMING_MODES = ("delay", "interval")
+
+
+def sleep_until(target):
+    """
+    Wait until time.perf_counter reaches the target: sleep (interruptible, see Cancellation.sleep) for most of the
+    time, then spin
+
+    :param target: time.perf_counter value to wait for
+    :return: True if the target was reached, False if the wait was cancelled
+    """
+    while True:
+        remaining = target - time.perf_counter()
+        if remaining <= 0:
+            return True
+        if remaining > SPIN_TIME:
+            if not sleep(remaining - SPIN_TIME):
+                return False
+        else:
+            # give other threads (GUI) a chance to run while spinning
+            time.sleep(0)
+
+
+class PointTimer(MultiParameter):
+    """
+    Replaces the delay of a loop (see prepare_timing), its get returns the timestamp and the actual delay of the point
+    that is being measured
+    """
+    def __init__(self, loop, mode, start):
+        """
+        Constructor of the PointTimer class
+
+        :param loop: qcodes ActiveLoop whose points are timed
+        :param mode: "delay" or "interval" (see module docstring)
+        :param start: list holding the time.perf_counter value of the first point of the run (shared by all timers
+                of the run, filled by the first one that runs)
+        """
+        self.loop = loop
+        self.mode = mode
+        self.start = start
+        self.num_points = len(loop.sweep_values)
+        self.index = 0
+        # target time of the first point of the current grid (interval mode)
+        self.anchor = None
+        self.timestamp = float("nan")
+        self.actual_delay = float("nan")
+
+        sweep = loop.sweep_values
+        prefix = str(getattr(sweep, "parameter", sweep)).replace(".", "_")
+        super(PointTimer, self).__init__(name=prefix + "_timing",
+                                         names=(prefix + "_timestamp", prefix + "_actual_delay"),
+                                         shapes=((), ()),
+                                         labels=("Time of the point", "Actual delay"),
+                                         units=("s", "s"))
+
+    def wait(self, delay):
+        """
+        Called instead of the delay of the loop, right after the set of every point
+
+        :param delay: delay requested by the loop (the first point of a line can inherit a longer one)
+        :return: NoneType
+        """
+        from qcodes.actions import _QcodesBreak
+
+        set_done = time.perf_counter()
+        if not self.start:
+            self.start.append(set_done)
+        interval = self.loop.delay
+
+        if self.mode == "interval":
+            # first point of a line, or too late to keep up with the grid: the grid starts at this point
+            if self.index == 0 or self.anchor is None or set_done > self.target() + interval:
+                self.anchor = set_done + delay - self.index * interval
+            target = self.target()
+        else:
+            target = set_done + delay
+        self.index = (self.index + 1) % self.num_points if self.num_points else 0
+
+        token = current_token()
+        if not sleep_until(target) or (token is not None and token.poll()):
+            raise _QcodesBreak
+        measured_at = time.perf_counter()
+        self.timestamp = measured_at - self.start[0]
+        self.actual_delay = measured_at - set_done
+
+    def target(self):
+        """
+        :return: time.perf_counter value at which the current point should be measured (interval mode)
+        """
+        return self.anchor + self.index * self.loop.delay
+
+    def get_raw(self):
+        return self.timestamp, self.actual_delay
+
+
+def prepare_timing(loop):
+    """
+    Replace the delays of all loops (in the loop tree) that have timing enabled with a PointTimer, and add the timer as
+    their first action. Has to be called before the data set of the loop is created (timestamps get their own arrays)
+    and after the delays have been made cancellable (see Cancellation.prepare_cancellation), cancellation works trough
+    the sleeps of the timer.
+
+    :param loop: qcodes ActiveLoop
+    :return: function that restores the loops to the way they were
+    """
+    from qcodes.loops import ActiveLoop
+
+    start = []
+    added = []
+    loops = [loop]
+    while loops:
+        current = loops.pop()
+        loops.extend(action for action in current.actions if isinstance(action, ActiveLoop))
+        mode = getattr(current, "timing", None)
+        # loops that start with an inner loop leave their delay to the inner loop, there is nothing to time
+        if mode not in TIMING_MODES or not current.actions or isinstance(current.actions[0], ActiveLoop):
+            continue
+        timer = PointTimer(current, mode, start)
+        timer.job_task = True
+        previous_wait = current.__dict__.get("_wait")
+        current._wait = timer.wait
+        current.actions.insert(0, timer)
+        added.append((current, timer, previous_wait))
+
+    def restore():
+        for current, timer, previous_wait in added:
+            if timer in current.actions:
+                current.actions.remove(timer)
+            if previous_wait is not None:
+                current._wait = previous_wait
+            else:
+                current.__dict__.pop("_wait", None)
+
+    return restore
@@ -0,0 +1,508 @@
+"""
+Queue of measurements (qcodes loops) that are ran in the background.
+
+Loops are added to the queue as MeasurementJobs. The queue starts the next job directly from the worker thread in which
+the previous one has finished, so there is no waiting for the GUI between jobs (batches left to run overnight run
+without gaps). Queue can be paused and resumed, and queued jobs can be reordered or removed while a job is running.
+
+Every job locks the instruments its loop talks to (sweep parameter, actions, inner loops, instruments behind dividers).
+Jobs whose instruments are not locked by anyone run at the same time, the others wait. A job never overtakes an
+earlier queued job that needs one of its instruments, so jobs using the same instruments always run in queue order.
+"""
+
+import time
+import threading
+
+from PyQt5.QtCore import QObject, QThreadPool, pyqtSignal
+
+from ThreadWorker import Worker
+from Helpers import get_loop_instruments
+from Cancellation import CancellationToken
+
+
+class MeasurementJob:
+    """
+    Single run of a loop, together with everything that is needed to run it (captured at the time it was queued)
+    """
+    def __init__(self, name, loop, output_name="", save_location="", with_plot=True):
+        """
+        Constructor of the MeasurementJob class
+
+        :param name: name of the loop (key in the loops dictionary of the main window)
+        :param loop: qcodes ActiveLoop that is going to be ran
+        :param output_name: name of the output file (data set)
+        :param save_location: folder where the data is saved, default qcodes location if empty
+        :param with_plot: if True, live plot is shown while the job is running
+        """
+        self.name = name
+        self.loop = loop
+        self.output_name = output_name
+        self.save_location = save_location
+        self.with_plot = with_plot
+
+        # one of: "queued", "running", "finished", "stopped", "failed"
+        self.state = "queued"
+        self.error = None
+        # cancelled to stop the job, interrupts delays of the loop right away (see Cancellation.py)
+        self.token = CancellationToken(name=name)
+        self.queued_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+        # data set the loop writes to, created when the job starts
+        self.data_set = None
+        # names of the instruments locked by this job while it runs (found when the job is about to start)
+        self.instruments = set()
+
+        # hooks set by whoever queued the job, all of them are called from the thread running the job
+        # bg_task and bg_final_task are attached to the loop as background tasks (plot updating and saving)
+        self.bg_task = None
+        self.bg_final_task = None
+        # called after every step of the outer loop if the loop has a loop inside (line traces)
+        self.outer_step_task = None
+
+        # plots of this job, created in the GUI thread once the job has started, and the name of the plotted parameter
+        self.parameter_name = None
+        self.plot = None
+        self.line_traces_plot = None
+        # number of the outer loop steps done so far (index of the next line trace)
+        self.line_trace_count = 0
+
+        # functions that undo the changes made to the loop for this run only, called once the job is done
+        self.restore_functions = []
+        # MovePlanner used to ramp the swept parameters to the start of the loop and of every line, None to jump
+        self.move_planner = None
+
+    @property
+    def stop_requested(self):
+        """
+        :return: True if the job has been asked to stop
+        """
+        return self.token.is_cancelled()
+
+    def cancel(self, reason="stopped"):
+        """
+        Stop the job (can be called from any thread), waiting loop delays are interrupted immediately
+
+        :param reason: why the job is being stopped
+        :return: NoneType
+        """
+        self.token.cancel(reason)
+
+    def prepare(self):
+        """
+        Create a fresh data set for the loop and attach the tasks of this job to it. Called in the worker thread right
+        before the job starts.
+
+        :return: NoneType
+        """
+        from qcodes.loops import ActiveLoop
+        from qcodes.actions import Task
+
+        from Settling import prepare_settling
+        from Cancellation import prepare_cancellation
+
+        loop = self.loop
+        loop.data_set = None
+        # remove the tasks of the previous runs of this loop, then attach the tasks of this job
+        loop.actions = [action for action in loop.actions if not getattr(action, "job_task", False)]
+        loop.bg_task = None
+        nested = isinstance(loop.actions[0], ActiveLoop)
+        self.restore_functions.append(prepare_cancellation(loop, self.token))
+        # settle times are measured, so they have to be added before the data set is created
+        self.restore_functions.append(prepare_settling(loop))
+        if self._runs_point_by_point():
+            from PointTiming import prepare_timing
+            from ConcurrentReadout import prepare_concurrent_readout
+
+            # timestamps are measured as well, timer goes before the settling (it measures the delay after the set)
+            self.restore_functions.append(prepare_timing(loop))
+            # reads stay right after the set (and the settling), only the reads themselves are done at the same time
+            self.restore_functions.append(prepare_concurrent_readout(loop))
+
+        kwargs = {"name": self.output_name}
+        if self.save_location != "":
+            from qcodes.data.location import FormatLocation
+            kwargs["location"] = FormatLocation(fmt=self.save_location + '/{date}/#{counter}_{name}_{time}')
+        self.data_set = loop.get_data_set(**kwargs)
+
+        if getattr(loop, "snake", False):
+            from SnakeSweep import can_snake, prepare_snake
+            from AdaptiveSweep import is_adaptive
+
+            # adaptive loops choose their own order of lines, snake ordering does not apply to them
+            if can_snake(loop) and not is_adaptive(loop):
+                self.restore_functions.append(prepare_snake(loop, self.data_set))
+        if self.move_planner is not None and nested:
+            from MovePlanner import prepare_line_returns
+
+            # has to be added after snake ordering, does nothing if the inner sweep parameters do not have ramp rates
+            self.restore_functions.append(prepare_line_returns(loop, self.move_planner,
+                                                               should_stop=self.token.poll))
+        if self.outer_step_task is not None and nested:
+            task = Task(self.outer_step_task)
+            task.job_task = True
+            loop.actions.append(task)
+        if self.with_plot:
+            if nested:
+                loop.actions[0].progress_interval = None
+            elif loop.progress_interval is None:
+                loop.progress_interval = 20
+        if self.bg_task is not None:
+            loop.with_bg_task(self.bg_task, self.bg_final_task)
+
+    def _runs_point_by_point(self):
+        """
+        :return: True if the loop is going to be ran by qcodes point by point (not adaptive, not buffered)
+        """
+        from AdaptiveSweep import is_adaptive
+
+        if is_adaptive(self.loop):
+            return False
+        if getattr(self.loop, "buffered", False):
+            from BufferedSweep import supports_buffered
+
+            return not supports_buffered(self.loop)[0]
+        return True
+
+    def run(self):
+        """
+        Run the loop (blocks until the loop is done or stopped). Adaptive loops pick their own setpoints (see
+        AdaptiveSweep). Loops marked as buffered are ran by the instruments themselves if they support it (see
+        BufferedSweep), otherwise point by point.
+
+        :return: NoneType
+        """
+        from qcodes.actions import _QcodesBreak
+        from AdaptiveSweep import is_adaptive
+
+        if self.move_planner is not None:
+            from MovePlanner import loop_start_moves
+
+            # ramp to the first setpoints instead of jumping there
+            if not self.move_planner.move(loop_start_moves(self.loop), should_stop=self.token.poll,
+                                          limited_only=True):
+                return
+        if is_adaptive(self.loop):
+            from AdaptiveSweep import run_adaptive
+
+            run_adaptive(self.loop, self.data_set, should_stop=self.token.poll)
+            return
+        if getattr(self.loop, "buffered", False):
+            from BufferedSweep import supports_buffered, run_buffered
+
+            supported, reason = supports_buffered(self.loop)
+            if supported:
+                run_buffered(self.loop, self.data_set, should_stop=self.token.poll)
+                return
+            print("Running {} point by point: {}".format(self.name, reason))
+        try:
+            self.loop.run()
+        except _QcodesBreak:
+            # stop noticed by a delay of the outermost loop (data set is finalized by the loop itself)
+            pass
+
+    def finish(self):
+        """
+        Undo the changes that were made to the loop for this run (called in the worker thread after the job is done)
+
+        :return: NoneType
+        """
+        while self.restore_functions:
+            try:
+                self.restore_functions.pop()()
+            except Exception as e:
+                print("Could not restore {} after the run: {}".format(self.name, e))
+
+    def describe(self):
+        """
+        :return: short description of the job for displaying in the GUI
+        """
+        text = "{} ({})".format(self.name, self.state)
+        if self.output_name:
+            text += " -> " + self.output_name
+        if self.error:
+            text += ": " + self.error
+        if self.token.stop_latency is not None:
+            text += " [stopped in {:.1f} ms]".format(self.token.stop_latency * 1000)
+        return text
+
+
+def conflicts(instruments, locked):
+    """
+    :param instruments: set of instrument names needed by a job
+    :param locked: set of instrument names that are already taken
+    :return: True if the job can't run because of the locked instruments ("*" stands for unknown, conflicts with all)
+    """
+    if not instruments or not locked:
+        return False
+    return "*" in instruments or "*" in locked or not instruments.isdisjoint(locked)
+
+
+class RunQueue(QObject):
+    """
+    Runs queued MeasurementJobs in the background, at the same time if they use different instruments.
+
+    Signals:
+        job_started(job) emitted (from the worker thread) after the data set of the job has been created
+        job_finished(job) emitted (from the worker thread) when the job is done, job.state tells how it ended
+        changed() emitted whenever the content of the queue changes
+        busy_changed(busy) emitted when the queue starts running jobs and when it runs out of jobs to run
+    """
+    job_started = pyqtSignal(object)
+    job_finished = pyqtSignal(object)
+    changed = pyqtSignal()
+    busy_changed = pyqtSignal(bool)
+
+    def __init__(self, thread_pool=None, parent=None):
+        """
+        Constructor of the RunQueue class
+
+        :param thread_pool: thread pool in which jobs are ran, global one is used if not passed
+        :param parent: parent QObject
+        """
+        super(RunQueue, self).__init__(parent)
+        self.thread_pool = thread_pool if thread_pool is not None else QThreadPool.globalInstance()
+
+        # jobs are added from the GUI thread and taken from the worker threads
+        self.lock = threading.RLock()
+        self.queued = []
+        self.running = []
+        # finished jobs, most recent last
+        self.history = []
+        self.paused = False
+        self.busy = False
+        # instrument locks, name of the instrument : job that holds it
+        self.locks = {}
+
+        # job that is being ran by the current thread (used to find out which job a task ran by a loop belongs to)
+        self.local = threading.local()
+
+    """""""""""""""""""""
+    Queue manipulation
+    """""""""""""""""""""
+    def enqueue(self, job):
+        """
+        Add a job to the end of the queue, it starts immediately if nothing is running and the queue is not paused
+
+        :param job: MeasurementJob
+        :return: NoneType
+        """
+        with self.lock:
+            job.state = "queued"
+            job.token = CancellationToken(name=job.name)
+            self.queued.append(job)
+        self.changed.emit()
+        self._schedule()
+
+    def remove(self, job):
+        """
+        Remove a job from the queue (has no effect on jobs that are already running)
+
+        :param job: MeasurementJob
+        :return: NoneType
+        """
+        with self.lock:
+            if job in self.queued:
+                self.queued.remove(job)
+        self.changed.emit()
+
+    def remove_loop(self, loop):
+        """
+        Remove all queued jobs that would run this loop (the loop is being deleted)
+
+        :param loop: qcodes ActiveLoop
+        :return: NoneType
+        """
+        with self.lock:
+            self.queued = [job for job in self.queued if job.loop is not loop]
+        self.changed.emit()
+
+    def move(self, job, offset):
+        """
+        Move a queued job up (negative offset) or down (positive offset) the queue
+
+        :param job: MeasurementJob
+        :param offset: number of places to move the job by
+        :return: NoneType
+        """
+        with self.lock:
+            if job not in self.queued:
+                return
+            index = self.queued.index(job)
+            new_index = max(0, min(len(self.queued) - 1, index + offset))
+            self.queued.insert(new_index, self.queued.pop(index))
+        self.changed.emit()
+
+    def clear(self):
+        """
+        Remove all jobs that are waiting in the queue
+
+        :return: NoneType
+        """
+        with self.lock:
+            del self.queued[:]
+        self.changed.emit()
+        self._update_busy()
+
+    def pause(self):
+        """
+        Do not start any new jobs, the ones that are running are not affected
+
+        :return: NoneType
+        """
+        with self.lock:
+            self.paused = True
+        self.changed.emit()
+        self._update_busy()
+
+    def resume(self):
+        """
+        Continue starting jobs from the queue
+
+        :return: NoneType
+        """
+        with self.lock:
+            self.paused = False
+        self.changed.emit()
+        self._schedule()
+
+    def stop(self):
+        """
+        Stop the running jobs (their delays are interrupted, a get or set in progress is finished first) and pause the
+        queue, queued jobs stay in the queue
+
+        :return: NoneType
+        """
+        with self.lock:
+            self.paused = True
+            for job in self.running:
+                job.cancel("STOP")
+        self.changed.emit()
+
+    """""""""""""""""""""
+    Running jobs
+    """""""""""""""""""""
+    def current_job(self):
+        """
+        :return: job that is being ran by the thread calling this function, None if the thread is not running a job
+        """
+        return getattr(self.local, "job", None)
+
+    def is_running(self, loop):
+        """
+        :param loop: qcodes ActiveLoop
+        :return: True if a job running this loop is currently running
+        """
+        with self.lock:
+            return any(job.loop is loop for job in self.running)
+
+    def is_busy(self, instruments):
+        """
+        :param instruments: set of instrument names (see get_loop_instruments)
+        :return: True if any of the instruments is being used by a running job
+        """
+        with self.lock:
+            return conflicts(instruments, set(self.locks))
+
+    def is_locked(self, instrument_name):
+        """
+        :param instrument_name: name of an instrument
+        :return: True if a running job is using the instrument
+        """
+        with self.lock:
+            return instrument_name in self.locks or "*" in self.locks
+
+    def _next_jobs(self):
+        """
+        Pick the jobs that can be started now, lock their instruments and move them from queued to running. Must be
+        called with the lock held.
+
+        A job is started if none of its instruments are locked by a running job, and none of them are needed by a job
+        queued before it (that one has to go first).
+
+        :return: list of jobs to start
+        """
+        if self.paused:
+            return []
+        started = []
+        # instruments that are locked, or are reserved for jobs earlier in the queue
+        taken = set(self.locks)
+        for job in list(self.queued):
+            try:
+                job.instruments = get_loop_instruments(job.loop)
+            except Exception as e:
+                print("Could not find the instruments of {}: {}".format(job.name, e))
+                job.instruments = {"*"}
+            if not conflicts(job.instruments, taken):
+                self.queued.remove(job)
+                self.running.append(job)
+                for name in job.instruments:
+                    self.locks[name] = job
+                started.append(job)
+            taken.update(job.instruments)
+        return started
+
+    def _schedule(self):
+        """
+        Start the jobs that can be started. Thread safe, called from the GUI thread when jobs are added and from the
+        worker threads when a job finishes, so that the next job starts right away.
+
+        :return: NoneType
+        """
+        with self.lock:
+            jobs = self._next_jobs()
+            for job in jobs:
+                job.state = "running"
+                job.started_at = time.time()
+        for job in jobs:
+            self.thread_pool.start(Worker(self._run_job, False, job))
+        if jobs:
+            self.changed.emit()
+        self._update_busy()
+
+    def _run_job(self, job):
+        """
+        Runs in a worker thread. Runs a single job and then schedules the next ones from this same thread.
+
+        :param job: MeasurementJob
+        :return: NoneType
+        """
+        self.local.job = job
+        try:
+            with job.token.bound():
+                job.prepare()
+                self.job_started.emit(job)
+                job.run()
+        except Exception as e:
+            job.state = "failed"
+            job.error = str(e)
+            print("Job {} failed: {}".format(job.name, e))
+        else:
+            job.state = "stopped" if job.stop_requested else "finished"
+        finally:
+            job.finish()
+            self.local.job = None
+            job.finished_at = time.time()
+            with self.lock:
+                self.running.remove(job)
+                self.history.append(job)
+                for name in job.instruments:
+                    if self.locks.get(name) is job:
+                        del self.locks[name]
+            self.job_finished.emit(job)
+            self.changed.emit()
+            self._schedule()
+
+    def _update_busy(self):
+        """
+        Emit busy_changed if the queue started or stopped running jobs
+
+        :return: NoneType
+        """
+        with self.lock:
+            busy = bool(self.running)
+            changed = busy != self.busy
+            self.busy = busy
+        if changed:
+            self.busy_changed.emit(busy)
@@ -0,0 +1,165 @@
+from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QLabel, QComboBox, QShortcut, QVBoxLayout, \
+    QHBoxLayout, QListWidget, QListWidgetItem
+from PyQt5.QtCore import Qt
+
+import sys
+
+from Helpers import *
+
+
+# number of finished jobs shown in the window
+HISTORY_LENGTH = 20
+
+
+class RunQueueWidget(QWidget):
+    def __init__(self, run_queue, loops, parent=None):
+        """
+        Constructor for the RunQueueWidget window, used to see and manage the queue of measurements
+
+        :param run_queue: RunQueue shared with the main window
+        :param loops: dict of all loops created so far (shared with the main window)
+        :param parent: main window, used to create jobs (see MainWindow.enqueue_loop)
+        """
+        super(RunQueueWidget, self).__init__()
+        self.run_queue = run_queue
+        self.loops = loops
+        self.parent = parent
+
+        self.init_ui()
+        self.run_queue.changed.connect(self.update_queue)
+        self.update_queue()
+        self.show()
+
+    """""""""""""""""""""
+    User interface
+    """""""""""""""""""""
+    def init_ui(self):
+        self.setGeometry(300, 300, 420, 480)
+        self.setMinimumSize(420, 480)
+        self.setWindowTitle("Run queue")
+        self.setWindowIcon(QtGui.QIcon("img/osciloscope_icon.png"))
+
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+
+        # jobs that are currently running
+        self.running_label = QLabel("")
+        layout.addWidget(self.running_label)
+
+        # adding loops to the queue without starting them
+        add_layout = QHBoxLayout()
+        self.loop_cb = QComboBox()
+        for name in self.loops:
+            self.loop_cb.addItem(name)
+        add_layout.addWidget(self.loop_cb)
+        self.add_btn = QPushButton("Add to queue")
+        self.add_btn.clicked.connect(self.add_job)
+        add_layout.addWidget(self.add_btn)
+        layout.addLayout(add_layout)
+
+        layout.addWidget(QLabel("Queued:"))
+        self.queue_list = QListWidget()
+        layout.addWidget(self.queue_list)
+
+        buttons_layout = QHBoxLayout()
+        self.up_btn = QPushButton("Up")
+        self.up_btn.clicked.connect(lambda: self.move_selected(-1))
+        buttons_layout.addWidget(self.up_btn)
+        self.down_btn = QPushButton("Down")
+        self.down_btn.clicked.connect(lambda: self.move_selected(1))
+        buttons_layout.addWidget(self.down_btn)
+        self.remove_btn = QPushButton("Remove")
+        self.remove_btn.clicked.connect(self.remove_selected)
+        buttons_layout.addWidget(self.remove_btn)
+        self.clear_btn = QPushButton("Clear")
+        self.clear_btn.clicked.connect(self.run_queue.clear)
+        buttons_layout.addWidget(self.clear_btn)
+        layout.addLayout(buttons_layout)
+
+        self.pause_btn = QPushButton("Pause")
+        self.pause_btn.clicked.connect(self.toggle_pause)
+        layout.addWidget(self.pause_btn)
+
+        layout.addWidget(QLabel("Finished:"))
+        self.history_list = QListWidget()
+        layout.addWidget(self.history_list)
+
+        close_shortcut = QShortcut(QtGui.QKeySequence(Qt.Key_Escape), self)
+        close_shortcut.activated.connect(self.close)
+
+    def update_queue(self):
+        """
+        Redraw the lists of jobs, called every time something changes in the queue
+
+        :return: NoneType
+        """
+        with self.run_queue.lock:
+            queued = list(self.run_queue.queued)
+            running = list(self.run_queue.running)
+            history = self.run_queue.history[-HISTORY_LENGTH:]
+            paused = self.run_queue.paused
+
+        selected = self.selected_job()
+        self.queue_list.clear()
+        for job in queued:
+            item = QListWidgetItem(job.describe())
+            item.setData(Qt.UserRole, job)
+            self.queue_list.addItem(item)
+            if job is selected:
+                self.queue_list.setCurrentItem(item)
+
+        self.history_list.clear()
+        for job in reversed(history):
+            self.history_list.addItem(job.describe())
+
+        running_text = ", ".join(job.name for job in running) if running else "nothing"
+        self.running_label.setText("Running: " + running_text + (" (queue paused)" if paused else ""))
+        self.pause_btn.setText("Resume" if paused else "Pause")
+
+        # loops could have been added since the window was opened
+        for name in self.loops:
+            if self.loop_cb.findText(name) == -1:
+                self.loop_cb.addItem(name)
+
+    """""""""""""""""""""
+    Data manipulation
+    """""""""""""""""""""
+    def add_job(self):
+        name = self.loop_cb.currentText()
+        if name in self.loops:
+            self.parent.enqueue_loop(name, start=False)
+
+    def move_selected(self, offset):
+        job = self.selected_job()
+        if job is not None:
+            self.run_queue.move(job, offset)
+
+    def remove_selected(self):
+        job = self.selected_job()
+        if job is not None:
+            self.run_queue.remove(job)
+
+    def toggle_pause(self):
+        if self.run_queue.paused:
+            self.run_queue.resume()
+        else:
+            self.run_queue.pause()
+
+    """""""""""""""""""""
+    Helper functions
+    """""""""""""""""""""
+    def selected_job(self):
+        """
+        :return: job selected in the list of queued jobs, None if nothing is selected
+        """
+        item = self.queue_list.currentItem()
+        if item is None:
+            return None
+        return item.data(Qt.UserRole)
+
+
+if __name__ == '__main__':
+    app = QApplication(sys.argv)
+    from RunQueue import RunQueue
+    ex = RunQueueWidget(RunQueue(), {})
+    sys.exit(app.exec_())
@@ -0,0 +1,110 @@
+"""
+Settling-aware waiting after every set of a loop.
+
+Instead of waiting the same (worst case) delay at every point, a loop with a settling policy reads its measured
+parameter right after the set, again and again, until two successive values agree within a tolerance or the maximum
+settle time runs out. The time it took is recorded at every point as an extra column of the data set, so it is easy to
+see where the signal was slow to settle.
+
+Settling is added to a run of a loop by prepare_settling (a SettleParameter becomes the first action of every loop in
+the loop tree that has a settling policy) and removed again by the function it returns.
+"""
+
+import time
+
+from qcodes.instrument.parameter import Parameter
+
+from Cancellation import sleep
+
+
+# time between two reads of the watched parameter (seconds)
+POLL_INTERVAL = 0.005
+
+
+class SettleParameter(Parameter):
+    """
+    Parameter whose get waits for another parameter to settle, returns the time that took (in seconds)
+    """
+    def __init__(self, watched, tolerance, max_time, interval=POLL_INTERVAL):
+        """
+        Constructor of the SettleParameter class
+
+        :param watched: parameter that is read until it settles (first action of the loop)
+        :param tolerance: largest difference of two successive reads of a settled parameter
+        :param max_time: give up waiting after this many seconds
+        :param interval: time between two reads
+        """
+        self.watched = watched
+        self.tolerance = tolerance
+        self.max_time = max_time
+        self.interval = interval
+        super(SettleParameter, self).__init__(name="{}_settle_time".format(str(watched).replace(".", "_")),
+                                              label="Settle time of {}".format(watched), unit="s",
+                                              get_cmd=self.settle, set_cmd=False)
+
+    def settle(self):
+        """
+        Read the watched parameter until two successive values agree within the tolerance
+
+        :return: time it took the parameter to settle (max_time if it did not settle)
+        """
+        start = time.perf_counter()
+        previous = self.watched.get()
+        while time.perf_counter() - start < self.max_time:
+            # stopping the loop ends the wait, the loop stops at its next stop check
+            if not sleep(self.interval):
+                break
+            value = self.watched.get()
+            if abs(value - previous) <= self.tolerance:
+                break
+            previous = value
+        return time.perf_counter() - start
+
+
+def watched_parameter(loop):
+    """
+    :param loop: qcodes ActiveLoop
+    :return: first parameter measured by the loop (not in an inner loop), None if the loop does not measure anything
+    """
+    from qcodes.actions import Task, BreakIf
+    from qcodes.loops import ActiveLoop
+
+    for action in loop.actions:
+        if not isinstance(action, (Task, BreakIf, ActiveLoop)) and not hasattr(action, "names"):
+            return action
+    return None
+
+
+def prepare_settling(loop):
+    """
+    Add a SettleParameter as the first action of every loop (in the loop tree) that has a settling policy. Has to be
+    called before the data set of the loop is created, settle times get their own arrays.
+
+    :param loop: qcodes ActiveLoop
+    :return: function that removes the added parameters again
+    """
+    from qcodes.loops import ActiveLoop
+
+    added = []
+    loops = [loop]
+    while loops:
+        current = loops.pop()
+        loops.extend(action for action in current.actions if isinstance(action, ActiveLoop))
+        policy = getattr(current, "settle", None)
+        # loops that start with an inner loop do not measure right after their set, there is nothing to wait for
+        if not policy or not current.actions or isinstance(current.actions[0], ActiveLoop):
+            continue
+        watched = watched_parameter(current)
+        if watched is None:
+            continue
+        settle_parameter = SettleParameter(watched, policy["tolerance"], policy["max_time"])
+        settle_parameter.job_task = True
+        current.actions.insert(0, settle_parameter)
+        added.append((current, settle_parameter))
+
+    def restore():
+        for current, settle_parameter in added:
+            if settle_parameter in current.actions:
+                current.actions.remove(settle_parameter)
+
+    return restore
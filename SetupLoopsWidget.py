@@ -1,5 +1,5 @@
 from PyQt5.QtWidgets import QApplication, QWidget, QLineEdit, QPushButton, QLabel, QComboBox, QDesktopWidget, QShortcut, \
-    QGridLayout, QVBoxLayout, QHBoxLayout, QSizePolicy
+    QGridLayout, QVBoxLayout, QHBoxLayout, QSizePolicy, QCheckBox
 from PyQt5.QtCore import Qt
 
 import sys
@@ -12,6 +12,10 @@ from qcodes.loops import ActiveLoop
 from qcodes.instrument.base import Instrument
 from qcodes.instrument_drivers.devices import VoltageDivider
 
+from LoopCompiler import compile_sweep, LoopCompileError
+from LoopEstimator import estimate_loop, describe_estimate, measure_latencies
+from ThreadWorker import Worker
+
 
 class LoopsWidget(QWidget):
 
@@ -203,6 +207,81 @@ class LoopsWidget(QWidget):
         self.update_action_instrument_parameters()
         self.update_sweep_instrument_parameters()
 
+        # let the instruments run the whole sweep on their own, if they can (see BufferedSweep)
+        self.buffered_cb = QCheckBox("Buffered sweep")
+        self.buffered_cb.setToolTip("Upload all setpoints to the swept instrument and read the measured values from\n"
+                                    "instrument buffers (for example a frequency sweep of a ZI lock-in measuring its\n"
+                                    "demodulators). Loops that the instruments can't run this way are ran point by\n"
+                                    "point.")
+        # sampling of the setpoints, adaptive loops use the number of steps as the point budget (see AdaptiveSweep)
+        sampling_layout = QHBoxLayout()
+        label = QLabel("Sampling:")
+        sampling_layout.addWidget(label)
+        self.sweep_mode_cb = QComboBox()
+        self.sweep_mode_cb.addItem("Uniform", "uniform")
+        self.sweep_mode_cb.addItem("Adaptive", "adaptive")
+        self.sweep_mode_cb.setToolTip("Adaptive: Steps is the number of points to measure, they are placed where the\n"
+                                      "first action parameter changes the most. With an inner loop, whole lines are\n"
+                                      "placed that way.")
+        sampling_layout.addWidget(self.sweep_mode_cb)
+        sampling_layout.addWidget(self.buffered_cb)
+        # sweep every other line of the inner loop backwards (only used if the first action is a loop)
+        self.snake_cb = QCheckBox("Snake")
+        self.snake_cb.setToolTip("If the first action is a loop, sweep every other line of it backwards, so that\n"
+                                 "there is no jump back to the start after every line. Data is stored in the\n"
+                                 "usual order.")
+        sampling_layout.addWidget(self.snake_cb)
+        self.layout().addLayout(sampling_layout)
+
+        # settling policy, after every set the first action is read until it stops changing (see Settling)
+        settle_layout = QHBoxLayout()
+        label = QLabel("Settle tolerance:")
+        label.setToolTip("After every set, read the first action parameter until two successive values differ by\n"
+                         "less than this (leave empty to only wait the fixed delay). Delay is still waited before\n"
+                         "the reading starts, set it to 0 to rely on settling alone.")
+        settle_layout.addWidget(label)
+        self.settle_tolerance = QLineEdit("")
+        settle_layout.addWidget(self.settle_tolerance)
+        label = QLabel("Max settle [s]:")
+        label.setToolTip("Stop waiting for the parameter to settle after this many seconds")
+        settle_layout.addWidget(label)
+        self.settle_max_time = QLineEdit("1")
+        settle_layout.addWidget(self.settle_max_time)
+        self.layout().addLayout(settle_layout)
+
+        # precise timing of the points, timestamps and actual delays are saved with the data (see PointTiming)
+        timing_layout = QHBoxLayout()
+        label = QLabel("Point timing:")
+        timing_layout.addWidget(label)
+        self.timing_cb = QComboBox()
+        self.timing_cb.addItem("Off", None)
+        self.timing_cb.addItem("Delay after set", "delay")
+        self.timing_cb.addItem("Fixed interval", "interval")
+        self.timing_cb.setToolTip("Delay after set: every point is measured exactly delay seconds after its set.\n"
+                                  "Fixed interval: points are measured delay seconds apart, time spent on setting,\n"
+                                  "measuring and plotting is taken out of the wait.\n"
+                                  "Both save the time of every point and the actual delay with the data.")
+        timing_layout.addWidget(self.timing_cb)
+        # read parameters of different instruments at the same time (see ConcurrentReadout)
+        self.concurrent_cb = QCheckBox("Concurrent readout")
+        self.concurrent_cb.setToolTip("Read action parameters of different instruments at the same time, so that a\n"
+                                      "point takes as long as the slowest instrument. Parameters of the same\n"
+                                      "instrument are still read one after another.")
+        timing_layout.addWidget(self.concurrent_cb)
+        self.layout().addLayout(timing_layout)
+
+        # estimated duration and data size of the loop (see LoopEstimator), updated whenever the loop data changes
+        estimate_layout = QHBoxLayout()
+        label = QLabel("Estimate:")
+        estimate_layout.addWidget(label)
+        self.estimate_label = QLabel("-")
+        estimate_layout.addWidget(self.estimate_label)
+        self.measure_latencies_btn = QPushButton("Measure latencies")
+        self.measure_latencies_btn.setToolTip("Read every parameter of the loop once to find out how long that takes\n"
+                                              "(set latencies are known once the parameters have been set)")
+        estimate_layout.addWidget(self.measure_latencies_btn)
+        self.layout().addLayout(estimate_layout)
+
         # Add a button for creating a loop
         if self.name != "":
             text = "Save changes"
@@ -223,11 +302,21 @@ class LoopsWidget(QWidget):
                                                                             act_name))
         self.action_parameter_cb.currentIndexChanged.connect(self.update_divider_value)
         self.sweep_parameter_cb.currentIndexChanged.connect(self.update_divider_value)
+        self.measure_latencies_btn.clicked.connect(self.measure_latencies)
+        for textbox in (self.textbox_lower_limit, self.textbox_upper_limit, self.textbox_num, self.textbox_step_size,
+                        self.textbox_step, self.settle_tolerance, self.settle_max_time):
+            textbox.editingFinished.connect(self.update_estimate)
+        self.sweep_parameter_cb.currentIndexChanged.connect(self.update_estimate)
+        self.timing_cb.currentIndexChanged.connect(self.update_estimate)
+        self.concurrent_cb.stateChanged.connect(self.update_estimate)
+        self.action_parameter_cb.currentIndexChanged.connect(self.update_estimate)
 
         # if the loop name has been passed to the widget, fill the fields with required data (obtained from the loop)
         if self.name != "":
             self.fill_loop_data()
 
+        self.update_estimate()
+
         # shortcuts for certain actions
         close_shortcut = QShortcut(QtGui.QKeySequence(Qt.Key_Escape), self)
         close_shortcut.activated.connect(self.close)
@@ -298,6 +387,7 @@ class LoopsWidget(QWidget):
                                                              action_parameter_cb,
                                                              action_parameter_divider, horizontal_layout]
         action_parameter_cb.currentIndexChanged.connect(self.update_divider_value)
+        action_parameter_cb.currentIndexChanged.connect(self.update_estimate)
         self.remove_buttons[action_name] = remove_action_btn
 
         # update only newly created combo boxes
@@ -322,6 +412,7 @@ class LoopsWidget(QWidget):
         self.remove_buttons[action_name].deleteLater()
         self.height -= 29
         self.resize(self.width, self.height)
+        self.update_estimate()
 
     """""""""""""""""""""
     Data manipulation
@@ -341,8 +432,6 @@ class LoopsWidget(QWidget):
             # If it fails, throw an exception
             # Otherwise, create a loop, add it to the shared dict
 
-            # Create a task that checks if loop stop has been request on each measure point of the loop
-            task = Task(self.parent.check_stop_request)
             # grab data for creating a loop from elements of the widget
             try:
                 lower = float(self.textbox_lower_limit.text())
@@ -350,6 +439,7 @@ class LoopsWidget(QWidget):
                 num = float(self.textbox_num.text())
                 delay = float(self.textbox_step.text())
                 sweep_division = float(self.sweep_parameter_divider.text())
+                settle = self.get_settle_policy()
             except Exception as e:
                 warning_string = "Errm, looks like something went wrong ! \nHINT: Measurement parameters not set. \n"\
                                  + str(e)
@@ -357,9 +447,17 @@ class LoopsWidget(QWidget):
             else:
                 # Create dividres and add them to a dict of dividers (shared with main window)
                 sweep_parameter = self.sweep_parameter_cb.currentData()
+                full_name = str(sweep_parameter)
                 if sweep_division != 1:
-                    full_name = str(sweep_parameter)
                     sweep_parameter = VoltageDivider(sweep_parameter, sweep_division)
+
+                # compute and validate all setpoints before anything is created (or sent to the instrument)
+                try:
+                    sweep_values = compile_sweep(sweep_parameter, lower, upper, num)
+                except LoopCompileError as e:
+                    show_error_message("Warning", "Loop was not created. \n" + str(e))
+                    return
+                if sweep_division != 1:
                     self.dividers[full_name] = sweep_parameter
 
                 # create a list and fill it with actions created by user (dividers if they are attached)
@@ -376,15 +474,19 @@ class LoopsWidget(QWidget):
                             if division != 1:
                                 action_parameter = VoltageDivider(action_parameter, division)
                             actions.append(action_parameter)
-                # append a task that checks for loop stop request
-                actions.append(task)
 
                 # pass dereferenced list of actions to a loops each method
                 if len(self.instruments):
-                    lp = qc.Loop(sweep_parameter.sweep(lower, upper, num=num), delay, progress_interval=20).each(*actions)
+                    lp = qc.Loop(sweep_values, delay, progress_interval=20).each(*actions)
                 else:
                     show_error_message("Warning", "U can't make a loop without instruments !")
                     return
+                lp.buffered = self.buffered_cb.isChecked()
+                lp.sweep_mode = self.sweep_mode_cb.currentData()
+                lp.snake = self.snake_cb.isChecked()
+                lp.settle = settle
+                lp.timing = self.timing_cb.currentData()
+                lp.concurrent = self.concurrent_cb.isChecked()
                 name = "loop" + str(len(self.parent.shown_loops)+1)
                 self.loops[name] = lp
                 self.actions.append(lp)
@@ -405,8 +507,6 @@ class LoopsWidget(QWidget):
         name = self.name
 
         if name in self.loops:
-            # Create a task that checks if loop stop has been request on each measure point of the loop
-            task = Task(self.parent.check_stop_request)
             # grab data for creating a loop from elements of the widget
             try:
                 lower = float(self.textbox_lower_limit.text())
@@ -414,6 +514,7 @@ class LoopsWidget(QWidget):
                 num = float(self.textbox_num.text())
                 delay = float(self.textbox_step.text())
                 sweep_division = float(self.sweep_parameter_divider.text())
+                settle = self.get_settle_policy()
             except Exception as e:
                 warning_string = "Errm, looks like something went wrong ! \nHINT: Measurement parameters not set. \n" \
                                  + str(e)
@@ -421,9 +522,17 @@ class LoopsWidget(QWidget):
             else:
                 # Create dividres and add them to a dict of dividers (shared with main window)
                 sweep_parameter = self.sweep_parameter_cb.currentData()
+                full_name = str(sweep_parameter)
                 if sweep_division != 1:
-                    full_name = str(sweep_parameter)
                     sweep_parameter = VoltageDivider(sweep_parameter, sweep_division)
+
+                # compute and validate all setpoints, the loop is left as it was if any of them is not valid
+                try:
+                    sweep_values = compile_sweep(sweep_parameter, lower, upper, num)
+                except LoopCompileError as e:
+                    show_error_message("Warning", "Changes were not saved. \n" + str(e))
+                    return
+                if sweep_division != 1:
                     self.dividers[full_name] = sweep_parameter
                 # create a list and fill it with actions created by user (dividers if they are attached)
                 actions = []
@@ -439,12 +548,16 @@ class LoopsWidget(QWidget):
                             if division != 1:
                                 action_parameter = VoltageDivider(action_parameter, division)
                             actions.append(action_parameter)
-                # append a task that checks for loop stop request
-                actions.append(task)
 
-                self.loops[name].sweep_values = sweep_parameter.sweep(lower, upper, num=num)
+                self.loops[name].sweep_values = sweep_values
                 self.loops[name].delay = delay
                 self.loops[name].actions = list(actions)
+                self.loops[name].buffered = self.buffered_cb.isChecked()
+                self.loops[name].sweep_mode = self.sweep_mode_cb.currentData()
+                self.loops[name].snake = self.snake_cb.isChecked()
+                self.loops[name].settle = settle
+                self.loops[name].timing = self.timing_cb.currentData()
+                self.loops[name].concurrent = self.concurrent_cb.isChecked()
 
             self.parent.update_loops_preview(edit=name)
         else:
@@ -554,6 +667,16 @@ class LoopsWidget(QWidget):
         self.textbox_upper_limit.setText(str(self.loop_values[1]))
         self.textbox_num.setText(str(self.loop_values[2]))
         self.textbox_step.setText(str(self.loop_values[3]))
+        self.buffered_cb.setChecked(getattr(self.loop, "buffered", False))
+        self.snake_cb.setChecked(getattr(self.loop, "snake", False))
+        settle = getattr(self.loop, "settle", None)
+        if settle:
+            self.settle_tolerance.setText(str(settle["tolerance"]))
+            self.settle_max_time.setText(str(settle["max_time"]))
+        self.sweep_mode_cb.setCurrentIndex(max(0, self.sweep_mode_cb.findData(getattr(self.loop, "sweep_mode",
+                                                                                          "uniform"))))
+        self.timing_cb.setCurrentIndex(max(0, self.timing_cb.findData(getattr(self.loop, "timing", None))))
+        self.concurrent_cb.setChecked(getattr(self.loop, "concurrent", False))
 
         # add all actions that are not the first one or a Task, since the first one is added by default, and we don't
         # want to display a Task in list of actions
@@ -784,6 +907,98 @@ class LoopsWidget(QWidget):
         else:
             self.loop_values.append(1)
 
+    def get_settle_policy(self):
+        """
+        :return: dict with tolerance and max_time of the settling policy, None if settling is not used
+        """
+        if self.settle_tolerance.text().strip() == "":
+            return None
+        tolerance = float(self.settle_tolerance.text())
+        max_time = float(self.settle_max_time.text())
+        if tolerance < 0 or max_time < 0:
+            raise ValueError("Settle tolerance and max settle time can't be negative")
+        return {"tolerance": tolerance, "max_time": max_time}
+
+    def build_preview_loop(self):
+        """
+        Build a loop from the data currently in the window, without registering it or its dividers anywhere (used to
+        estimate how long the loop would take)
+
+        :return: qcodes ActiveLoop, None if the data in the window does not make a valid loop
+        """
+        if not len(self.instruments):
+            return None
+        try:
+            lower = float(self.textbox_lower_limit.text())
+            upper = float(self.textbox_upper_limit.text())
+            num = float(self.textbox_num.text())
+            delay = float(self.textbox_step.text())
+            sweep_division = float(self.sweep_parameter_divider.text())
+            settle = self.get_settle_policy()
+            sweep_parameter = self.sweep_parameter_cb.currentData()
+            if sweep_division != 1:
+                sweep_parameter = VoltageDivider(sweep_parameter, sweep_division)
+            sweep_values = compile_sweep(sweep_parameter, lower, upper, num)
+            actions = []
+            for action_array in self.current_loop_actions_dictionary.values():
+                if action_array is not None and action_array[1].currentData() is not None:
+                    action_parameter = action_array[1].currentData()
+                    division = float(action_array[2].text())
+                    if division != 1:
+                        action_parameter = VoltageDivider(action_parameter, division)
+                    actions.append(action_parameter)
+            if not actions:
+                return None
+            lp = qc.Loop(sweep_values, delay).each(*actions)
+        except Exception:
+            return None
+        lp.settle = settle
+        lp.timing = self.timing_cb.currentData()
+        lp.concurrent = self.concurrent_cb.isChecked()
+        return lp
+
+    def update_estimate(self):
+        """
+        Show estimated duration and data size of the loop defined by the data currently in the window
+
+        :return: NoneType
+        """
+        lp = self.build_preview_loop()
+        if lp is None:
+            self.estimate_label.setText("-")
+            return
+        estimate = estimate_loop(lp, self.parent.get_latencies())
+        self.estimate_label.setText(describe_estimate(estimate))
+        if estimate["unmeasured"]:
+            self.estimate_label.setToolTip("Latencies of these parameters are not known (counted as 0):\n" +
+                                           "\n".join(sorted(estimate["unmeasured"])))
+        else:
+            self.estimate_label.setToolTip("")
+
+    def measure_latencies(self):
+        """
+        Measure get latencies of all parameters of the loop defined in the window (in a worker thread), then update
+        the estimate. Not done while a job in the run queue is using any of the instruments of the loop.
+
+        :return: NoneType
+        """
+        lp = self.build_preview_loop()
+        if lp is None:
+            show_error_message("Warning", "Loop data is not valid, there is nothing to measure")
+            return
+        run_queue = getattr(self.parent, "run_queue", None)
+        if run_queue is not None and run_queue.is_busy(get_loop_instruments(lp)):
+            show_error_message("Warning", "Some of the instruments of this loop are used by a running measurement,\n"
+                                          "latencies can be measured once it is done")
+            return
+        self.measure_latencies_btn.setDisabled(True)
+        worker = Worker(lambda: measure_latencies(lp, self.parent.latencies), False)
+        worker.signals.error.connect(lambda error: show_error_message("Warning", str(error[1])))
+        worker.signals.finished.connect(lambda: self.measure_latencies_btn.setDisabled(False))
+        worker.signals.finished.connect(self.update_estimate)
+        worker.signals.finished.connect(self.parent.update_loop_estimates)
+        self.parent.thread_pool.start(worker)
+
     def switch_upper_and_lower(self):
         lower = self.textbox_upper_limit.text()
         upper = self.textbox_lower_limit.text()
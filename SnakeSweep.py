@@ -0,0 +1,94 @@
+"""
+Serpentine (snake) ordering of loops with an inner loop.
+
+Normally every line of the inner loop is swept from the first to the last setpoint, so after every line the swept
+instrument jumps all the way back (and has to ramp and settle). In snake mode every other line is swept backwards, the
+inner loop starts right where the previous line ended. Points of the backward lines are written to the data set at the
+positions they would have in a normal (raster) sweep, so the data set, live plots and saved files are the same as if
+the loop was ran without snake mode.
+
+Snake mode is applied to a run of a loop by prepare_snake, which returns a function that undoes all changes made to the
+loop once the run is over.
+"""
+
+from qcodes.actions import Task
+from qcodes.instrument.sweep_values import SweepFixedValues
+
+
+class SnakeSweepValues(SweepFixedValues):
+    """
+    Sweep values that are iterated backwards on every other line
+    """
+    def __init__(self, sweep_values):
+        """
+        Constructor of the SnakeSweepValues class
+
+        :param sweep_values: sweep values of the inner loop (in the raster order)
+        """
+        super(SnakeSweepValues, self).__init__(sweep_values.parameter, list(sweep_values))
+        self.backwards = False
+
+    def __iter__(self):
+        return iter(self._values[::-1] if self.backwards else self._values)
+
+    def flip(self):
+        """
+        Change the direction of the sweep, called after every line of the inner loop
+
+        :return: NoneType
+        """
+        self.backwards = not self.backwards
+
+
+def can_snake(loop):
+    """
+    :param loop: qcodes ActiveLoop
+    :return: True if snake mode can be used with this loop (the loop has an inner loop with plain sweep values)
+    """
+    from qcodes.loops import ActiveLoop
+
+    if not loop.actions or not isinstance(loop.actions[0], ActiveLoop):
+        return False
+    # combined (multi parameter) sweeps set their values by index, those are not reordered
+    return not hasattr(loop.actions[0].sweep_values, "parameters")
+
+
+def prepare_snake(loop, data_set):
+    """
+    Make the next run of the loop sweep its inner loop in snake order and store the data in raster order. Has to be
+    called before the line returns are prepared (see MovePlanner.prepare_line_returns), they look up the start of the
+    next line after its direction has changed.
+
+    :param loop: qcodes ActiveLoop with an inner loop as its first action (see can_snake)
+    :param data_set: data set the loop is going to write to
+    :return: function that restores the loop and the data set to the way they were
+    """
+    inner = loop.actions[0]
+    original_values = inner.sweep_values
+    snake_values = SnakeSweepValues(original_values)
+    inner.sweep_values = snake_values
+
+    # direction changes after every line of the inner loop (before the next one starts), the task is appended after
+    # all other actions because the data set stores values by the indices of the actions, those must not change
+    flip = Task(snake_values.flip)
+    flip.job_task = True
+    loop.actions.append(flip)
+
+    # points of the backward lines are stored at their raster positions
+    row_length = len(original_values)
+    original_store = data_set.store
+
+    def store(loop_indices, ids_values):
+        if len(loop_indices) > 1 and loop_indices[0] % 2 == 1:
+            loop_indices = (loop_indices[0], row_length - 1 - loop_indices[1]) + tuple(loop_indices[2:])
+        original_store(loop_indices, ids_values)
+
+    data_set.store = store
+
+    def restore():
+        inner.sweep_values = original_values
+        if flip in loop.actions:
+            loop.actions.remove(flip)
+        data_set.store = original_store
+
+    return restore
@@ -0,0 +1,177 @@
+"""
+Startup profiler of the GUI.
+
+Enabled by starting the GUI with: python qcodesMainWindow.py --profile-startup[=report.json]
+Records wall time of imports (qcodes and every module of this repo), of the main steps of building the main window,
+of driver scanning and the time of the first paint of the main window, and writes them to a JSON report. Only the
+standard library is used here because this has to be imported before anything else.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import platform
+import importlib.abc
+from contextlib import contextmanager
+
+
+# folder containing the sources of the GUI, imports of modules from this folder are timed
+REPO_FOLDER = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_REPORT = "startup_profile.json"
+FLAG = "--profile-startup"
+
+
+class TimedLoader(importlib.abc.Loader):
+    """
+    Wraps the loader of a module and records how long executing that module takes (including the imports it does)
+    """
+    def __init__(self, loader, name, profiler):
+        self.loader = loader
+        self.name = name
+        self.profiler = profiler
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        with self.profiler.measure(self.name, category="import"):
+            self.loader.exec_module(module)
+
+    def __getattr__(self, item):
+        # everything else (get_code, get_resource_reader, ...) is handled by the original loader
+        return getattr(self.loader, item)
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    """
+    Meta path finder that doesn't find anything by itself, it asks the other finders and wraps the loader of the modules
+    that are interesting (qcodes and modules of this repo) with a TimedLoader
+    """
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def find_spec(self, fullname, path, target=None):
+        if not self.is_timed(fullname, path):
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = TimedLoader(spec.loader, fullname, self.profiler)
+                return spec
+        return None
+
+    @staticmethod
+    def is_timed(fullname, path):
+        """
+        :return: True if import of this module should be timed (qcodes and its main subpackages, modules of this repo)
+        """
+        if fullname == "qcodes" or (fullname.startswith("qcodes.") and fullname.count(".") == 1):
+            return True
+        top_level = fullname.split(".")[0]
+        return os.path.exists(os.path.join(REPO_FOLDER, top_level + ".py")) or \
+            os.path.isdir(os.path.join(REPO_FOLDER, top_level))
+
+
+class StartupProfiler:
+    """
+    Collects timing records. When not enabled, all methods are (almost) free so the calls can stay in the code.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.report_path = DEFAULT_REPORT
+        # all times are relative to the moment this module was imported (first thing the GUI does)
+        self.start = time.perf_counter()
+        self.records = []
+        self.marks = {}
+        self.lock = threading.Lock()
+
+    def enable_from_argv(self, argv):
+        """
+        Enable profiling if the GUI was started with the --profile-startup flag. Flag is removed from argv.
+
+        :param argv: list of command line arguments (sys.argv)
+        :return: NoneType
+        """
+        for argument in list(argv[1:]):
+            if argument == FLAG or argument.startswith(FLAG + "="):
+                argv.remove(argument)
+                path = argument[len(FLAG) + 1:]
+                self.enable(path if path else DEFAULT_REPORT)
+
+    def enable(self, report_path=DEFAULT_REPORT):
+        """
+        Start profiling, installs import timer
+
+        :param report_path: location of the JSON report
+        :return: NoneType
+        """
+        if self.enabled:
+            return
+        self.enabled = True
+        self.report_path = report_path
+        sys.meta_path.insert(0, ImportTimer(self))
+
+    @contextmanager
+    def measure(self, name, category="phase"):
+        """
+        Context manager that records wall time of the code ran within it
+
+        :param name: name of the record (module name for imports)
+        :param category: type of the record ("import", "phase", "drivers", ...)
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self.lock:
+                self.records.append({"name": name,
+                                     "category": category,
+                                     "start": round(start - self.start, 6),
+                                     "duration": round(end - start, 6),
+                                     "thread": threading.current_thread().name})
+
+    def mark(self, name):
+        """
+        Record the time of an event (first paint for example). Only the first occurrence of the event is recorded
+
+        :param name: name of the event
+        :return: NoneType
+        """
+        if self.enabled and name not in self.marks:
+            self.marks[name] = round(time.perf_counter() - self.start, 6)
+
+    def write_report(self):
+        """
+        Write everything recorded so far to the report file (JSON)
+
+        :return: NoneType
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            records = list(self.records)
+        report = {"created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                  "python": platform.python_version(),
+                  "platform": platform.platform(),
+                  "marks": self.marks,
+                  "records": sorted(records, key=lambda record: record["start"])}
+        try:
+            with open(self.report_path, "w") as report_file:
+                json.dump(report, report_file, indent=1)
+        except OSError as e:
+            print("Could not write startup profile:", e)
+        else:
+            print("Startup profile written to", os.path.abspath(self.report_path))
+
+
+# one profiler shared by all modules of the GUI
+profiler = StartupProfiler()
@@ -0,0 +1,378 @@
+"""
+Station configuration files, used to bring up the whole setup (instruments, dividers, derived parameters) at once.
+
+Example of a station config file (JSON):
+
+{
+  "instruments": [
+    {"name": "ivvi", "driver": "IVVI", "address": "ASRL1::INSTR", "kwargs": {"numdacs": 16}},
+    {"name": "lockin", "driver": "SR830", "address": "GPIB0::8::INSTR"},
+    {"name": "dummy", "driver": "DummyInstrument", "kwargs": {"gates": ["g1", "g2"]}}
+  ],
+  "dividers": [
+    {"instrument": "ivvi", "parameter": "dac1", "division": 10}
+  ],
+  "parameters": [
+    {"instrument": "lockin", "name": "R2", "label": "R squared", "unit": "V^2", "get_cmd": "lockin_R() ** 2"}
+  ],
+  "ramp_rates": [
+    {"instrument": "ivvi", "parameter": "dac1", "rate": 500}
+  ]
+}
+
+"driver" is the name of the driver (the same name that is shown in the AddInstrumentWidget), or a full path to the
+class ("package.module.ClassName") for drivers that are not part of qcodes. get_cmd of derived parameters is evaluated
+the same way as in AddNewParameterWidget, parameters are called as functions named instrument_parameter(). Ramp rates
+are maximum rates (instrument units per second) parameters are ramped with when they are moved (see MovePlanner).
+
+All instruments are connected in parallel, except the ones on the same VISA bus (same GPIB board, serial port, ...)
+which are connected one after another. Instruments that fail to connect are reported and skipped, everything else is
+still loaded.
+"""
+
+import json
+import math
+import importlib
+
+from PyQt5.QtCore import QObject, QThreadPool, pyqtSignal
+
+from InstrumentConnector import InstrumentConnection, DEFAULT_CONNECTION_TIMEOUT, prepare_instrument
+
+
+class StationConfigError(Exception):
+    """
+    Raised if the station config file can not be read or is not valid
+    """
+    pass
+
+
+def load_station_config(path):
+    """
+    Read and validate a station config file
+
+    :param path: location of the JSON file
+    :return: dict with "instruments", "dividers", "parameters" and "ramp_rates" lists
+    """
+    try:
+        with open(path, "r") as config_file:
+            config = json.load(config_file)
+    except (OSError, ValueError) as e:
+        raise StationConfigError("Could not read station config {}: {}".format(path, e))
+
+    if not isinstance(config, dict):
+        raise StationConfigError("Station config has to be a JSON object")
+    for section in ["instruments", "dividers", "parameters", "ramp_rates"]:
+        config.setdefault(section, [])
+        if not isinstance(config[section], list):
+            raise StationConfigError("'{}' in station config has to be a list".format(section))
+
+    names = set()
+    for instrument in config["instruments"]:
+        if "name" not in instrument or "driver" not in instrument:
+            raise StationConfigError("Every instrument needs a 'name' and a 'driver': {}".format(instrument))
+        if instrument["name"] in names:
+            raise StationConfigError("Instrument name {} is used more than once".format(instrument["name"]))
+        names.add(instrument["name"])
+        instrument.setdefault("address", "")
+        instrument.setdefault("kwargs", {})
+    for divider in config["dividers"]:
+        if not {"instrument", "parameter", "division"} <= set(divider):
+            raise StationConfigError("Every divider needs 'instrument', 'parameter' and 'division': {}".format(divider))
+    for parameter in config["parameters"]:
+        if not {"instrument", "name", "get_cmd"} <= set(parameter):
+            raise StationConfigError("Every parameter needs 'instrument', 'name' and 'get_cmd': {}".format(parameter))
+    for ramp_rate in config["ramp_rates"]:
+        if not {"instrument", "parameter", "rate"} <= set(ramp_rate):
+            raise StationConfigError("Every ramp rate needs 'instrument', 'parameter' and 'rate': {}".format(ramp_rate))
+        if not isinstance(ramp_rate["rate"], (int, float)) or ramp_rate["rate"] <= 0:
+            raise StationConfigError("Ramp rate has to be a positive number: {}".format(ramp_rate))
+    return config
+
+
+def bus_key(address):
+    """
+    Figure out which bus the instrument is connected to, instruments on the same bus are connected one at a time
+
+    GPIB0::8::INSTR -> GPIB0, ASRL3::INSTR -> ASRL3, COM3 -> ASRL3, TCPIP0::192.168.1.5::inst0::INSTR ->
+    TCPIP0::192.168.1.5 (instruments with different IP addresses don't share anything)
+
+    :param address: VISA address of the instrument
+    :return: string identifying the bus, or None if the instrument has no address (no bus to share)
+    """
+    address = address.strip().upper()
+    if not address:
+        return None
+    parts = address.split("::")
+    interface = parts[0]
+    if interface.startswith("COM") and interface[3:].isdigit():
+        return "ASRL" + interface[3:]
+    if interface.startswith("TCPIP") and len(parts) > 1:
+        return interface + "::" + parts[1]
+    return interface
+
+
+def group_by_bus(instruments):
+    """
+    :param instruments: list of instrument entries from the station config
+    :return: list of lists of instrument entries, each list contains instruments that share a bus (in config order)
+    """
+    groups = {}
+    for index, instrument in enumerate(instruments):
+        key = bus_key(instrument["address"])
+        # instruments without a bus get a group of their own
+        groups.setdefault(key if key is not None else index, []).append(instrument)
+    return list(groups.values())
+
+
+class ParameterFunctions(dict):
+    """
+    Functions available to get_cmd of derived parameters: math, and instrument_parameter() for every parameter of every
+    instrument (same as in AddNewParameterWidget). Parameters are looked up by name every time they are called, so
+    instruments connected after the config was loaded, and get functions wrapped later (see LatencyMonitor), are used.
+    """
+    def __init__(self, instruments):
+        """
+        :param instruments: dict of all instruments (shared with the main window)
+        """
+        super(ParameterFunctions, self).__init__(math=math)
+        self.instruments = instruments
+
+    def __missing__(self, key):
+        for instrument_name, instrument in list(self.instruments.items()):
+            for parameter_name in list(instrument.parameters):
+                if instrument_name + "_" + parameter_name == key:
+                    self[key] = lambda: self.instruments[instrument_name].parameters[parameter_name].get()
+                    return self[key]
+        raise KeyError(key)
+
+
+def resolve_drivers(config, catalog):
+    """
+    Find the catalog entries of the drivers of all instruments in the station config. Runs in the GUI thread (the
+    catalog is not thread safe), the catalog is refreshed if some of the drivers are not in it yet (first start, qcodes
+    was updated), so that workers creating the instruments never have to touch it.
+
+    :param config: station config (see load_station_config)
+    :param catalog: DriverCatalog of the main window
+    :return: tuple (dict of instrument name : catalog entry, None for drivers that are not cataloged qcodes drivers,
+            list of (name, False, message) for instruments whose drivers are unknown)
+    """
+    def find(driver):
+        entry = catalog.find(driver)
+        return entry if entry is not None and entry["class"] is not None else None
+
+    # dummy instruments and full class paths are not looked up in the catalog
+    cataloged = [instrument for instrument in config["instruments"]
+                 if instrument["driver"] != "DummyInstrument" and "." not in instrument["driver"]]
+    if any(find(instrument["driver"]) is None for instrument in cataloged):
+        catalog.refresh()
+
+    entries = {instrument["name"]: None for instrument in config["instruments"]}
+    unknown = []
+    for instrument in cataloged:
+        entry = find(instrument["driver"])
+        if entry is None:
+            unknown.append((instrument["name"], False, "Unknown driver: " + instrument["driver"]))
+        entries[instrument["name"]] = entry
+    return entries, unknown
+
+
+def create_instrument(entry, driver, name, address, kwargs):
+    """
+    Create an instrument described in the station config. Runs in a worker thread.
+
+    :param entry: catalog entry of the driver (see resolve_drivers), None if the driver is not a cataloged qcodes driver
+    :param driver: name of the driver or full path to the class of the instrument
+    :param name: name of the instrument
+    :param address: address of the instrument (can be empty for instruments that don't need it)
+    :param kwargs: additional keyword arguments passed to the constructor of the instrument
+    :return: newly created instrument
+    """
+    from DriverCatalog import DriverCatalog
+
+    if driver == "DummyInstrument":
+        instrument_class = getattr(importlib.import_module("DemoDummy"), "DummyInstrument")
+        kwargs = dict({"gates": ["g1", "g2"]}, **kwargs)
+    elif entry is not None:
+        instrument_class = DriverCatalog.load_class(entry)
+    elif "." in driver:
+        module_name, class_name = driver.rsplit(".", 1)
+        instrument_class = getattr(importlib.import_module(module_name), class_name)
+    else:
+        raise StationConfigError("Unknown driver: " + driver)
+    if address:
+        return instrument_class(name, address, **kwargs)
+    return instrument_class(name, **kwargs)
+
+
+class StationLoader(QObject):
+    """
+    Connects to all instruments of a station config, then attaches dividers and creates derived parameters.
+
+    Signals:
+        progress(name, ok, message) emitted every time an instrument finishes connecting (or fails to)
+        finished(report) emitted when everything is done, report is a list of (name, ok, message) tuples
+    """
+    progress = pyqtSignal(str, bool, str)
+    finished = pyqtSignal(list)
+
+    def __init__(self, config, instruments, dividers, drivers, unknown=None, connections=None, thread_pool=None,
+                 timeout=DEFAULT_CONNECTION_TIMEOUT, parent=None):
+        """
+        Constructor of the StationLoader class
+
+        :param config: station config (see load_station_config)
+        :param instruments: dict of instruments shared with the main window, connected instruments are added to it
+        :param dividers: dict of dividers shared with the main window, dividers from the config are added to it
+        :param drivers: dict of instrument name : catalog entry of its driver (see resolve_drivers)
+        :param unknown: list of (name, False, message) for instruments whose drivers are unknown, they are reported and
+                not connected
+        :param connections: dict of pending connections shared with the main window (name : InstrumentConnection)
+        :param thread_pool: thread pool in which instruments are created
+        :param timeout: number of seconds each instrument is given to connect
+        :param parent: parent QObject
+        """
+        super(StationLoader, self).__init__(parent)
+        self.config = config
+        self.instruments = instruments
+        self.dividers = dividers
+        self.drivers = drivers
+        self.unknown = unknown if unknown is not None else []
+        self.connections = connections if connections is not None else {}
+        self.thread_pool = thread_pool if thread_pool is not None else QThreadPool.globalInstance()
+        self.timeout = timeout
+
+        # list of (name, ok, message), one for every instrument, divider and parameter in the config
+        self.report = []
+        # instruments waiting to be connected, one list per bus
+        self.queues = []
+        self.running = 0
+
+    def start(self):
+        """
+        Start connecting, one instrument from every bus at the same time
+
+        :return: NoneType
+        """
+        pending = []
+        self.report.extend(self.unknown)
+        unknown = set(name for name, ok, message in self.unknown)
+        for instrument in self.config["instruments"]:
+            name = instrument["name"]
+            if name in unknown:
+                continue
+            elif name in self.instruments:
+                self.report.append((name, True, "Already connected"))
+            elif name in self.connections and self.connections[name].is_active():
+                self.report.append((name, False, "Already being connected to"))
+            else:
+                pending.append(instrument)
+
+        self.queues = group_by_bus(pending)
+        self.running = len(self.queues)
+        if not self.queues:
+            self.finish()
+        for queue in self.queues:
+            self.connect_next(queue)
+
+    def connect_next(self, queue):
+        """
+        Start connecting to the next instrument on a bus, or mark the bus as done if there is nothing left
+
+        :param queue: list of instrument entries waiting for the same bus
+        :return: NoneType
+        """
+        if not queue:
+            self.running -= 1
+            if self.running == 0:
+                self.finish()
+            return
+
+        instrument = queue.pop(0)
+        name = instrument["name"]
+        connection = InstrumentConnection(
+            name, lambda: create_instrument(self.drivers.get(name), instrument["driver"], name, instrument["address"],
+                                            instrument["kwargs"]),
+            self.thread_pool, self.timeout, parent=self)
+        connection.connected.connect(lambda name, created: self.on_connected(queue, name, created))
+        connection.failed.connect(lambda name, message: self.on_failed(queue, name, message))
+        self.connections[name] = connection
+        connection.start()
+
+    def on_connected(self, queue, name, instrument):
+        self.connections.pop(name, None)
+        prepare_instrument(instrument)
+        self.instruments[name] = instrument
+        self.report.append((name, True, "Connected"))
+        self.progress.emit(name, True, "Connected")
+        self.connect_next(queue)
+
+    def on_failed(self, queue, name, message):
+        self.connections.pop(name, None)
+        self.report.append((name, False, message))
+        self.progress.emit(name, False, message)
+        self.connect_next(queue)
+
+    def cancel(self):
+        """
+        Stop connecting, instruments that are still waiting for their bus are not connected at all
+
+        :return: NoneType
+        """
+        for queue in self.queues:
+            for instrument in queue:
+                self.report.append((instrument["name"], False, "Cancelled"))
+            del queue[:]
+        for name, connection in list(self.connections.items()):
+            if connection.parent() is self:
+                connection.cancel()
+
+    def finish(self):
+        """
+        All instruments are done, attach dividers and create derived parameters of the instruments that connected
+
+        :return: NoneType
+        """
+        self.attach_dividers()
+        self.add_parameters()
+        self.finished.emit(self.report)
+
+    def attach_dividers(self):
+        from qcodes.instrument_drivers.devices import VoltageDivider
+
+        for divider in self.config["dividers"]:
+            name = "{}.{} divider".format(divider["instrument"], divider["parameter"])
+            try:
+                parameter = self.instruments[divider["instrument"]].parameters[divider["parameter"]]
+                division = float(divider["division"])
+                if division != 1:
+                    self.dividers[str(parameter)] = VoltageDivider(parameter, division)
+            except KeyError as e:
+                self.report.append((name, False, "Unknown instrument or parameter: {}".format(e)))
+            except Exception as e:
+                self.report.append((name, False, str(e)))
+            else:
+                self.report.append((name, True, "Attached"))
+
+    def add_parameters(self):
+        # functions available to get_cmd of derived parameters (see ParameterFunctions)
+        functions = ParameterFunctions(self.instruments)
+
+        for parameter in self.config["parameters"]:
+            name = "{}.{}".format(parameter["instrument"], parameter["name"])
+            try:
+                instrument = self.instruments[parameter["instrument"]]
+                get_cmd = parameter["get_cmd"]
+                # compile now so that typos are reported while loading and not in the middle of a measurement
+                code = compile(get_cmd, name, "eval")
+                instrument.add_parameter(parameter["name"], label=parameter.get("label", parameter["name"]),
+                                         unit=parameter.get("unit", ""),
+                                         get_cmd=lambda code=code: eval(code, globals(), functions))
+                # get_cmd can read any instrument, not only the one the parameter was added to (see ConcurrentReadout)
+                instrument.parameters[parameter["name"]].reads_any_instrument = True
+            except KeyError as e:
+                self.report.append((name, False, "Unknown instrument: {}".format(e)))
+            except Exception as e:
+                self.report.append((name, False, str(e)))
+            else:
+                self.report.append((name, True, "Created"))
@@ -1,7 +1,12 @@
 from PyQt5.QtCore import pyqtSlot, QRunnable, QObject, pyqtSignal
 import traceback
 import sys
-import time
+
+from Cancellation import CancellationToken
+
+
+# time between two runs of a repeating worker (seconds)
+REPEAT_INTERVAL = 3
 
 
 class Worker(QRunnable):
@@ -26,7 +31,9 @@ class Worker(QRunnable):
         self.kwargs = kwargs
         self.signals = WorkerSignals()
 
-        self.stop_requested = False
+        # cancelling the token stops a repeating worker right away (also while it waits for the next repetition), it
+        # is bound to the worker thread so that the function ran by the worker can be interrupted as well
+        self.token = CancellationToken(name=getattr(func, "__name__", ""))
         if repeat == True:
             self.repeat = True
         else:
@@ -35,6 +42,26 @@ class Worker(QRunnable):
         # Add the callback to our kwargs
         # kwargs['progress_callback'] = self.signals.progress
 
+    @property
+    def stop_requested(self):
+        """
+        :return: True if the worker has been stopped
+        """
+        return self.token.is_cancelled()
+
+    @stop_requested.setter
+    def stop_requested(self, value):
+        if value:
+            self.token.cancel("stop requested")
+
+    def stop(self):
+        """
+        Stop the worker (a repeating worker stops right away, a single run can notice it trough the token)
+
+        :return: NoneType
+        """
+        self.token.cancel("stop requested")
+
     @pyqtSlot()
     def run(self):
         """
@@ -42,11 +69,14 @@ class Worker(QRunnable):
         """
         # Retrieve args/kwargs here; and fire processing using them
 
+        with self.token.bound():
+            self._run()
+
+    def _run(self):
         # if what we want is to repeat this action until a stop is called then True will be passed
         if self.repeat:
-            # stop requested is a signal used and checked on each iteration of this loop to check if the loop execution
-            # should proceed
-            while not self.stop_requested:
+            # token is checked on each iteration of this loop to check if the loop execution should proceed
+            while not self.token.poll():
                 try:
                     result = self.func(*self.args, **self.kwargs)
                 except:
@@ -57,10 +87,10 @@ class Worker(QRunnable):
                     self.signals.result.emit(result)  # Return the result of the processing
                 finally:
                     self.signals.finished.emit()  # Done
-                # this time sleep determines how long to wait before continuing with the loop
-                time.sleep(3)
-            else:
-                print("Stop has been requested !")
+                # this determines how long to wait before continuing with the loop, returns early on stop
+                if not self.token.sleep(REPEAT_INTERVAL):
+                    break
+            print("Stop has been requested !")
         # otherwise if we dont want it to loop, but rather execute just once, then False will be passed and this code
         # will get executed
         else:
@@ -1,47 +0,0 @@
-# instrument model naming is inconsistent.
-# I had to remap some names to instanciate the class that represents that model
-correct_names = {"PCIE_1751": "Advantech_PCIE_1751",
-                 "E8267C": "E8267",
-                 "E8527D": "Agilent_E8527D",
-                 "HP33210A": "Agilent_HP33210A",
-                 "ATS": "AlazarTech_ATS",
-                 "ATS9870": "AlazarTech_ATS9870",
-                 "ATS_acquisition_controllers": "Demodulation_AcquisitionController",
-                 "KeysightAgilent_33XXX": "WaveformGenerator_33XXX",
-                 "Base_SPDT": "SPDT_Base",
-                 "ILM200": "OxfordInstruments_ILM200",
-                 "IPS120": "OxfordInstruments_IPS120",
-                 "QDac_channels": "QDac",
-                 "DG4000": "Rigol_DG4000",
-                 "SGS100A": "RohdeSchwarz_SGS100A",
-                 "SMR40": "RohdeSchwarz_SMR40",
-                 "USB_SA124B": "SignalHound_USB_SA124B",
-                 "SG384": "SRS_SG384",
-                 "AWG5014": "Tektronix_AWG5014",
-                 "AWG520": "Tektronix_AWG520",
-                 "AWG5200": "Tektronix_AWG5200",
-                 "Keithley_2600_channels": "Keithley_2600",
-                 "DAC20bit": "IST_20",
-                 "ATS9360": "AlazarTech_ATS9360",
-                 "Base_SDTP": "SPDT_Base",
-                 "Agilent_34450A": "Agilent_34450A",
-                 "DAC16bit": "IST_16",
-                 "FastDUCK": "IST_fastDUCK_20",
-                 "AimTTi_PL601P_channels": "AimTTi",
-                 "ATS9373": "AlazarTech_ATS9373",
-                 "Keysight_34410A_submodules": "Keysight_34410A",
-                 "Keysight_34460A_submodules": "Keysight_34460A",
-                 "Keysight_34461A_submodules": "Keysight_34461A",
-                 "Keysight_34465A_submodules": "Keysight_34465A",
-                 "Keysight_34470A_submodules": "Keysight_34470A",
-                 "Keysight_B2962A": "B2962AChannel",
-                 "DP821": "RigolDP821",
-                 "DP831": "RigolDP831",
-                 "DP832": "RigolDP832",
-                 "HMC8041": "RohdeSchwarzHMC8041",
-                 "HMC8042": "RohdeSchwarzHMC8042",
-                 "HMC8043": "RohdeSchwarzHMC8043",
-                 "DPO7200xx": "TektronixDPO7000xx",
-                 "Keithley_2450": "Keithley2450",
-                 "Keithley_s46": "S46"
-                 }
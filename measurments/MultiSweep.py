@@ -6,11 +6,15 @@ from PyQt5.QtCore import Qt
 import sys
 from Helpers import *
 
+import qcodes as qc
 from qcodes.actions import Task
 from qcodes.loops import ActiveLoop
 from qcodes.instrument.base import Instrument
 from qcodes.instrument_drivers.devices import VoltageDivider
 
+from LoopCompiler import LoopCompileError
+from LockstepSweep import compile_lockstep_sweep
+
 class MultiSweep(QWidget):
 
     submitted = pyqtSignal()
@@ -47,6 +51,11 @@ class MultiSweep(QWidget):
         self.height = 340
         self.setGeometry(int(0.05 * width) + 620, int(0.05 * height), self.width, self.height)
         self.setMinimumSize(400, 340)
+        if self.name != "":
+            self.setWindowTitle("Editing {}".format(self.name))
+        else:
+            self.setWindowTitle("Multi sweep")
+        self.setWindowIcon(QtGui.QIcon("img/osciloscope_icon.png"))
 
         self.grid_layout = QGridLayout()
         self.setLayout(self.grid_layout)
@@ -107,6 +116,10 @@ class MultiSweep(QWidget):
         main_sweep_parameter_grid_layout.addWidget(self.sweep_division, 0, 8, 2, 1)
         self.sweep_parameter_combobox.currentIndexChanged.connect(lambda: self.update_division(
             self.sweep_parameter_combobox, self.sweep_division))
+        # [start, end, instrument combobox, parameter combobox, division] for every swept parameter
+        self.sweep_params_data["sweep_param_0"] = [self.start_line_edit, self.end_line_edit,
+                                                   self.sweep_instrument_combobox, self.sweep_parameter_combobox,
+                                                   self.sweep_division]
 
         line = QFrame()
         line.setFrameShape(QFrame.HLine)
@@ -140,6 +153,9 @@ class MultiSweep(QWidget):
         main_action_parameter_grid_layout.addWidget(self.action_parameter_divider, 1, 7, 1, 3)
         self.action_parameter_combobox.currentIndexChanged.connect(lambda: self.update_division(
             self.action_parameter_combobox, self.action_parameter_divider))
+        # [instrument combobox, parameter combobox, division] for every action parameter
+        self.action_params_data["action_param_0"] = [self.action_instrument_combobox, self.action_parameter_combobox,
+                                                     self.action_parameter_divider]
 
         line = QFrame()
         line.setFrameShape(QFrame.HLine)
@@ -154,6 +170,9 @@ class MultiSweep(QWidget):
         self.fill_data(self.sweep_instrument_combobox)
         self.fill_data(self.action_instrument_combobox)
 
+        if self.name != "":
+            self.fill_loop_data()
+
     def add_sweep_param(self, data=None):
 
         self.height += 52
@@ -192,7 +211,9 @@ class MultiSweep(QWidget):
         new_param_grid_layout.addWidget(sweep_parameter_combobox, 1, 6, 1, 2)
         sweep_division = QLineEdit("")
         sweep_division.setSizePolicy(QSizePolicy.Maximum, QSizePolicy.Minimum)
+        sweep_param_array.append(sweep_division)
         new_param_grid_layout.addWidget(sweep_division, 0, 8, 2, 1)
+        self.sweep_params_data[sweep_param_name] = sweep_param_array
 
         sweep_instrument_combobox.currentIndexChanged.connect(
             lambda: self.update_parameters(sweep_instrument_combobox, sweep_parameter_combobox))
@@ -219,7 +240,7 @@ class MultiSweep(QWidget):
             param_cb_label,
             sweep_parameter_combobox,
             sweep_division
-        ], height_change=-52))
+        ], height_change=-52, data=self.sweep_params_data, key=sweep_param_name))
         swap_btn.clicked.connect(lambda: self.swap_value(start_line_edit, end_line_edit))
 
         self.v_layout_sweep_parameters.addLayout(new_param_grid_layout)
@@ -246,20 +267,26 @@ class MultiSweep(QWidget):
             lambda: self.update_division(new_param_parameter_combobox, new_param_division))
 
         self.fill_data(new_param_instrument_combobox)
+        action_param_name = "action_param_" + str(len(self.action_params_data))
+        self.action_params_data[action_param_name] = [new_param_instrument_combobox, new_param_parameter_combobox,
+                                                      new_param_division]
 
         new_param_delete_btn.clicked.connect(lambda: self.remove_elements([
             new_param_delete_btn,
             new_param_division,
             new_param_parameter_combobox,
             new_param_instrument_combobox
-        ], height_change=-29))
+        ], height_change=-29, data=self.action_params_data, key=action_param_name))
 
         self.v_layout_action_parameters.addLayout(new_param_grid_layout)
 
-    def remove_elements(self, elements, height_change=0):
+    def remove_elements(self, elements, height_change=0, data=None, key=None):
 
         for element in elements:
             element.deleteLater()
+        # removed parameters stay in the dict as None, so that the names of the other ones do not change
+        if data is not None:
+            data[key] = None
 
         self.height += height_change
         self.resize(self.width, self.height)
@@ -314,11 +341,136 @@ class MultiSweep(QWidget):
             line_edit.setText(str(division))
 
     def create_loop(self):
+        """
+        Create a loop that sweeps all sweep parameters at the same time, each one from its start to its end value in the
+        same number of steps, and measures all action parameters at every point. Setpoints of all parameters are
+        computed and validated before the loop is created (see LockstepSweep). New loops are added to the loops dict
+        and the actions list of the main window, loops that are being edited are changed in place.
 
-        task = Task(self.parent.check_stop_request)
+        :return: NoneType
+        """
+        try:
+            delay = float(self.delay.text() or 0)
+            sweeps = [self.read_parameter_row(data[3], data[4]) + (float(data[0].text()), float(data[1].text()))
+                      for data in self.sweep_params_data.values() if data is not None]
+            actions = [self.read_parameter_row(data[1], data[2])
+                       for data in self.action_params_data.values() if data is not None]
+            if not sweeps or not actions:
+                raise ValueError("At least one sweep and one action parameter are required")
+            num = self.get_num_of_steps(sweeps[0][2], sweeps[0][3])
+        except ValueError as e:
+            warning_string = "Errm, looks like something went wrong ! \nHINT: Measurement parameters not set. \n" \
+                             + str(e)
+            show_error_message("Warning", warning_string)
+            return
+
+        try:
+            sweep_values = compile_lockstep_sweep([parameter for parameter, _, _, _ in sweeps],
+                                                  [start for _, _, start, _ in sweeps],
+                                                  [end for _, _, _, end in sweeps],
+                                                  num)
+        except LoopCompileError as e:
+            show_error_message("Warning", "Loop was not created. \n" + str(e))
+            return
+
+        # dividers are added to the dict of dividers (shared with main window) only once the loop is valid
+        for parameter, full_name in [(parameter, full_name) for parameter, full_name, _, _ in sweeps] + actions:
+            if isinstance(parameter, VoltageDivider):
+                self.dividers[full_name] = parameter
+        loop_actions = [parameter for parameter, _ in actions]
+
+        if self.name != "" and self.name in self.loops:
+            loop = self.loops[self.name]
+            loop.sweep_values = sweep_values
+            loop.delay = delay
+            loop.actions = loop_actions
+            self.parent.update_loops_preview(edit=self.name)
+        else:
+            loop = qc.Loop(sweep_values, delay, progress_interval=20).each(*loop_actions)
+            name = "loop" + str(len(self.parent.shown_loops) + 1)
+            self.loops[name] = loop
+            self.actions.append(loop)
+            self.parent.update_loops_preview()
 
         self.submitted.emit()
 
+    def fill_loop_data(self):
+        """
+        Fill the window with the data of the loop that is being edited
+
+        :return: NoneType
+        """
+        sweep_values = self.loop.sweep_values
+        self.steps.setText(str(len(sweep_values)))
+        self.delay.setText(str(self.loop.delay))
+
+        for _ in sweep_values.parameters[1:]:
+            self.add_sweep_param()
+        rows = [data for data in self.sweep_params_data.values() if data is not None]
+        for index, (parameter, data) in enumerate(zip(sweep_values.parameters, rows)):
+            values = [point[index] for point in sweep_values.setpoints]
+            data[0].setText(str(values[0]))
+            data[1].setText(str(values[-1]))
+            self.select_parameter(parameter, data[2], data[3], data[4])
+
+        actions = [action for action in self.loop.actions if not isinstance(action, Task)]
+        for _ in actions[1:]:
+            self.add_action_param()
+        rows = [data for data in self.action_params_data.values() if data is not None]
+        for action, data in zip(actions, rows):
+            self.select_parameter(action, data[0], data[1], data[2])
+
+    """""""""""""""""""""
+    Helper functions
+    """""""""""""""""""""
+    def read_parameter_row(self, parameter_combobox, division_lineedit):
+        """
+        :param parameter_combobox: combobox with the selected parameter
+        :param division_lineedit: line edit with the division of the parameter
+        :return: tuple (parameter wrapped in a VoltageDivider if division is not 1, full name of the parameter)
+        """
+        parameter = parameter_combobox.currentData()
+        if parameter is None:
+            raise ValueError("Parameter not selected")
+        division = float(division_lineedit.text() or 1)
+        full_name = str(parameter)
+        if division != 1:
+            parameter = VoltageDivider(parameter, division)
+        return parameter, full_name
+
+    def get_num_of_steps(self, start, end):
+        """
+        :param start: start value of the first sweep parameter
+        :param end: end value of the first sweep parameter
+        :return: number of steps, either the one that was typed in or the one calculated from the step size
+        """
+        if self.steps.text() != "":
+            return float(self.steps.text())
+        step_size = float(self.step_size.text())
+        if step_size == 0:
+            raise ValueError("Step size can not be zero")
+        return abs(int((end - start) / step_size)) + 1
+
+    def select_parameter(self, parameter, instrument_combobox, parameter_combobox, division_lineedit):
+        """
+        Select a parameter (and show its division) in a row of the window
+
+        :param parameter: parameter or a VoltageDivider
+        :param instrument_combobox: combobox of the instrument in that row
+        :param parameter_combobox: combobox of the parameter in that row
+        :param division_lineedit: line edit with the division of the parameter
+        :return: NoneType
+        """
+        division = 1
+        if isinstance(parameter, VoltageDivider):
+            division = parameter.division_value
+            parameter = parameter.v1
+        instrument_combobox.setCurrentIndex(instrument_combobox.findText(parameter._instrument.name))
+        full_name = str(parameter)
+        display_name = self.dividers[full_name].name if full_name in self.dividers else parameter.name
+        parameter_combobox.setCurrentIndex(parameter_combobox.findText(display_name))
+        division_lineedit.setText(str(division))
+
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
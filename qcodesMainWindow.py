@@ -1,28 +1,31 @@
+import sys
+# profiler has to be set up before anything else is imported to be able to time the imports
+from StartupProfiler import profiler
+profiler.enable_from_argv(sys.argv)
+
 from PyQt5.QtWidgets import QApplication, QMainWindow, QAction, QMenu, QPushButton, QLabel, QFileDialog, \
     QLineEdit, QShortcut, QTableWidget, QTableWidgetItem, QHeaderView, QTableView, QDesktopWidget, QComboBox, QWidget, \
     QGridLayout, QSizePolicy, QSplitter, QHBoxLayout, QMessageBox
-from PyQt5.QtCore import pyqtSignal, pyqtSlot, QThreadPool
+from PyQt5.QtCore import pyqtSignal, pyqtSlot, QThreadPool, QTimer
 
-import sys
-import inspect
+import importlib
 from random import randint
 
 from PyQt5.QtCore import Qt
-import qcodes as qc
-from qcodes.actions import _QcodesBreak
-from qcodes.actions import Task
 
+# NOTE: qcodes and the windows that depend on it are imported only when they are needed for the first time (see the
+# methods that open those windows and run_qcodes), that way main window is shown without waiting for qcodes to load
 from Helpers import *
 from Random import random
 from ViewTree import ViewTree
+from DriverCatalog import DriverCatalog, get_drivers_path
+from DriverHealth import DriverHealth
+from DriverUsage import DriverUsage, PREFETCH_COUNT
 from TextEditWidget import Notepad
-from AddInstrumentWidget import Widget
-from measurments.MultiSweep import MultiSweep
-from SetupLoopsWidget import LoopsWidget
-from InstrumentData import instrument_data
-from AttachDividersWidget import DividerWidget
-from EditInstrumentWidget import EditInstrumentWidget
 from ThreadWorker import Worker, progress_func, print_output
+from RunQueue import RunQueue, MeasurementJob
+from Cancellation import CancellationToken
+from LatencyMonitor import LatencyMonitor
 
 
 def trap_exc_during_debug(exctype, value, traceback, *args):
@@ -43,16 +46,40 @@ class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
 
+        # catalog of all qcodes instrument drivers (loaded from cache, drivers are not imported), shared with
+        # AddInstrumentWidget windows and used to build "Add instrument" menu
+        self.driver_catalog = DriverCatalog()
+        # results of test imports of drivers (done in background processes), used to disable drivers that can't work
+        self.driver_health = DriverHealth()
+        # drivers used in previous sessions, the most recently used ones are imported in the background after the main
+        # window is shown (see self.prefetch_drivers)
+        self.driver_usage = DriverUsage()
+        self.drivers_prefetched = False
+        # actions of the "Add instrument" brand submenus that have been created so far, key is the module of the driver
+        self.model_actions = {}
+        # brands whose submenus have been populated (also the ones without any models, their menus stay empty)
+        self.populated_brands = set()
+
         # call a function that initializes user interface
-        self.init_ui()
+        with profiler.measure("init_ui"):
+            self.init_ui()
         # call a function that initializes menu bar
-        self.init_menu_bar()
+        with profiler.measure("init_menu_bar"):
+            self.init_menu_bar()
 
         # self.instruments is a dictionary containing all instruments that have been connected so far. Form of the dict
         # is: key:value where key is the name of the instrument assigned by you when creating the instrument, and value
         # contains that particular instance of that instrument.
         self.instruments = {}
 
+        # instruments that are being created at the moment (in worker threads), key is the name of the instrument and
+        # value is its InstrumentConnection. Shared with AddInstrumentWidget windows to prevent duplicate names
+        self.pending_connections = {}
+
+        # AddInstrumentWidget windows that are open or are still connecting to an instrument (kept here so that more of
+        # them can be open at the same time)
+        self.add_instrument_widgets = []
+
         # station instruments are used to keep track of the instruments that were added to the instruments table on the
         # main window, each time an instrument is added to the table it is also added to this dict to keep track of
         # which instruments are already displayed
@@ -63,6 +90,10 @@ class MainWindow(QMainWindow):
         # value is an instance of that loop
         self.loops = {}
 
+        # qcodes Station containing all instruments, created on the first run and kept for the rest of the session
+        # (see self.get_station). Loops snapshot it, snapshots of the instruments are cached between runs.
+        self.station = None
+
         # dividers dict holds data about all dividers created so far. Form of the data inside: key : value where key
         # is name of the parameter that the divider is attached to, and value is instance of that particular divider.
         self.dividers = {}
@@ -81,9 +112,11 @@ class MainWindow(QMainWindow):
         # currently opened will be automatically self updating
         self.active_isntruments = []
 
-        # instrument workers is a list of handles to the workers that do the above explained actions. Reason for keeping
-        # this list is because these workers have to be stopped at some point.
-        self.instrument_workers = []
+        # background work that is not in the run queue gets a child of the stop token (see Cancellation.py), STOP
+        # cancels all of it at once. Workers that live update the instruments get children of the live updates token,
+        # so that they can also be stopped on their own once no more loops are running
+        self.stop_token = CancellationToken(name="STOP")
+        self.live_updates_token = self.stop_token.child(name="live updates")
 
         # contains references to buttons for editing
         self.edit_button_dict = {}
@@ -92,26 +125,51 @@ class MainWindow(QMainWindow):
         # (execute qcodes in another thread [to not freeze GUI thread while executing])
         self.thread_pool = QThreadPool()
 
-        # Handles to all active workers (with the idea of stopping them). Contains only workers that run loops, other
-        # other workers are stored in different lists
-        self.workers = []
-
-        # check this to see if stop has been requested
-        self.stop_loop_requested = True
+        # Separate thread pool for connecting to instruments. Connecting mostly waits for the instruments to respond,
+        # so many of them can be connected at the same time, and they should not wait for loops or live updates to
+        # free up a thread in the shared pool
+        self.connection_pool = QThreadPool()
+        self.connection_pool.setMaxThreadCount(16)
+
+        # Separate thread pool for the driver health check, so it never holds a thread a loop could use. Single thread,
+        # checks of different brands run one after another and do not write the results file at the same time
+        self.health_pool = QThreadPool()
+        self.health_pool.setMaxThreadCount(1)
+
+        # Queue of measurements ran in the thread pool (see RunQueue.py). Loops using different instruments run at the
+        # same time, the others wait for their instruments and start as soon as they are free, without going trough
+        # the GUI thread
+        self.run_queue = RunQueue(self.thread_pool, parent=self)
+        self.run_queue.job_started.connect(self.on_job_started)
+        self.run_queue.job_finished.connect(self.on_job_finished)
+        self.run_queue.busy_changed.connect(self.on_queue_busy_changed)
+
+        # maximum ramp rates of parameters (full name of the parameter : units per second), used to ramp parameters
+        # instead of jumping to new values (see MovePlanner.py), planner is created once it is needed
+        self.ramp_rates = {}
+        self.move_planner = None
+
+        # measured get/set latencies of parameters (full name of the parameter : {"get": seconds, "set": seconds}),
+        # used to estimate durations of loops (see LoopEstimator.py)
+        self.latencies = {}
+        # times every get and set of parameters of added instruments (see LatencyMonitor.py), its means take
+        # precedence over the latencies measured once
+        self.latency_monitor = LatencyMonitor()
 
         # holds string representation of folder in which to save measurement data
         self.save_location = ""
 
-        # keep track of number of line traces currently display. Used when loop in a loop is ran to draw the last n
-        # line traces only
-        self.line_trace_count = 0
-
         # keep track of live plots in case someone closes one of them that they can be reopened
         self.live_plots = []
 
         self.statusBar().showMessage("Ready")
         self.show()
 
+        # once the event loop is running, start loading qcodes and checking which drivers can be imported (both in
+        # the background)
+        QTimer.singleShot(0, self.preload_measurement_stack)
+        QTimer.singleShot(0, self.start_driver_health_check)
+
     """""""""""""""""""""
     User interface
     """""""""""""""""""""
@@ -169,15 +227,16 @@ class MainWindow(QMainWindow):
         icon = QtGui.QIcon("img/text_icon.png")
         self.open_text_edit_btn.setIcon(icon)
 
-        self.loops_table = QTableWidget(0, 4)
+        self.loops_table = QTableWidget(0, 5)
         self.loops_table.setSizePolicy(QSizePolicy(QSizePolicy.MinimumExpanding, QSizePolicy.MinimumExpanding))
         self.splitter.addWidget(self.loops_table)
-        self.loops_table.setHorizontalHeaderLabels(("Name", "Edit", "Run", "Delete"))
+        self.loops_table.setHorizontalHeaderLabels(("Name", "Edit", "Run", "Delete", "Estimate"))
         header = self.loops_table.horizontalHeader()
         header.setSectionResizeMode(0, QHeaderView.Stretch)
         header.setSectionResizeMode(1, QHeaderView.ResizeToContents)
         header.setSectionResizeMode(2, QHeaderView.ResizeToContents)
         header.setSectionResizeMode(3, QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(4, QHeaderView.ResizeToContents)
         self.instruments_table.setSelectionBehavior(QTableView.SelectRows)
 
 
@@ -203,6 +262,13 @@ class MainWindow(QMainWindow):
         self.btn_attach_dividers.setIcon(icon)
         self.btn_attach_dividers.clicked.connect(self.open_attach_divider)
 
+        # Button to open a window showing the queue of measurements
+        self.btn_run_queue = QPushButton("Run queue")
+        self.grid_layout.addWidget(self.btn_run_queue, 3, 6, 1, 2)
+        icon = QtGui.QIcon("img/play_icon.png")
+        self.btn_run_queue.setIcon(icon)
+        self.btn_run_queue.clicked.connect(self.open_run_queue)
+
         # text box used to input the desired name of your output file produced by the loop
         label = QLabel("Output file name")
         self.grid_layout.addWidget(label, 4, 6, 1, 1)
@@ -253,7 +319,6 @@ class MainWindow(QMainWindow):
     def init_menu_bar(self):
         """
         Initializes menu bar, creates actions and submenus within menu bar, connects actions to menu items
-        KNOWN PROBLEMS -> ["M3201A", "M3300A", "M4i", "ZIUHFLI"] list of instruments that produce bugs
 
         :return: NoneType
         """
@@ -270,33 +335,39 @@ class MainWindow(QMainWindow):
         start_new_measurement_action.setStatusTip("Open 'Add New Instrument' window")
         start_new_measurement_action.triggered.connect(lambda checked, name="DummyInstrument": self.add_new_instrument(name))
 
+        # Action for finding a driver by typing (opens 'Add New Instrument' window with the search box focused)
+        search_drivers_action = QAction("Search drivers", self)
+        search_drivers_action.setShortcut("Ctrl+F")
+        search_drivers_action.setStatusTip("Search all instrument drivers by name, brand or keywords")
+        search_drivers_action.triggered.connect(self.search_drivers)
+
         start_new_measurement_menu.addAction(start_new_measurement_action)
+        start_new_measurement_menu.addAction(search_drivers_action)
         start_new_measurement_menu.addSeparator()
 
-        # fetch all instruments defined in qcodes and add then to the Add Instrument menu. Clicking any of these will
-        # open AddInstrumentWidget with data for this instrument already filled in that window
-        path = os.path.dirname(inspect.getfile(qc)) + "\\instrument_drivers"
-        brands = get_subfolders(path, True)
+        # fetch all brands of instruments defined in qcodes and add a submenu for each of them to the Add Instrument
+        # menu. Submenus are empty until they are opened for the first time (see self.populate_brand_menu), that way
+        # nothing but the list of brands is needed to show the main window
+        if self.driver_catalog.is_empty():
+            # very first start (or qcodes was updated), only list the folders, models get cataloged per brand later
+            try:
+                brands = get_subfolders(get_drivers_path(), True)
+            except Exception as e:
+                print("Could not find qcodes instrument drivers:", e)
+                brands = []
+        else:
+            brands = self.driver_catalog.brands()
         for brand in brands:
             current_brand_menu = QMenu(brand, self)
             start_new_measurement_menu.addMenu(current_brand_menu)
-            models = get_files_in_folder(path + "\\" + brand, True)
-            for model in models:
-                if model[0:-3] not in ["M3201A", "M3300A", "M4i", "Keithley_2600_channels", "AWGFileParser",
-                                       "Keysight_33500B_channels", "Infiniium", "KeysightAgilent_33XXX", "Model_336",
-                                       "Base_SPDT", "RC_SP4T", "RC_SPDT", "USB_SPDT", "QDac_channels", "RTO1000", "ZNB",
-                                       "SR860", "SR86x", "AWG5208", "AWG70000A", "AWG70002A", "Keithley_2600_channels"]:
-                    # above is the list of instruments that produce error when attempting to create them
-                    current_model_action = QAction(model[0:-3], self)
-                    current_model_action.setData(model[0:-3])
-                    current_brand_menu.addAction(current_model_action)
-                    current_model_action.triggered.connect(lambda checked, name=current_model_action.data(): self.add_new_instrument(name))
-                else:
-                    current_model_action = QAction(model[0:-3], self)
-                    current_model_action.setEnabled(False)
-                    current_model_action.setIcon(QtGui.QIcon("img/disabled.png"))
-                    current_brand_menu.addAction(current_model_action)
-                    current_model_action.triggered.connect(lambda checked, name=current_model_action.data(): self.add_new_instrument(name))
+            current_brand_menu.aboutToShow.connect(
+                lambda menu=current_brand_menu, brand_name=brand: self.populate_brand_menu(menu, brand_name))
+
+        # Action for connecting all instruments (and their dividers and parameters) listed in a station config file
+        load_station_action = QAction("Load station config", self)
+        load_station_action.setShortcut("Ctrl+L")
+        load_station_action.setStatusTip("Connect all instruments listed in a station config file")
+        load_station_action.triggered.connect(self.load_station_config)
 
         reopen_plot_window = QAction("Reopen plot", self)
         reopen_plot_window.triggered.connect(self.reopen_plot_windows)
@@ -304,16 +375,197 @@ class MainWindow(QMainWindow):
         multi_param_measurement = QAction("Multi sweep", self)
         multi_param_measurement.triggered.connect(self.open_multi_sweep_measurement)
 
+        dry_run_action = QAction("Dry run", self)
+        dry_run_action.setStatusTip("Run the selected loop with simulated parameters to check its timing and storage")
+        dry_run_action.triggered.connect(self.dry_run_loop)
+
         file_menu = self.menuBar().addMenu("&File")
         file_menu.addAction(exit_action)
         file_menu.addMenu(start_new_measurement_menu)
+        file_menu.addAction(load_station_action)
 
         tools_menu = self.menuBar().addMenu("&Tools")
         tools_menu.addAction(reopen_plot_window)
 
+        run_queue_action = QAction("Run queue", self)
+        run_queue_action.setStatusTip("Show and manage the queue of measurements")
+        run_queue_action.triggered.connect(self.open_run_queue)
+
         measurement_menu = self.menuBar().addMenu("&Measurement")
         measurement_menu.addAction(multi_param_measurement)
+        measurement_menu.addAction(run_queue_action)
+        measurement_menu.addAction(dry_run_action)
+
+
+    def populate_brand_menu(self, menu, brand):
+        """
+        Called the first time a brand submenu of the "Add instrument" menu is about to be shown. Revalidates catalog
+        entries of that brand only (in a worker thread, parsing drivers can take a while on the first start), the menu
+        shows a placeholder until that is done (see self.fill_brand_menu).
+
+        :param menu: QMenu of the brand that is about to be shown
+        :param brand: name of the brand (folder in qcodes instrument_drivers)
+        :return: NoneType
+        """
+        # menu gets populated only once, also if the brand turned out to have no models
+        if brand in self.populated_brands:
+            return
+        self.populated_brands.add(brand)
+
+        loading_action = QAction("Loading ...", menu)
+        loading_action.setEnabled(False)
+        menu.addAction(loading_action)
+
+        def refresh():
+            try:
+                self.driver_catalog.refresh(brands=[brand])
+            except Exception as e:
+                print("Could not scan drivers of", brand, e)
+            return self.driver_catalog.models(brand)
+
+        worker = Worker(refresh, False)
+        worker.signals.result.connect(lambda entries: self.fill_brand_menu(menu, loading_action, entries))
+        self.thread_pool.start(worker)
+
+    def fill_brand_menu(self, menu, loading_action, entries):
+        """
+        Replace the placeholder of a brand submenu with an action for each model of the brand. Clicking any of these
+        will open AddInstrumentWidget with data for this instrument already filled in that window.
+
+        :param menu: QMenu of the brand
+        :param loading_action: placeholder action shown while the brand was being scanned
+        :param entries: catalog entries of the models of the brand
+        :return: NoneType
+        """
+        menu.removeAction(loading_action)
+        if not entries:
+            empty_action = QAction("No drivers", menu)
+            empty_action.setEnabled(False)
+            menu.addAction(empty_action)
+        # on the very first start the catalog is filled one brand at a time, check drivers as they get cataloged
+        self.start_driver_health_check(entries)
+
+        for entry in entries:
+            model = entry["model"]
+            current_model_action = QAction(model, menu)
+            current_model_action.setData(model)
+            menu.addAction(current_model_action)
+            current_model_action.triggered.connect(lambda checked, name=model: self.add_new_instrument(name))
+            self.model_actions[entry["module"]] = current_model_action
+            self.update_model_action(current_model_action, self.driver_health.status(entry))
+
+    def update_model_action(self, action, status):
+        """
+        Enable or disable an action of the "Add instrument" menu based on the result of the import check of its driver.
+        Drivers that have not been checked yet are enabled.
+
+        :param action: QAction representing a model in one of the brand submenus
+        :param status: result of the driver import check (dict with "ok" and "error"), None if not checked yet
+        :return: NoneType
+        """
+        if status is not None and not status["ok"]:
+            action.setEnabled(False)
+            action.setIcon(QtGui.QIcon("img/disabled.png"))
+            action.setToolTip(status["error"])
+        else:
+            action.setEnabled(True)
+            action.setIcon(QtGui.QIcon())
+            action.setToolTip("")
+
+    def preload_measurement_stack(self):
+        """
+        Import the parts of qcodes needed for running measurements in a worker thread, while the main window is already
+        usable. Plotting is not preloaded (it's Qt based and gets imported when the first plot is opened).
+
+        :return: NoneType
+        """
+        def preload():
+            with profiler.measure("preload measurement stack", category="import"):
+                for module_name in ["qcodes", "qcodes.loops", "qcodes.actions", "qcodes.data.data_set",
+                                    "qcodes.data.location", "qcodes.instrument_drivers.devices"]:
+                    importlib.import_module(module_name)
+
+        worker = Worker(preload, False)
+        self.thread_pool.start(worker)
+
+    def start_driver_health_check(self, entries=None):
+        """
+        Start test importing all drivers that have not been checked with the currently installed qcodes version. Runs
+        in a worker thread of its own pool, every driver is imported in a separate low priority process.
 
+        :param entries: catalog entries of the drivers to check, all cataloged drivers if not passed
+        :return: NoneType
+        """
+        # entries are taken here, in the GUI thread, the catalog is not touched by the worker
+        if entries is None:
+            entries = self.driver_catalog.models()
+        entries = [entry for entry in entries if self.driver_health.status(entry) is None]
+        if not entries:
+            return
+        worker = Worker(self.driver_health.check_all, False, entries)
+        worker.signals.result.connect(self.apply_driver_health)
+        self.health_pool.start(worker)
+
+    def apply_driver_health(self, checked):
+        """
+        Called when the background driver check finishes, updates the menu entries of the checked drivers
+
+        :param checked: dict with module paths as keys and check results as values
+        :return: NoneType
+        """
+        broken = 0
+        for module_name, status in checked.items():
+            if not status["ok"]:
+                broken += 1
+            if module_name in self.model_actions:
+                self.update_model_action(self.model_actions[module_name], status)
+        if checked:
+            self.statusBar().showMessage("Checked {} drivers, {} of them can not be imported".format(len(checked),
+                                                                                                    broken))
+
+    def prefetch_drivers(self):
+        """
+        Import the most recently used drivers in a worker thread, so that creating those instruments does not have to
+        wait for the import. Only done if the driver catalog was built in one of the previous sessions, drivers that
+        failed the health check are skipped.
+
+        :return: NoneType
+        """
+        if self.driver_catalog.is_empty():
+            return
+        entries = []
+        for module_name in self.driver_usage.most_recent(PREFETCH_COUNT):
+            entry = self.driver_catalog.drivers.get(module_name)
+            if entry is None or entry["class"] is None:
+                continue
+            status = self.driver_health.status(entry)
+            if status is not None and not status["ok"]:
+                continue
+            entries.append(entry)
+        if not entries:
+            return
+
+        def prefetch():
+            with profiler.measure("prefetch {} drivers".format(len(entries)), category="drivers"):
+                for entry in entries:
+                    try:
+                        DriverCatalog.load_class(entry)
+                    except Exception as e:
+                        print("Could not prefetch driver {}: {}".format(entry["module"], e))
+
+        worker = Worker(prefetch, False)
+        self.thread_pool.start(worker)
+
+    def record_driver_usage(self, instrument):
+        """
+        Remember which driver was used to create an instrument (used for prefetching drivers in the next sessions)
+
+        :param instrument: newly created instrument
+        :return: NoneType
+        """
+        module_name = type(instrument).__module__
+        if module_name in self.driver_catalog.drivers:
+            self.driver_usage.record(module_name)
 
     """""""""""""""""""""
     Data manipulation
@@ -343,6 +595,10 @@ class MainWindow(QMainWindow):
                 self.instruments_table.setCellWidget(rows, 2, current_instrument_btn)
                 self.edit_button_dict[instrument] = current_instrument_btn
                 self.station_instruments[instrument] = self.instruments[instrument]
+                self.latency_monitor.instrument(current_instrument)
+                # keep the qcodes station up to date if it has been created already
+                if self.station is not None:
+                    self.station.sync(self.instruments)
 
                 # Also bind a shortcut for opening that instrument coresponding to the number of the row that the
                 # instrument is displayed in (Example: instrument in row 1 will have shortcut F1, row 2 -> F2, ....)
@@ -401,9 +657,12 @@ class MainWindow(QMainWindow):
                 delete_current_loop.resize(35, 20)
                 delete_current_loop.clicked.connect(self.make_delete_loop(name, item))
                 self.loops_table.setCellWidget(rows, 3, delete_current_loop)
+                self.update_loop_estimate(rows, loop)
 
                 self.shown_loops.append(name)
                 self.select_loop_cb.addItem(name, loop)
+                # Run button runs the newest loop by default
+                self.select_loop_cb.setCurrentIndex(self.select_loop_cb.count() - 1)
 
                 # Create a shortcut for opening each loop. Loop in row1 opens with key combo: CTRL + F1, row2: CTRL+F2
                 key_combo_string = "Ctrl+F"+str(rows+1)
@@ -431,95 +690,226 @@ class MainWindow(QMainWindow):
                 delete_current_loop.resize(35, 20)
                 delete_current_loop.clicked.connect(self.make_delete_loop(name, item))
                 self.loops_table.setCellWidget(rows, 3, delete_current_loop)
+                self.update_loop_estimate(rows, loop)
 
-    def run_qcodes(self, with_plot=False):
+    def update_loop_estimate(self, row, loop):
         """
-        Runs qcodes with specified instruments and parameters. Checks for errors in data prior to runing qcodes
-        Adds all instruments to qc.Station and runs the last created loop (i think this is not good, but hey theres a
-        button for each loop to run that specific loop)
+        Show estimated duration and data size of a loop in the loops table
 
-        Loop is ran in a separate thread so that it does not block GUI thread (and the program)
+        :param row: row of the loops table in which the loop is shown
+        :param loop: qcodes ActiveLoop
+        :return: NoneType
+        """
+        from LoopEstimator import estimate_loop, describe_estimate
+
+        try:
+            text = describe_estimate(estimate_loop(loop, self.get_latencies()))
+        except Exception as e:
+            print("Could not estimate the loop:", e)
+            text = "-"
+        item = QTableWidgetItem(text)
+        item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsEnabled)
+        self.loops_table.setItem(row, 4, item)
+
+    def update_loop_estimates(self):
+        """
+        Recompute estimates of all loops in the loops table (after the latencies have been measured)
 
-        :param with_plot: if set to true, runs (and saves) live plot while measurement is running
         :return: NoneType
         """
-        self.stop_loop_requested = False
-        self.loop_started.emit()
-        self.line_trace_count = 0
+        for row_index in range(self.loops_table.rowCount()):
+            loop = self.loops.get(self.loops_table.item(row_index, 0).text().split(" ")[0])
+            if loop is not None:
+                self.update_loop_estimate(row_index, loop)
 
-        # first create a station and add all instruments to it, to have the data available in the output files
-        station = qc.Station()
-        for name, instrument in self.instruments.items():
-            station.add_component(instrument, name)
-
-        # grab the last action added to the actions list. Set its data_set to None in case that loop has already been
-        # ran. Create a new data set with the name and location provided by user input
-        if len(self.actions):
-            loop = self.actions[-1]
-            loop.data_set = None
-
-            # adjust save location of the file
-            if self.save_location != "":
-                loc_provider = qc.data.location.FormatLocation(
-                    fmt=self.save_location + '/{date}/#{counter}_{name}_{time}')
-                qc.data.data_set.DataSet.location_provider = loc_provider
-            data = loop.get_data_set(name=self.output_file_name.text())
-
-            # Check if the function was called with plot in background, if it was, create a new plot, delete backgroud
-            # action of the loop (if a loop has been ran before with a background action [loop cannot have more then
-            # 1 background action]), attach a new background action and run a loop by calling a worker to run it in a
-            # separate thread
-            if with_plot:
-                # if you are running loop in a loop then create one more graph that will display 10 most recent line
-                # traces
-                if isinstance(loop.actions[0], ActiveLoop):
-                    line_traces_plot = qc.QtPlot(fig_x_position=0.05, fig_y_position=0.4, window_title="Line traces")
-                    self.live_plots.append(line_traces_plot)
-                    if len(loop.actions) < 3:
-                        loop.actions.append(Task(lambda: self.update_line_traces(line_traces_plot, data, parameter_name)))
-                    else:
-                        loop.actions[-1] = Task(lambda: self.update_line_traces(line_traces_plot, data, parameter_name))
-                    loop.actions[0].progress_interval = None
-                else:
-                    if loop.progress_interval is None:
-                        loop.progress_interval = 20
-                parameter = get_plot_parameter(loop)
-                plot = qc.QtPlot(fig_x_position=0.05, fig_y_position=0.4, window_title=self.output_file_name.text())
-                self.live_plots.append(plot)
-                parameter_name = str(parameter)
-                plot.add(getattr(data, parameter_name))
-                # loop.with_bg_task(plot.update, plot.save).run(use_threads=True)
-                loop.bg_task = None
-                worker = Worker(loop.with_bg_task(plot.update, plot.save).run, False)
-            else:
-                # loop.run(use_threads=True) -> this has something to do with multiple gets at the same time
-                #                               i guess it would get them all at the same time instead of one by one
-
-                # otherwise if plot was not requested, just run a loop (also in separate thread)
-                worker = Worker(loop.run, False)
-            self.workers.append(worker)
-
-            # connect the signals of a worker
-            worker.signals.result.connect(print_output)
-            worker.signals.finished.connect(self.cleanup)
-            worker.signals.progress.connect(progress_func)
-
-            # start the worker
-            del self.workers[:]
-            # starting live mode of all opened instruments
-            # commented cause it causes collision in the instrument when two different sources send commands to the
-            # instrument. Sometimes this causes crashing of the loop.
-            """for widget in self.active_isntruments:
-                # only if that instrument has this parameter, then start its live mode
-                if self.actions[-1].sweep_values.name in widget.textboxes.keys():
-                    widget.toggle_live()"""
-            self.disable_run_buttons()
-            self.thread_pool.start(worker)
+    def run_qcodes(self, with_plot=False):
+        """
+        Adds the loop selected in the loop combobox (by default the last created one) to the run queue and makes sure
+        the queue is running. Loops are ran in a separate thread so that they do not block GUI thread (and the program)
 
+        :param with_plot: if set to true, runs (and saves) live plot while measurement is running
+        :return: NoneType
+        """
+        name = self.select_loop_cb.currentText()
+        if name in self.loops:
+            self.enqueue_loop(name, with_plot=with_plot)
         # Just in case someone presses run with no loops created
         else:
             show_error_message("Oops !", "Looks like there is no loop to be ran !")
 
+    def enqueue_loop(self, loop_name, with_plot=True, start=True):
+        """
+        Create a measurement job for a loop and add it to the run queue. Output file name and save location are taken
+        from the main window at this moment.
+
+        :param loop_name: name of the loop (key in self.loops)
+        :param with_plot: if True, live plot is shown while the loop is running
+        :param start: if True, queue is resumed in case it was paused
+        :return: MeasurementJob that was queued
+        """
+        # make sure the station knows about all instruments, to have the data available in the output files
+        self.get_station()
+
+        job = MeasurementJob(loop_name, self.loops[loop_name], output_name=self.output_file_name.text(),
+                             save_location=self.save_location, with_plot=with_plot)
+        job.move_planner = self.get_move_planner()
+        if with_plot:
+            # plots are created in the GUI thread after the job has started (see self.on_job_started), until then
+            # these tasks (ran by the loop in the worker thread) have nothing to do
+            def update_plot():
+                if job.plot is not None:
+                    job.plot.update()
+
+            def save_plot():
+                if job.plot is not None:
+                    job.plot.save()
+
+            def update_line_traces():
+                # every job counts its own line traces, more jobs with inner loops can be running at the same time
+                if job.line_traces_plot is not None:
+                    self.update_line_traces(job.line_traces_plot, job.data_set, job.parameter_name,
+                                            job.line_trace_count)
+                job.line_trace_count += 1
+
+            job.bg_task = update_plot
+            job.bg_final_task = save_plot
+            job.outer_step_task = update_line_traces
+
+        self.run_queue.enqueue(job)
+        if start and self.run_queue.paused:
+            self.run_queue.resume()
+        self.statusBar().showMessage("Queued {} ({} waiting)".format(loop_name, len(self.run_queue.queued)))
+        return job
+
+    def on_job_started(self, job):
+        """
+        Called (in the GUI thread) when a job from the run queue starts, opens live plots of the job if requested
+
+        :param job: MeasurementJob that has started
+        :return: NoneType
+        """
+        from qcodes.loops import ActiveLoop
+
+        self.statusBar().showMessage("Running " + job.name)
+        self.disable_run_buttons()
+        parameter = get_plot_parameter(job.loop)
+        job.parameter_name = str(parameter)
+        if not job.with_plot:
+            return
+
+        # plotting is imported only once somebody wants to see a plot
+        from qcodes.plots.pyqtgraph import QtPlot
+
+        # if you are running loop in a loop then create one more graph that will display 10 most recent line traces
+        if isinstance(job.loop.actions[0], ActiveLoop):
+            line_traces_plot = QtPlot(fig_x_position=0.05, fig_y_position=0.4, window_title="Line traces")
+            self.live_plots.append(line_traces_plot)
+            job.line_traces_plot = line_traces_plot
+        plot = QtPlot(fig_x_position=0.05, fig_y_position=0.4, window_title=job.output_name)
+        self.live_plots.append(plot)
+        plot.add(getattr(job.data_set, job.parameter_name))
+        job.plot = plot
+
+    def on_job_finished(self, job):
+        """
+        Called (in the GUI thread) when a job from the run queue is done
+
+        :param job: MeasurementJob that has finished
+        :return: NoneType
+        """
+        message = "{} {}".format(job.name, job.state)
+        if job.error:
+            message += ": " + job.error
+        self.statusBar().showMessage(message)
+        self.disable_run_buttons()
+
+    def on_queue_busy_changed(self, busy):
+        """
+        Called when the run queue starts running jobs or runs out of jobs to run
+
+        :param busy: True if a job is running
+        :return: NoneType
+        """
+        if busy:
+            self.loop_started.emit()
+            self.disable_run_buttons()
+        else:
+            self.cleanup()
+
+    def open_run_queue(self):
+        """
+        Open a window that shows the queue of measurements and allows reordering, removing, pausing and resuming
+
+        :return: NoneType
+        """
+        from RunQueueWidget import RunQueueWidget
+
+        self.run_queue_widget = RunQueueWidget(self.run_queue, self.loops, parent=self)
+        self.run_queue_widget.show()
+
+    def dry_run_loop(self):
+        """
+        Run the loop selected next to the Run button with simulated parameters (see LoopEstimator.dry_run) in a worker
+        thread, and show how long it took compared to the estimate and how much data it wrote
+
+        :return: NoneType
+        """
+        from LoopEstimator import dry_run, describe_dry_run
+
+        name = self.select_loop_cb.currentText()
+        if name not in self.loops:
+            show_error_message("Oops !", "Looks like there is no loop to be ran !")
+            return
+        loop = self.loops[name]
+        latencies = self.get_latencies()
+        worker = Worker(lambda: dry_run(loop, latencies, worker.token), False)
+        worker.token = self.stop_token.child(name="dry run of " + name)
+        worker.signals.result.connect(lambda result: show_error_message("Dry run of " + name,
+                                                                        describe_dry_run(result)))
+        worker.signals.error.connect(lambda error: show_error_message("Warning", "Dry run failed: " + str(error[1])))
+        self.statusBar().showMessage("Dry run of " + name)
+        self.thread_pool.start(worker)
+
+    def get_latencies(self):
+        """
+        Fetch the best known get/set latencies of parameters: the ones measured with "Measure latencies", overridden by
+        the means of all calls timed by the latency monitor
+
+        :return: dict of full name of the parameter : {"get": seconds, "set": seconds}
+        """
+        latencies = {name: dict(kinds) for name, kinds in self.latencies.items()}
+        for name, kinds in self.latency_monitor.latencies().items():
+            latencies.setdefault(name, {}).update(kinds)
+        return latencies
+
+    def get_move_planner(self):
+        """
+        Fetch the planner that ramps parameters respecting their ramp rates, create it if this is the first time
+
+        :return: MovePlanner sharing self.ramp_rates
+        """
+        from MovePlanner import MovePlanner
+
+        if self.move_planner is None:
+            self.move_planner = MovePlanner(self.ramp_rates)
+        return self.move_planner
+
+    def get_station(self):
+        """
+        Fetch the station shared by all runs, create it if this is the first run. Station is synced with the instruments
+        dict (instruments that were added since the last run are added to the station, removed ones are removed)
+
+        :return: PersistentStation
+        """
+        from PersistentStation import PersistentStation
+
+        if self.station is None:
+            self.station = PersistentStation()
+            # loops use the default station for the metadata of their data sets
+            PersistentStation.default = self.station
+        self.station.sync(self.instruments)
+        return self.station
+
     def run_with_plot(self):
         """
         Call self.run_qcodes() with parameter with_plot set to True
@@ -548,6 +938,11 @@ class MainWindow(QMainWindow):
         :return: NoneType
         """
 
+        # Stop waiting for instruments that are still connecting, they get closed as soon as they are created
+        if getattr(self, "station_loader", None) is not None:
+            self.station_loader.cancel()
+        for connection in list(self.pending_connections.values()):
+            connection.cancel()
         # Close all the instruments not to leave any hanging tails
         for name, instrument in self.instruments.items():
             print("Closing", instrument)
@@ -556,6 +951,17 @@ class MainWindow(QMainWindow):
         app = QtGui.QGuiApplication.instance()
         app.closeAllWindows()
 
+    def paintEvent(self, a0: QtGui.QPaintEvent):
+        super().paintEvent(a0)
+        # window is visible, now there is time to import the drivers that will probably be needed
+        if not self.drivers_prefetched:
+            self.drivers_prefetched = True
+            QTimer.singleShot(0, self.prefetch_drivers)
+        # when profiling startup, the first paint of the main window is the end of the startup
+        if profiler.enabled and "first paint" not in profiler.marks:
+            profiler.mark("first paint")
+            profiler.write_report()
+
     def closeEvent(self, a0: QtGui.QCloseEvent):
         are_you_sure = QMessageBox()
         close = are_you_sure.question(self, "Don't do it.",
@@ -575,11 +981,94 @@ class MainWindow(QMainWindow):
         Opens a new Widget (window) with text inputs for parameters of an instrument, creates new instrument(s)
         :return: NoneType
         """
+        from AddInstrumentWidget import Widget
+
+        # forget windows that were closed and are not connecting to anything anymore
+        self.add_instrument_widgets = [widget for widget in self.add_instrument_widgets
+                                       if widget.isVisible() or widget.is_connecting()]
+
         # AddInstrumentWidget need access to self.instruments dictionary in order to be able to add any newly created
-        # instruments to it
-        self.add_instrument = Widget(self.instruments, parent=self, default=name)
+        # instruments to it. Instruments are created in a worker thread, so more of these windows can be connecting
+        # to their instruments at the same time
+        self.add_instrument = Widget(self.instruments, parent=self, default=name, catalog=self.driver_catalog,
+                                     connections=self.pending_connections, thread_pool=self.connection_pool)
         self.add_instrument.submitted.connect(self.update_station_preview)
+        self.add_instrument.submitted.connect(self.record_driver_usage)
         self.add_instrument.show()
+        self.add_instrument_widgets.append(self.add_instrument)
+
+    @pyqtSlot()
+    def search_drivers(self):
+        """
+        Opens a new AddInstrumentWidget with the focus in its search box
+
+        :return: NoneType
+        """
+        self.add_new_instrument("DummyInstrument")
+        self.add_instrument.search_box.setFocus()
+
+    @pyqtSlot()
+    def load_station_config(self):
+        """
+        Opens a file dialog for selecting a station config file (see StationConfig.py) and connects to all instruments
+        listed in it in the background. Summary is shown once all of them are done.
+
+        :return: NoneType
+        """
+        from StationConfig import StationLoader, StationConfigError, load_station_config, resolve_drivers
+
+        path, _ = QFileDialog.getOpenFileName(self, "Load station config", "", "Station config (*.json)")
+        if not path:
+            return
+        try:
+            config = load_station_config(path)
+        except StationConfigError as e:
+            show_error_message("Warning", str(e))
+            return
+        for ramp_rate in config["ramp_rates"]:
+            self.ramp_rates["{}_{}".format(ramp_rate["instrument"], ramp_rate["parameter"])] = ramp_rate["rate"]
+
+        # drivers are looked up here, workers connecting the instruments do not touch the catalog
+        drivers, unknown = resolve_drivers(config, self.driver_catalog)
+        if unknown:
+            show_error_message("Warning", "Drivers of these instruments are unknown, they will not be connected:\n" +
+                               "\n".join("{}: {}".format(name, message) for name, ok, message in unknown))
+
+        self.station_loader = StationLoader(config, self.instruments, self.dividers, drivers, unknown,
+                                            connections=self.pending_connections, thread_pool=self.connection_pool,
+                                            parent=self)
+        self.station_loader.progress.connect(self.on_station_progress)
+        self.station_loader.finished.connect(self.on_station_loaded)
+        self.statusBar().showMessage("Connecting to {} instruments ...".format(len(config["instruments"])))
+        self.station_loader.start()
+
+    def on_station_progress(self, name, ok, message):
+        """
+        Called every time an instrument from the station config is connected (or fails to connect)
+
+        :param name: name of the instrument
+        :param ok: True if the instrument was connected
+        :param message: what happened
+        :return: NoneType
+        """
+        self.update_station_preview()
+        if ok and name in self.instruments:
+            self.record_driver_usage(self.instruments[name])
+        self.statusBar().showMessage("{}: {}".format(name, "connected" if ok else "failed"))
+
+    def on_station_loaded(self, report):
+        """
+        Show summary of loading the station config, everything that failed is listed with its error
+
+        :param report: list of (name, ok, message) tuples
+        :return: NoneType
+        """
+        self.update_station_preview()
+        failed = [(name, message) for name, ok, message in report if not ok]
+        self.statusBar().showMessage("Station loaded: {} ok, {} failed".format(len(report) - len(failed), len(failed)))
+        if failed:
+            show_error_message("Station config", "Some items could not be loaded:\n\n" +
+                               "\n\n".join("{}: {}".format(name, message) for name, message in failed))
 
     @pyqtSlot()
     def open_tree(self):
@@ -600,6 +1089,13 @@ class MainWindow(QMainWindow):
 
         :return:
         """
+        from SetupLoopsWidget import LoopsWidget
+        from LockstepSweep import is_lockstep
+
+        # loops sweeping several parameters at once are edited in the window they were created in
+        if loop_name in self.loops and is_lockstep(self.loops[loop_name]):
+            self.open_multi_sweep_measurement(loop_name)
+            return
         self.setup_loops_widget = LoopsWidget(self.instruments, self.dividers, self.loops, self.actions, parent=self,
                                               loop_name=loop_name)
         self.setup_loops_widget.show()
@@ -623,29 +1119,43 @@ class MainWindow(QMainWindow):
 
         :return: NoneType
         """
+        from AttachDividersWidget import DividerWidget
+
         self.attach_divider_widget = DividerWidget(self.instruments, self.dividers, parent=self)
         self.attach_divider_widget.show()
 
     @pyqtSlot()
     def open_multi_sweep_measurement(self, name=""):
+        from measurments.MultiSweep import MultiSweep
+
         self.msm = MultiSweep(self.instruments, self.dividers, self.loops, self.actions, parent=self, loop_name=name)
         self.msm.show()
 
     def stop_all_workers(self):
         """
-        Reworked: Stops all instruments that are currently being live updated and returns them to static mode
+        Called by the STOP button. Stops the loops that are running, pauses the run queue (queued loops stay queued
+        and can be resumed from the run queue window) and stops live updating of the instruments
 
         :return:
         """
-        print(self.workers)
         print("Emmiting the signal to all workers")
-        for worker in self.instrument_workers:
-            worker.stop_requested = True
+        self.run_queue.stop()
+        self.stop_token.cancel("STOP")
+        # work started after the STOP gets fresh tokens
+        self.stop_token = CancellationToken(name="STOP")
+        self.stop_live_updates()
+
+    def stop_live_updates(self):
+        """
+        Stops all instruments that are currently being live updated and returns them to static mode
+
+        :return: NoneType
+        """
+        self.live_updates_token.cancel("live updates stopped")
+        self.live_updates_token = self.stop_token.child(name="live updates")
         for widget in self.active_isntruments:
             if widget.live:
                 widget.toggle_live()
-        self.stop_loop_requested = True
-        self.enable_run_buttons()
 
     # This is a function factory (wow, i'm so cool, i made a function factory)
     def make_open_instrument_edit(self, instrument):
@@ -663,6 +1173,8 @@ class MainWindow(QMainWindow):
 
             :return: NoneType
             """
+            from EditInstrumentWidget import EditInstrumentWidget
+
             if hasattr(self.instruments[instrument], "timeout"):
                 self.instruments[instrument].set("timeout", 50)
             # Parameters:
@@ -683,19 +1195,12 @@ class MainWindow(QMainWindow):
 
     def run_specific_loop(self, loop_name):
         """
-        Place the action that coresponds to this loop to the last place in the actions queue so that its the one that
-        gets ran by the run button, and then run it ... d'oh
+        Add this loop to the run queue, it gets ran as soon as the loops queued before it are done ... d'oh
 
         :param loop_name: name of the loop that is supposed to be ran
         :return: NoneType
         """
-
-        # since name of the loop is a parameter of this function, get the loop from loops, find it in the actions list
-        # put it in the last place of that list (remember, the last one is the one that get run), and then run it
-        loop = self.loops[loop_name]
-        loop_index = self.actions.index(loop)
-        self.actions[loop_index], self.actions[-1] = self.actions[-1], self.actions[loop_index]
-        self.run_with_plot()
+        self.enqueue_loop(loop_name, with_plot=True)
 
     def make_delete_loop(self, loop_name, item):
         """
@@ -712,40 +1217,29 @@ class MainWindow(QMainWindow):
             """
             self.loops_table.removeRow(self.loops_table.row(item))
             if loop_name in self.loops:
+                self.run_queue.remove_loop(self.loops[loop_name])
                 if self.loops[loop_name] in self.actions:
                     self.actions.remove(self.loops[loop_name])
                 del self.loops[loop_name]
 
         return delete_loop
 
-    def check_stop_request(self):
-        """
-        This function is passed to a qcodes Task() to be checked on every measure point of the loop. Function checks if
-        the class member stop_loop_requested is set to true, and if it is it raises an exception that stops the qcodes
-        loop.
-
-        :return:
-        """
-        if self.stop_loop_requested is True:
-            self.enable_run_buttons()
-            raise _QcodesBreak
-
     def disable_run_buttons(self):
         """
-        This function is used to disable running other loops when one of the loops has started. Multiple loops running
-        at the same time might try to send commands to the same instrument and cause an error.
+        This function is used to disable changing loops that are running. Run buttons stay enabled, loops that are ran
+        meanwhile are added to the run queue, and start as soon as the instruments they use are not used by any other
+        running loop.
 
         :return: NoneType
         """
-        self.btn_run.setDisabled(True)
-
         for row_index in range(self.loops_table.rowCount()):
-            run_button = self.loops_table.cellWidget(row_index, 2)
-            run_button.setDisabled(True)
+            # first word of the text in the row is the name of the loop
+            loop = self.loops.get(self.loops_table.item(row_index, 0).text().split(" ")[0])
+            running = loop is not None and self.run_queue.is_running(loop)
             delete_button = self.loops_table.cellWidget(row_index, 3)
-            delete_button.setDisabled(True)
+            delete_button.setDisabled(running)
             edit_button = self.loops_table.cellWidget(row_index, 1)
-            edit_button.setDisabled(True)
+            edit_button.setDisabled(running)
 
     def enable_run_buttons(self):
         """
@@ -764,13 +1258,13 @@ class MainWindow(QMainWindow):
 
     def cleanup(self):
         """
-        This function is called when a thread is finished to stop the workers and re enable run buttons.
+        This function is called when the run queue has no more loops to run, to stop the workers and re enable run
+        buttons.
         :return:
         """
-        self.stop_all_workers()
+        self.stop_live_updates()
         self.enable_run_buttons()
         self.loop_finished.emit()
-        self.line_trace_count = 0
         self.live_plots = []
 
     def run_with_livedata(self):
@@ -785,13 +1279,13 @@ class MainWindow(QMainWindow):
 
         :return: NoneType
         """
+        from qcodes.actions import Task
+
         loop_name = self.select_loop_cb.currentText()
         loop = self.loops[loop_name]
         tsk = Task(self.update_opened_instruments)
         loop.actions.append(tsk)
-        loop_index = self.actions.index(loop)
-        self.actions[loop_index], self.actions[-1] = self.actions[-1], self.actions[loop_index]
-        self.run_with_plot()
+        self.enqueue_loop(loop_name, with_plot=True)
 
     def update_opened_instruments(self):
         """
@@ -803,26 +1297,29 @@ class MainWindow(QMainWindow):
 
         :return: NoneType
         """
+        job = self.run_queue.current_job()
+        if job is None:
+            return
         for widget in self.active_isntruments:
             # only if that instrument has this parameter, then start its live mode
-            name = self.actions[-1].sweep_values.name
+            name = job.loop.sweep_values.name
             if name in widget.textboxes.keys():
                 widget.update_parameters_data(name=name)
 
-    def update_line_traces(self, plot, dataset, parameter_name):
+    def update_line_traces(self, plot, dataset, parameter_name, index):
         """
         Add 10 line traces to a graph, and then clear the graph and add 10 new line traces.
 
         :param plot: Instance of a graph that we want to add a line trace eto
         :param dataset: Dataset from which we extract the data
         :param parameter_name: Name of the parameter that is being plotted
+        :param index: index of the line trace (step of the outer loop) that is being added
         :return: NoneType
         """
-        if self.line_trace_count % 10 == 0:
+        if index % 10 == 0:
             plot.clear()
-        plot.add(getattr(dataset, parameter_name)[self.line_trace_count])
-        print(self.line_trace_count)
-        self.line_trace_count += 1
+        plot.add(getattr(dataset, parameter_name)[index])
+        print(index)
 
     def resize_for_loop(self, decrease=False):
         """
@@ -851,8 +1348,12 @@ class MainWindow(QMainWindow):
 
 
 def main():
-    app = QApplication(sys.argv)
-    ex = MainWindow()
+    with profiler.measure("QApplication"):
+        app = QApplication(sys.argv)
+    with profiler.measure("MainWindow"):
+        ex = MainWindow()
+    # write the report once more when closing, to include things that finished after the first paint (driver checks)
+    app.aboutToQuit.connect(profiler.write_report)
     sys.exit(app.exec_())
 
 